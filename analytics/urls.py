@@ -6,5 +6,7 @@ app_name = 'analytics'
 urlpatterns = [
     path('', views.analytics_dashboard, name='dashboard'),
     path('accuracy/', views.accuracy_tracking, name='accuracy_tracking'),
+    path('api-usage/', views.api_usage, name='api_usage'),
+    path('roi/', views.roi_backtest, name='roi_backtest'),
 ]
 
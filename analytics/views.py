@@ -1,10 +1,16 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Q, F
-from predictions.models import Prediction
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, F, Sum, Avg, Max
+from django.db.models.functions import TruncWeek
+from django.utils import timezone
+from predictions.models import Prediction, APICallLog
+from predictions import backtest
 from matches.models import Match
 from analytics.models import AnalyticsSnapshot
 import json
+import time
 from datetime import datetime, timedelta
 
 
@@ -120,3 +126,170 @@ def accuracy_tracking(request):
     
     return render(request, 'analytics/accuracy_tracking.html', context)
 
+
+
+def _percentile(queryset, field, percent):
+    """Nearest-rank percentile of field over queryset, computed in the database"""
+    count = queryset.count()
+    if count == 0:
+        return None
+    index = min(int(round(percent / 100 * (count - 1))), count - 1)
+    return queryset.order_by(field).values_list(field, flat=True)[index]
+
+
+def _token_cost(hit_tokens, miss_tokens, completion_tokens):
+    """Cost in USD using DEEPSEEK_PRICING (per million tokens)"""
+    pricing = getattr(settings, 'DEEPSEEK_PRICING', {})
+    return (
+        (hit_tokens or 0) * pricing.get('cache_hit', 0)
+        + (miss_tokens or 0) * pricing.get('cache_miss', 0)
+        + (completion_tokens or 0) * pricing.get('output', 0)
+    ) / 1_000_000
+
+
+def _cache_hit_ratio(hit_tokens, miss_tokens):
+    total = (hit_tokens or 0) + (miss_tokens or 0)
+    return round((hit_tokens or 0) / total * 100, 2) if total else 0.0
+
+
+@login_required
+def api_usage(request):
+    """DeepSeek latency percentiles, weekly cost and prompt-cache hit ratio from the call ledger"""
+    try:
+        days = max(int(request.GET.get('days', 28)), 1)
+    except ValueError:
+        days = 28
+    
+    calls = APICallLog.objects.filter(created_at__gte=timezone.now() - timedelta(days=days))
+    # Latency percentiles only make sense for calls that actually went to the network
+    network_calls = calls.filter(status=APICallLog.STATUS_SUCCESS)
+    token_sums = {
+        'hit': Sum('cache_hit_tokens'),
+        'miss': Sum('cache_miss_tokens'),
+        'prompt': Sum('prompt_tokens'),
+        'completion': Sum('completion_tokens'),
+    }
+    
+    totals = calls.aggregate(**token_sums)
+    status_counts = dict(calls.values_list('status').annotate(total=Count('id')))
+    summary = {
+        'calls': calls.count(),
+        'success': status_counts.get(APICallLog.STATUS_SUCCESS, 0),
+        'cached': status_counts.get(APICallLog.STATUS_CACHED, 0),
+        'errors': status_counts.get(APICallLog.STATUS_ERROR, 0),
+        'unavailable': status_counts.get(APICallLog.STATUS_UNAVAILABLE, 0),
+        'p50_ms': _percentile(network_calls, 'latency_ms', 50),
+        'p95_ms': _percentile(network_calls, 'latency_ms', 95),
+        'prompt_tokens': totals['prompt'] or 0,
+        'completion_tokens': totals['completion'] or 0,
+        'cache_hit_ratio': _cache_hit_ratio(totals['hit'], totals['miss']),
+        'cost': round(_token_cost(totals['hit'], totals['miss'], totals['completion']), 4),
+    }
+    
+    # Per-strategy breakdown
+    by_strategy = []
+    for row in calls.values('strategy').annotate(total=Count('id'), **token_sums).order_by('strategy'):
+        strategy_calls = network_calls.filter(strategy=row['strategy'])
+        by_strategy.append({
+            'strategy': row['strategy'] or '-',
+            'calls': row['total'],
+            'p50_ms': _percentile(strategy_calls, 'latency_ms', 50),
+            'p95_ms': _percentile(strategy_calls, 'latency_ms', 95),
+            'prompt_tokens': row['prompt'] or 0,
+            'completion_tokens': row['completion'] or 0,
+            'cache_hit_ratio': _cache_hit_ratio(row['hit'], row['miss']),
+            'cost': round(_token_cost(row['hit'], row['miss'], row['completion']), 4),
+        })
+    
+    # Prompt-cache hit ratio per prompt layout, to compare template versions
+    by_prompt_version = []
+    for row in calls.values('prompt_version').annotate(total=Count('id'), **token_sums).order_by('prompt_version'):
+        by_prompt_version.append({
+            'version': row['prompt_version'],
+            'calls': row['total'],
+            'prompt_tokens': row['prompt'] or 0,
+            'cache_hit_ratio': _cache_hit_ratio(row['hit'], row['miss']),
+            'cost': round(_token_cost(row['hit'], row['miss'], row['completion']), 4),
+        })
+    
+    # Weekly cost and cache-hit ratio
+    weekly = []
+    rows = calls.annotate(week=TruncWeek('created_at')).values('week').annotate(
+        total=Count('id'), avg_latency=Avg('latency_ms'), **token_sums
+    ).order_by('-week')
+    for row in rows:
+        weekly.append({
+            'week': row['week'],
+            'calls': row['total'],
+            'avg_latency_ms': round(row['avg_latency'] or 0, 1),
+            'prompt_tokens': row['prompt'] or 0,
+            'completion_tokens': row['completion'] or 0,
+            'cache_hit_ratio': _cache_hit_ratio(row['hit'], row['miss']),
+            'cost': round(_token_cost(row['hit'], row['miss'], row['completion']), 4),
+        })
+    
+    context = {
+        'days': days,
+        'summary': summary,
+        'by_strategy': by_strategy,
+        'by_prompt_version': by_prompt_version,
+        'weekly': weekly,
+        'title': 'DeepSeek API Usage'
+    }
+    
+    return render(request, 'analytics/api_usage.html', context)
+
+
+@login_required
+def roi_backtest(request):
+    """Flat- and proportional-stake ROI, drawdown and hit rate of each strategy at the stored odds"""
+    league = request.GET.get('league', '').strip()
+    try:
+        week = int(request.GET.get('week') or 0) or None
+    except ValueError:
+        week = None
+    try:
+        stake_fraction = float(request.GET.get('stake', backtest.DEFAULT_STAKE_FRACTION))
+    except ValueError:
+        stake_fraction = backtest.DEFAULT_STAKE_FRACTION
+    if not 0 < stake_fraction < 1:
+        stake_fraction = backtest.DEFAULT_STAKE_FRACTION
+
+    predictions = Prediction.objects.all()
+    if league:
+        predictions = predictions.filter(match__game_title__iexact=league)
+    if week:
+        predictions = predictions.filter(match__week_number=week)
+
+    # Any new, edited or settled prediction/match changes the key, so cached reports never go stale
+    version = predictions.aggregate(
+        total=Count('id'), predictions=Max('updated_at'), matches=Max('match__updated_at')
+    )
+    key = 'roi_backtest:' + ':'.join(
+        str(part) for part in (
+            league.lower(), week, stake_fraction, version['total'], version['predictions'], version['matches'],
+        )
+    ).replace(' ', '_')
+    result = cache.get(key)
+    if result is None:
+        started = time.perf_counter()
+        data = backtest.load_bets(predictions)
+        result = {
+            'matches': len(data['actual']),
+            'report': backtest.roi_report(data, stake_fraction=stake_fraction),
+            'elapsed': round(time.perf_counter() - started, 2),
+            'computed_at': timezone.now(),
+        }
+        cache.set(key, result, getattr(settings, 'ROI_BACKTEST_CACHE_TTL', 600))
+
+    context = {
+        'league': league,
+        'week': week,
+        'stake_fraction': stake_fraction,
+        'leagues': Match.objects.exclude(game_title__isnull=True).exclude(game_title='')
+        .order_by('game_title').values_list('game_title', flat=True).distinct(),
+        'result': result,
+        'title': 'ROI Backtest'
+    }
+
+    return render(request, 'analytics/roi_backtest.html', context)
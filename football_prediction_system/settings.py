@@ -105,7 +105,76 @@ AUTH_USER_MODEL = 'users.User'
 
 # DeepSeek API Configuration
 DEEPSEEK_API_KEY = os.environ.get('DEEPSEEK_API_KEY', 'sk-0cf47f1628f54cf1971cd625a46af734')
-DEEPSEEK_API_URL = 'https://api.deepseek.com/v1/chat/completions'
+# Override with the local stand-in (manage.py run_deepseek_stub) for offline benchmarking
+DEEPSEEK_API_URL = os.environ.get('DEEPSEEK_API_URL', 'https://api.deepseek.com/v1/chat/completions')
+DEEPSEEK_TIMEOUT = 30  # seconds per call
+# Extra OpenAI-compatible endpoints (e.g. a secondary region or a local model server):
+# [{'name': 'local', 'url': 'http://127.0.0.1:8001/v1/chat/completions', 'model': '...', 'api_key': '...'}]
+# Calls are routed to the endpoint with the lowest recent latency. Empty uses DEEPSEEK_API_URL alone.
+DEEPSEEK_ENDPOINTS = []
+# Send a duplicate request to the next endpoint once a call outlasts this latency percentile (None disables).
+# Only applies with at least two DEEPSEEK_ENDPOINTS URLs; a single endpoint is never hedged.
+DEEPSEEK_HEDGE_PERCENTILE = 95
+DEEPSEEK_HEDGE_MIN_SAMPLES = 20  # latency samples needed before hedging starts
+# Keep-alive connection pool shared by every DeepSeekClient in the process
+DEEPSEEK_POOL_CONNECTIONS = 4  # number of distinct hosts to keep pools for
+DEEPSEEK_POOL_MAXSIZE = 10  # connections kept open per host
+# Retries for 429/5xx responses, with jittered exponential backoff
+DEEPSEEK_MAX_RETRIES = 3
+DEEPSEEK_BACKOFF_FACTOR = 0.5
+DEEPSEEK_BACKOFF_JITTER = 0.5
+# Ask for baseline/profitable/balanced in one request instead of three
+DEEPSEEK_COMBINED_PREDICTIONS = True
+# Maximum concurrent DeepSeek calls for bulk generation (keep <= DEEPSEEK_POOL_MAXSIZE)
+DEEPSEEK_BULK_CONCURRENCY = 8
+# Pack several matches into one request for weekly/batch generation
+DEEPSEEK_PACKED_PREDICTIONS = True
+DEEPSEEK_PACK_SIZE = 10  # matches per packed request
+# Skip the AI call for strategies whose rule answer is further than this from every decision
+# boundary (probability units, e.g. 0.05); the rule answer is stored with source 'rules'. None disables.
+DEEPSEEK_AI_SKIP_MARGIN = None
+# Answer from the local surrogate (manage.py train_surrogate) instead of the API when it is at least
+# this confident (e.g. 0.95). None disables. A share of those answers still goes to the API so the
+# agreement rate keeps being measured.
+DEEPSEEK_SURROGATE_CONFIDENCE = None
+DEEPSEEK_SURROGATE_SHADOW_RATE = 0.05
+DEEPSEEK_SURROGATE_RELOAD = 300  # seconds between checks for a retrained surrogate
+# Database-backed response cache shared by all worker processes
+DEEPSEEK_CACHE_ENABLED = True
+DEEPSEEK_CACHE_TTL = 60 * 60 * 24  # seconds
+DEEPSEEK_CACHE_MAX_ENTRIES = 10000  # least recently used entries are evicted beyond this
+DEEPSEEK_CACHE_EVICT_EVERY = 100  # inserts per process between eviction passes
+DEEPSEEK_CACHE_COUNTER_BATCH = 50  # hit/miss counts buffered per process before they are saved
+DEEPSEEK_CACHE_COUNTER_INTERVAL = 10  # seconds after which buffered counts are saved anyway
+# Client-side rate limits in requests per second (None disables)
+DEEPSEEK_PROCESS_RATE_LIMIT = 5.0  # per worker process
+DEEPSEEK_DATABASE_RATE_LIMIT = 20.0  # across all processes sharing the database
+DEEPSEEK_RATE_LIMIT_WAIT = 10  # give up on a call after waiting this many seconds for a token
+# Circuit breaker: fail fast to rule-based predictions after repeated API failures
+DEEPSEEK_BREAKER_FAILURE_THRESHOLD = 5  # consecutive failures before the breaker opens
+DEEPSEEK_BREAKER_COOLDOWN = 60  # seconds before a trial request is allowed again
+# Time the weekly predictions page may spend waiting on AI before serving rule-based picks
+DEEPSEEK_WEEKLY_AI_BUDGET = 10  # seconds
+# USD per million tokens, used for cost reporting on the API usage page
+DEEPSEEK_PRICING = {
+    'cache_hit': 0.07,
+    'cache_miss': 0.27,
+    'output': 1.10,
+}
+
+# Queue AI prediction work for manage.py run_prediction_worker instead of calling DeepSeek inside
+# web requests; pages show rule-based picks until the workers have filled in the AI ones
+PREDICTION_ASYNC_JOBS = False
+PREDICTION_WORKER_THREADS = 4  # concurrent jobs per worker process
+PREDICTION_JOB_MAX_ATTEMPTS = 5  # a job is marked failed after this many attempts
+PREDICTION_JOB_BACKOFF = 10  # seconds before the first retry, doubling with each attempt
+PREDICTION_JOB_TIMEOUT = 300  # seconds after which a running job whose worker died is claimed again
+# Only one request or worker generates a match's predictions at a time; the others wait for its result
+PREDICTION_LEASE_TTL = 120  # seconds before a lease whose holder died can be taken over
+PREDICTION_LEASE_WAIT = 5  # seconds a request waits for another holder before serving rule-based picks
+
+# Seconds the analytics ROI backtest page caches a result for the same filters and data
+ROI_BACKTEST_CACHE_TTL = 60 * 10
 
 # Auto-generate predictions when matches are created (set to False to disable)
 AUTO_GENERATE_PREDICTIONS = False
@@ -16,6 +16,16 @@ class Team(models.Model):
         return self.name
 
 
+class MatchQuerySet(models.QuerySet):
+    def with_rule_predictions(self, engine=None):
+        """
+        Annotate baseline, profitable and balanced rule predictions, computed by
+        the database with the same thresholds as PredictionEngine
+        """
+        from predictions.expressions import rule_prediction_expressions
+        return self.annotate(**rule_prediction_expressions(engine))
+
+
 class Match(models.Model):
     """Match model for storing fixtures with probabilities and odds"""
     team_a = models.ForeignKey(
@@ -83,10 +93,24 @@ class Match(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = MatchQuerySet.as_manager()
+
+    # Fields predictions and their accuracy depend on; edits to anything else
+    # (country, game_title, ...) skip the prediction signals and FK validation
+    TRACKED_FIELDS = (
+        'team_a_id', 'team_b_id', 'date', 'prob_a', 'prob_b', 'odds_a', 'odds_b', 'draw_prob', 'actual_result'
+    )
+
     class Meta:
         ordering = ['-date']
         verbose_name_plural = "Matches"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot()
+        return instance
+
     def __str__(self):
         return f"{self.team_a} vs {self.team_b} - {self.date.strftime('%Y-%m-%d %H:%M')}"
 
@@ -105,8 +129,30 @@ class Match(models.Model):
         # Calculate week_number from date if not set
         if self.date and not self.week_number:
             self.week_number = self.calculate_week_number()
-        self.full_clean()
+        # Read by the post_save handlers to skip work for edits that don't affect predictions
+        self.saved_changes = self.changed_fields()
+        # Validating an unchanged team costs a query each and can't fail differently than last time
+        self.full_clean(exclude=[name for name in ('team_a', 'team_b') if f'{name}_id' not in self.saved_changes])
         super().save(*args, **kwargs)
+        self._snapshot()
+    
+    def _snapshot(self):
+        """Remember the tracked fields' values as stored in the database"""
+        # Deferred fields are not in __dict__ and are left out rather than loaded
+        self._stored_values = {name: self.__dict__[name] for name in self.TRACKED_FIELDS if name in self.__dict__}
+    
+    def changed_fields(self):
+        """
+        Tracked fields whose value differs from the one loaded from (or last
+        saved to) the database; all of them for a match not saved yet
+        """
+        stored = getattr(self, '_stored_values', None)
+        if self._state.adding or stored is None:
+            return set(self.TRACKED_FIELDS)
+        return {
+            name for name in self.TRACKED_FIELDS
+            if name in self.__dict__ and (name not in stored or self.__dict__[name] != stored[name])
+        }
     
     def calculate_week_number(self):
         """Calculate ISO week number from date"""
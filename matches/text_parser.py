@@ -5,6 +5,7 @@ import re
 from datetime import datetime
 from dateutil import parser as date_parser
 from .models import Team, Match
+from predictions.signals import deferred_prediction_signals
 
 
 def american_to_decimal(american_odds):
@@ -584,52 +585,54 @@ def import_matches_from_text(text, skip_duplicates=True):
     errors = []
     warnings = []
     
-    for match_data in matches_data:
-        try:
-            # Validate teams are different
-            if match_data['team_a'].strip().lower() == match_data['team_b'].strip().lower():
-                errors.append(f"Invalid match: {match_data['team_a']} vs {match_data['team_b']} - teams cannot be the same")
-                continue
-            
-            # Get or create teams
-            team_a, _ = Team.objects.get_or_create(name=match_data['team_a'])
-            team_b, _ = Team.objects.get_or_create(name=match_data['team_b'])
-            
-            # Double-check they're different (in case of case-insensitive matching)
-            if team_a.id == team_b.id:
-                errors.append(f"Invalid match: {match_data['team_a']} vs {match_data['team_b']} - teams cannot be the same")
-                continue
-            
-            # Check for duplicates
-            if skip_duplicates:
-                existing = Match.objects.filter(
+    # Predictions for the imported matches are generated in one bulk pass at the end
+    with deferred_prediction_signals():
+        for match_data in matches_data:
+            try:
+                # Validate teams are different
+                if match_data['team_a'].strip().lower() == match_data['team_b'].strip().lower():
+                    errors.append(f"Invalid match: {match_data['team_a']} vs {match_data['team_b']} - teams cannot be the same")
+                    continue
+
+                # Get or create teams
+                team_a, _ = Team.objects.get_or_create(name=match_data['team_a'])
+                team_b, _ = Team.objects.get_or_create(name=match_data['team_b'])
+
+                # Double-check they're different (in case of case-insensitive matching)
+                if team_a.id == team_b.id:
+                    errors.append(f"Invalid match: {match_data['team_a']} vs {match_data['team_b']} - teams cannot be the same")
+                    continue
+
+                # Check for duplicates
+                if skip_duplicates:
+                    existing = Match.objects.filter(
+                        team_a=team_a,
+                        team_b=team_b,
+                        date__date=match_data['date'].date()
+                    ).exists()
+
+                    if existing:
+                        warnings.append(f"Duplicate skipped: {match_data['team_a']} vs {match_data['team_b']} on {match_data['date'].date()}")
+                        continue
+
+                # Create match
+                Match.objects.create(
                     team_a=team_a,
                     team_b=team_b,
-                    date__date=match_data['date'].date()
-                ).exists()
-                
-                if existing:
-                    warnings.append(f"Duplicate skipped: {match_data['team_a']} vs {match_data['team_b']} on {match_data['date'].date()}")
-                    continue
-            
-            # Create match
-            Match.objects.create(
-                team_a=team_a,
-                team_b=team_b,
-                date=match_data['date'],
-                prob_a=match_data['prob_a'],
-                prob_b=match_data['prob_b'],
-                odds_a=match_data['odds_a'],
-                odds_b=match_data['odds_b'],
-                draw_prob=match_data['draw_prob'],
-                week_number=match_data.get('week_number'),
-                country=match_data.get('country'),
-                game_title=match_data.get('game_title'),
-            )
-            created_count += 1
-            
-        except Exception as e:
-            errors.append(f"Error creating {match_data.get('team_a', '?')} vs {match_data.get('team_b', '?')}: {str(e)}")
-    
+                    date=match_data['date'],
+                    prob_a=match_data['prob_a'],
+                    prob_b=match_data['prob_b'],
+                    odds_a=match_data['odds_a'],
+                    odds_b=match_data['odds_b'],
+                    draw_prob=match_data['draw_prob'],
+                    week_number=match_data.get('week_number'),
+                    country=match_data.get('country'),
+                    game_title=match_data.get('game_title'),
+                )
+                created_count += 1
+
+            except Exception as e:
+                errors.append(f"Error creating {match_data.get('team_a', '?')} vs {match_data.get('team_b', '?')}: {str(e)}")
+
     return created_count, errors, warnings
 
@@ -1,6 +1,11 @@
-from django.contrib import admin
-from .models import Prediction
+from django.contrib import admin, messages
+from django.db import IntegrityError, transaction
+from django.db.models import Max
+from .models import AI_STRATEGIES, Prediction, APIResponseCache, APICounter, APIRateLimit, APICircuitBreaker, APICallLog, AISurrogate, PredictionJob
+from .resilience import CircuitBreaker
+from . import jobs
 from .engine import PredictionEngine
+from django.utils import timezone
 from django.utils.html import format_html
 
 
@@ -16,7 +21,10 @@ class PredictionAdmin(admin.ModelAdmin):
     ]
     list_filter = ['created_at', 'baseline', 'profitable', 'balanced']
     search_fields = ['match__team_a__name', 'match__team_b__name']
-    readonly_fields = ['created_at', 'updated_at', 'ai_baseline', 'ai_profitable', 'ai_balanced']
+    readonly_fields = [
+        'created_at', 'updated_at', 'ai_baseline', 'ai_profitable', 'ai_balanced', 'ai_sources',
+        'input_fingerprint', 'engine_version',
+    ]
     date_hierarchy = 'created_at'
     
     fieldsets = (
@@ -27,11 +35,11 @@ class PredictionAdmin(admin.ModelAdmin):
             'fields': ('baseline', 'profitable', 'balanced')
         }),
         ('AI Predictions', {
-            'fields': ('ai_baseline', 'ai_profitable', 'ai_balanced'),
+            'fields': ('ai_baseline', 'ai_profitable', 'ai_balanced', 'ai_sources'),
             'classes': ('collapse',)
         }),
         ('Timestamps', {
-            'fields': ('created_at', 'updated_at'),
+            'fields': ('created_at', 'updated_at', 'input_fingerprint', 'engine_version'),
             'classes': ('collapse',)
         }),
     )
@@ -64,6 +72,7 @@ class PredictionAdmin(admin.ModelAdmin):
             pred.baseline = predictions['baseline']
             pred.profitable = predictions['profitable']
             pred.balanced = predictions['balanced']
+            pred.stamp_inputs(engine)
             pred.save()
             count += 1
         
@@ -72,17 +81,154 @@ class PredictionAdmin(admin.ModelAdmin):
     
     def generate_ai_predictions(self, request, queryset):
         """Generate AI predictions for selected predictions"""
+        if jobs.async_enabled():
+            queued = jobs.enqueue(queryset.values_list('match_id', flat=True), source='admin')
+            self.message_user(request, f"Queued AI predictions for {queued} matches.")
+            return
         engine = PredictionEngine(use_ai=True)
         count = 0
         
+        queryset = queryset.select_related('match__team_a', 'match__team_b')
+        generated, timing = engine.generate_predictions_bulk([pred.match for pred in queryset])
+        
         for pred in queryset:
-            predictions = engine.generate_prediction(pred.match, use_ai=True)
+            predictions = generated[pred.match_id]
+            pred.baseline = predictions['baseline']
+            pred.profitable = predictions['profitable']
+            pred.balanced = predictions['balanced']
             pred.ai_baseline = predictions['ai_baseline']
             pred.ai_profitable = predictions['ai_profitable']
             pred.ai_balanced = predictions['ai_balanced']
+            pred.ai_sources.update(predictions.get('ai_sources') or {})
+            pred.stamp_inputs(engine, refreshed_ai=AI_STRATEGIES)
             pred.save()
             count += 1
         
-        self.message_user(request, f"Generated AI predictions for {count} predictions.")
+        self.message_user(
+            request,
+            f"Generated AI predictions for {count} predictions "
+            f"({timing['calls']} calls, {timing['wall_time']}s wall time vs {timing['call_time']}s summed call time)."
+        )
     generate_ai_predictions.short_description = "Generate AI predictions (DeepSeek)"
 
+
+
+@admin.register(APIResponseCache)
+class APIResponseCacheAdmin(admin.ModelAdmin):
+    list_display = ['key_display', 'model', 'hit_count', 'last_accessed', 'expires_at', 'created_at']
+    list_filter = ['model']
+    search_fields = ['key']
+    readonly_fields = ['key', 'model', 'response_data', 'hit_count', 'last_accessed', 'expires_at', 'created_at']
+    
+    def key_display(self, obj):
+        return obj.key[:12]
+    key_display.short_description = 'Key'
+
+
+@admin.register(APICounter)
+class APICounterAdmin(admin.ModelAdmin):
+    list_display = ['name', 'value', 'updated_at']
+    readonly_fields = ['updated_at']
+
+
+@admin.register(APIRateLimit)
+class APIRateLimitAdmin(admin.ModelAdmin):
+    list_display = ['name', 'tokens', 'updated_at']
+    readonly_fields = ['name', 'tokens', 'refilled_at', 'updated_at']
+
+
+@admin.register(APICircuitBreaker)
+class APICircuitBreakerAdmin(admin.ModelAdmin):
+    list_display = ['name', 'state_display', 'consecutive_failures', 'total_trips', 'opened_at', 'last_failure_at']
+    readonly_fields = [
+        'name', 'state', 'consecutive_failures', 'total_trips',
+        'opened_at', 'last_failure_at', 'last_error', 'updated_at'
+    ]
+    actions = ['reset_breaker']
+    
+    def state_display(self, obj):
+        colors = {
+            APICircuitBreaker.STATE_CLOSED: 'green',
+            APICircuitBreaker.STATE_OPEN: 'red',
+            APICircuitBreaker.STATE_HALF_OPEN: 'orange',
+        }
+        return format_html('<strong style="color: {};">{}</strong>', colors.get(obj.state, 'black'), obj.get_state_display())
+    state_display.short_description = 'State'
+    
+    def reset_breaker(self, request, queryset):
+        """Close the selected breakers so calls go out again immediately"""
+        for breaker in queryset:
+            CircuitBreaker(breaker.name).reset()
+        self.message_user(request, f"Reset {queryset.count()} circuit breaker(s).")
+    reset_breaker.short_description = "Reset (close) circuit breaker"
+
+
+@admin.register(APICallLog)
+class APICallLogAdmin(admin.ModelAdmin):
+    list_display = [
+        'created_at', 'match', 'strategy', 'status', 'http_status', 'endpoint', 'hedged', 'latency_ms',
+        'prompt_tokens', 'completion_tokens', 'cache_hit_tokens', 'cache_miss_tokens'
+    ]
+    list_filter = ['status', 'strategy', 'model', 'endpoint', 'hedged', 'created_at']
+    date_hierarchy = 'created_at'
+    list_select_related = ['match__team_a', 'match__team_b']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(AISurrogate)
+class AISurrogateAdmin(admin.ModelAdmin):
+    list_display = ['strategy', 'samples', 'holdout_agreement', 'confident_agreement', 'coverage', 'threshold', 'trained_at']
+    readonly_fields = [
+        'strategy', 'parameters', 'samples', 'holdout_agreement',
+        'confident_agreement', 'coverage', 'threshold', 'trained_at'
+    ]
+
+
+@admin.register(PredictionJob)
+class PredictionJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'match', 'status', 'source', 'attempts', 'available_at', 'claimed_by', 'created_at', 'finished_at']
+    list_filter = ['status', 'source']
+    search_fields = ['match__team_a__name', 'match__team_b__name', 'claimed_by']
+    readonly_fields = [
+        'match', 'status', 'source', 'attempts', 'available_at', 'claimed_by',
+        'claimed_at', 'finished_at', 'last_error', 'created_at'
+    ]
+    list_select_related = ['match__team_a', 'match__team_b']
+    actions = ['retry_jobs']
+
+    def retry_jobs(self, request, queryset):
+        """
+        Put failed jobs back in the queue with a fresh attempt count
+
+        A match can only have one pending or running job, so failed jobs of
+        matches that already have one are skipped, and of several failed jobs
+        for the same match only the latest is retried.
+        """
+        failed = queryset.filter(status=PredictionJob.STATUS_FAILED)
+        selected = failed.count()
+        retryable = failed.exclude(
+            match__in=PredictionJob.objects.filter(status__in=PredictionJob.ACTIVE_STATUSES).values('match')
+        ).values('match').annotate(latest=Max('pk')).values('latest')
+        try:
+            with transaction.atomic():
+                retried = PredictionJob.objects.filter(pk__in=retryable).update(
+                    status=PredictionJob.STATUS_PENDING, attempts=0, available_at=timezone.now(), finished_at=None
+                )
+        except IntegrityError:
+            # A job for one of these matches was queued meanwhile
+            self.message_user(
+                request, "Some of these matches were queued again meanwhile; nothing was retried.", messages.WARNING
+            )
+            return
+        skipped = selected - retried
+        self.message_user(
+            request,
+            f"Queued {retried} failed jobs again."
+            + (f" Skipped {skipped} whose match already has an active job." if skipped else "")
+        )
+    retry_jobs.short_description = "Retry failed jobs"
@@ -0,0 +1,263 @@
+"""
+Backtesting for the prediction strategies
+
+Threshold sweeps load settled matches once as NumPy arrays and score grids
+of threshold combinations for each rule strategy against the actual
+results, spreading the combinations over CPU cores with a process pool
+(`manage.py sweep_thresholds`).
+
+ROI backtests replay the stored predictions as bets at the stored odds,
+in match order, with flat and proportional stakes (`manage.py
+backtest_roi` and the analytics ROI page).
+"""
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from . import rules
+
+# Prediction columns that can be replayed as bets
+BET_STRATEGIES = ('baseline', 'profitable', 'balanced', 'ai_baseline', 'ai_profitable', 'ai_balanced')
+# Share of the current bankroll staked per bet in proportional staking
+DEFAULT_STAKE_FRACTION = 0.02
+
+# PredictionEngine attributes each strategy depends on
+STRATEGY_PARAMETERS = {
+    'baseline': ('threshold',),
+    'profitable': ('value_threshold',),
+    'balanced': ('balanced_prob_threshold', 'balanced_value_margin'),
+}
+
+
+def grid(start, stop, step):
+    """Inclusive, rounded range of candidate values"""
+    return np.round(np.arange(start, stop + step / 2, step), 6)
+
+
+DEFAULT_GRIDS = {
+    'threshold': grid(0.0, 0.5, 0.0005),
+    'value_threshold': grid(-0.2, 0.4, 0.0005),
+    'balanced_prob_threshold': grid(0.2, 0.8, 0.005),
+    'balanced_value_margin': grid(-0.15, 0.25, 0.005),
+}
+
+_data = None
+
+
+def load_settled(matches=None):
+    """
+    Inputs and results of every settled match as arrays
+
+    Args:
+        matches: Optional Match queryset to restrict the backtest to
+
+    Returns:
+        dict of 'prob_a', 'prob_b', 'implied_prob_a', 'implied_prob_b'
+        (floats) and 'actual' ('3'/'1'/'0' strings)
+    """
+    from matches.models import Match
+
+    matches = Match.objects.all() if matches is None else matches
+    rows = list(
+        matches.filter(actual_result__in=('3', '1', '0')).order_by()
+        .values_list('prob_a', 'prob_b', 'odds_a', 'odds_b', 'actual_result')
+        .iterator(chunk_size=10000)
+    )
+    prob_a, prob_b, odds_a, odds_b, actual = zip(*rows) if rows else ((),) * 5
+    return {
+        'prob_a': np.asarray(prob_a, dtype=float),
+        'prob_b': np.asarray(prob_b, dtype=float),
+        'implied_prob_a': rules.implied_probability(odds_a),
+        'implied_prob_b': rules.implied_probability(odds_b),
+        'actual': np.asarray(actual, dtype='<U1'),
+    }
+
+
+def predict(data, strategy, params):
+    """Predictions of one strategy for the loaded matches under the given thresholds"""
+    if strategy == 'baseline':
+        return rules.baseline(data['prob_a'], data['prob_b'], params['threshold'])
+    if strategy == 'profitable':
+        return rules.profitable(
+            data['prob_a'], data['prob_b'], data['implied_prob_a'], data['implied_prob_b'],
+            params['value_threshold'],
+        )
+    return rules.balanced(
+        data['prob_a'], data['prob_b'], data['implied_prob_a'], data['implied_prob_b'],
+        params['balanced_prob_threshold'], params['balanced_value_margin'],
+    )
+
+
+def _init_worker(data):
+    global _data
+    _data = data
+
+
+def _evaluate(strategy, combinations, data=None):
+    """Number of correct predictions for each combination of the strategy's parameters"""
+    data = _data if data is None else data
+    names = STRATEGY_PARAMETERS[strategy]
+    return [
+        int(np.count_nonzero(predict(data, strategy, dict(zip(names, values))) == data['actual']))
+        for values in combinations
+    ]
+
+
+def sweep(data, strategies=None, grids=None, workers=None, batch_size=100):
+    """
+    Score every threshold combination of each strategy against the actual results
+
+    Args:
+        data: load_settled() arrays
+        strategies: Strategies to sweep (default all three)
+        grids: {parameter: values} overriding DEFAULT_GRIDS
+        workers: Worker processes (default os.cpu_count(); 1 runs in-process)
+        batch_size: Combinations per task sent to a worker
+
+    Returns:
+        {strategy: [{'params': {...}, 'correct': n, 'accuracy': fraction}, ...]}
+    """
+    strategies = strategies or list(STRATEGY_PARAMETERS)
+    grids = dict(DEFAULT_GRIDS, **(grids or {}))
+    workers = workers or os.cpu_count() or 1
+    total = len(data['actual'])
+
+    tasks = []
+    for strategy in strategies:
+        names = STRATEGY_PARAMETERS[strategy]
+        combinations = [
+            tuple(float(value) for value in values)
+            for values in itertools.product(*(grids[name] for name in names))
+        ]
+        for offset in range(0, len(combinations), batch_size):
+            tasks.append((strategy, combinations[offset:offset + batch_size]))
+
+    if workers == 1:
+        counts = [_evaluate(strategy, combinations, data) for strategy, combinations in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(data,)) as executor:
+            counts = list(executor.map(_evaluate, *zip(*tasks))) if tasks else []
+
+    results = {strategy: [] for strategy in strategies}
+    for (strategy, combinations), correct_counts in zip(tasks, counts):
+        names = STRATEGY_PARAMETERS[strategy]
+        for values, correct in zip(combinations, correct_counts):
+            results[strategy].append({
+                'params': dict(zip(names, values)),
+                'correct': correct,
+                'accuracy': correct / total if total else 0.0,
+            })
+    return results
+
+
+def best(results, top=10):
+    """The top configurations of each strategy by accuracy"""
+    return {
+        strategy: sorted(rows, key=lambda row: row['accuracy'], reverse=True)[:top]
+        for strategy, rows in results.items()
+    }
+
+
+def load_bets(predictions=None):
+    """
+    Stored predictions of every settled match as arrays, in match order
+
+    Args:
+        predictions: Optional Prediction queryset to restrict the backtest to
+
+    Returns:
+        dict of one '3'/'1'/'0' array per BET_STRATEGIES column ('' where an
+        AI prediction is missing), 'actual', and float 'odds_a'/'odds_b'
+    """
+    from django.db.models import Value
+    from django.db.models.functions import Coalesce, NullIf
+    from .models import Prediction
+
+    predictions = Prediction.objects.all() if predictions is None else predictions
+    rows = list(
+        predictions.filter(match__actual_result__in=('3', '1', '0'))
+        .annotate(**{f'{strategy}_pick': Coalesce(NullIf(strategy, Value('')), Value('-')) for strategy in BET_STRATEGIES})
+        .order_by('match__date', 'match_id')
+        .values_list(
+            *(f'{strategy}_pick' for strategy in BET_STRATEGIES),
+            'match__actual_result', 'match__odds_a', 'match__odds_b',
+        )
+        .iterator(chunk_size=10000)
+    )
+    columns = list(zip(*rows)) if rows else [()] * (len(BET_STRATEGIES) + 3)
+    data = {}
+    for name, column in zip((*BET_STRATEGIES, 'actual'), columns):
+        # Every value is one ASCII character, so a joined string converts far faster than a tuple
+        picks = np.frombuffer(''.join(column).encode('ascii'), dtype='S1').astype('<U1')
+        picks[picks == '-'] = ''
+        data[name] = picks
+    data['odds_a'] = np.asarray(columns[-2], dtype=float)
+    data['odds_b'] = np.asarray(columns[-1], dtype=float)
+    # An empty or multi-character pick would shift that column against the results and odds
+    if len({len(values) for values in data.values()}) != 1:
+        raise ValueError("load_bets() columns are misaligned: a pick is empty or longer than one character")
+    return data
+
+
+def roi(picks, actual, odds_a, odds_b, stake_fraction=DEFAULT_STAKE_FRACTION):
+    """
+    Replay picks as bets at the stored odds
+
+    A '3' backs team A at odds_a and a '0' team B at odds_b. Draw picks,
+    missing picks and missing odds place no bet since no draw odds are
+    stored. Flat staking bets one unit each time; proportional staking bets
+    stake_fraction of the current bankroll, compounding in match order.
+
+    Returns:
+        dict with bets, wins, hit_rate, flat_profit (units), flat_roi,
+        flat_max_drawdown (units), proportional_roi, proportional_bankroll
+        (final bankroll as a multiple of the starting one) and
+        proportional_max_drawdown (fraction of the peak bankroll)
+    """
+    odds = np.where(picks == '3', odds_a, np.where(picks == '0', odds_b, 0.0))
+    bet = odds > 1
+    returns = np.where(picks == actual, odds - 1, -1.0)[bet]
+    bets = len(returns)
+    if not bets:
+        return {
+            'bets': 0, 'wins': 0, 'hit_rate': None,
+            'flat_profit': 0.0, 'flat_roi': None, 'flat_max_drawdown': 0.0,
+            'proportional_roi': None, 'proportional_bankroll': 1.0, 'proportional_max_drawdown': 0.0,
+        }
+    wins = int(np.count_nonzero(returns > -1))
+
+    flat = np.cumsum(returns)
+    flat_peak = np.maximum.accumulate(np.maximum(flat, 0.0))
+
+    # Log-space bankroll so a long history cannot under/overflow
+    log_bankroll = np.cumsum(np.log1p(stake_fraction * returns))
+    log_before = np.concatenate(([0.0], log_bankroll[:-1]))
+    log_peak = np.maximum.accumulate(np.maximum(log_bankroll, 0.0))
+    # Stakes are proportional to the bankroll before each bet; ROI is scale-free
+    weights = np.exp(log_before - log_before.max())
+    with np.errstate(over='ignore'):
+        bankroll = float(np.exp(log_bankroll[-1]))
+
+    return {
+        'bets': bets,
+        'wins': wins,
+        'hit_rate': wins / bets,
+        'flat_profit': float(flat[-1]),
+        'flat_roi': float(flat[-1]) / bets,
+        'flat_max_drawdown': float((flat_peak - flat).max()),
+        'proportional_roi': float((weights * returns).sum() / weights.sum()),
+        'proportional_bankroll': bankroll,
+        'proportional_max_drawdown': float(-np.expm1((log_bankroll - log_peak).min())),
+    }
+
+
+def roi_report(data, strategies=BET_STRATEGIES, stake_fraction=DEFAULT_STAKE_FRACTION):
+    """roi() of each strategy over load_bets() arrays, plus its number of predictions"""
+    report = {}
+    for strategy in strategies:
+        picks = data[strategy]
+        report[strategy] = {
+            'predictions': int(np.count_nonzero(picks != '')),
+            **roi(picks, data['actual'], data['odds_a'], data['odds_b'], stake_fraction),
+        }
+    return report
@@ -0,0 +1,165 @@
+"""
+Persistent response cache for DeepSeek calls
+
+Entries live in the database so every worker process shares them. Each
+entry expires after DEEPSEEK_CACHE_TTL seconds, and once the table grows
+past DEEPSEEK_CACHE_MAX_ENTRIES the least recently used entries are evicted.
+To keep lookups and stores cheap, eviction runs every
+DEEPSEEK_CACHE_EVICT_EVERY inserts per process (the table may overshoot
+the cap by that much meanwhile) and hit/miss counts are added to the
+shared counters in batches.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError
+from django.db.models import F
+from django.utils import timezone
+from .models import APIResponseCache, APICounter
+
+logger = logging.getLogger(__name__)
+
+HIT_COUNTER = 'cache_hits'
+MISS_COUNTER = 'cache_misses'
+
+# Per-process state shared by every ResponseCache (get_response_cache() builds a new one each call)
+_lock = threading.Lock()
+_pending_counts = {HIT_COUNTER: 0, MISS_COUNTER: 0}
+_counted_at = time.monotonic()
+_inserts = 0
+
+
+def make_cache_key(model, system_message, prompt, temperature):
+    """Hash the inputs that determine a DeepSeek reply"""
+    raw = json.dumps([model, system_message, prompt, temperature], ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Database-backed TTL + LRU cache of chat-completions responses"""
+    
+    def __init__(self, ttl=None, max_entries=None):
+        self.ttl = ttl if ttl is not None else getattr(settings, 'DEEPSEEK_CACHE_TTL', 86400)
+        self.max_entries = max_entries if max_entries is not None else getattr(settings, 'DEEPSEEK_CACHE_MAX_ENTRIES', 10000)
+        self.evict_every = getattr(settings, 'DEEPSEEK_CACHE_EVICT_EVERY', 100)
+        self.counter_batch = getattr(settings, 'DEEPSEEK_CACHE_COUNTER_BATCH', 50)
+        self.counter_interval = getattr(settings, 'DEEPSEEK_CACHE_COUNTER_INTERVAL', 10)
+    
+    def _count(self, name):
+        """Count a hit or miss, adding the batch to APICounter once it is big or old enough"""
+        global _counted_at
+        with _lock:
+            _pending_counts[name] += 1
+            due = (
+                sum(_pending_counts.values()) >= self.counter_batch
+                or time.monotonic() - _counted_at >= self.counter_interval
+            )
+        if due:
+            self.flush_counts()
+    
+    @staticmethod
+    def flush_counts():
+        """Add this process's pending hit/miss counts to the shared counters"""
+        global _counted_at
+        with _lock:
+            counts = dict(_pending_counts)
+            for name in _pending_counts:
+                _pending_counts[name] = 0
+            _counted_at = time.monotonic()
+        try:
+            for name, amount in counts.items():
+                if amount:
+                    APICounter.increment(name, amount)
+        except DatabaseError as e:
+            logger.warning(f"Response cache counters not saved: {e}")
+    
+    def get(self, key):
+        """Return the cached response body for key, or None on a miss"""
+        now = timezone.now()
+        try:
+            entry = APIResponseCache.objects.filter(key=key).only('response_data', 'expires_at').first()
+            if entry and entry.expires_at <= now:
+                APIResponseCache.objects.filter(pk=entry.pk).delete()
+                entry = None
+            
+            if entry is None:
+                self._count(MISS_COUNTER)
+                return None
+            
+            APIResponseCache.objects.filter(pk=entry.pk).update(
+                last_accessed=now,
+                hit_count=F('hit_count') + 1
+            )
+            self._count(HIT_COUNTER)
+            return entry.response_data
+        except DatabaseError as e:
+            logger.warning(f"Response cache lookup failed: {e}")
+            return None
+    
+    def set(self, key, model, response_data):
+        """Store a response body; every evict_every inserts, evict entries over the cap"""
+        global _inserts
+        now = timezone.now()
+        try:
+            updated = APIResponseCache.objects.filter(key=key).update(
+                response_data=response_data,
+                last_accessed=now,
+                expires_at=now + timedelta(seconds=self.ttl)
+            )
+            if not updated:
+                try:
+                    APIResponseCache.objects.create(
+                        key=key,
+                        model=model,
+                        response_data=response_data,
+                        last_accessed=now,
+                        expires_at=now + timedelta(seconds=self.ttl)
+                    )
+                except IntegrityError:
+                    return  # Another process stored the same response first
+                with _lock:
+                    _inserts += 1
+                    due = _inserts >= self.evict_every
+                    if due:
+                        _inserts = 0
+                if due:
+                    self.evict()
+        except DatabaseError as e:
+            logger.warning(f"Response cache store failed: {e}")
+    
+    def evict(self):
+        """Drop expired entries and trim the table to max_entries by last access"""
+        APIResponseCache.objects.filter(expires_at__lte=timezone.now()).delete()
+        excess = APIResponseCache.objects.count() - self.max_entries
+        if excess > 0:
+            stale_ids = list(
+                APIResponseCache.objects.order_by('last_accessed').values_list('pk', flat=True)[:excess]
+            )
+            APIResponseCache.objects.filter(pk__in=stale_ids).delete()
+    
+    def clear(self):
+        APIResponseCache.objects.all().delete()
+    
+    def stats(self):
+        """Entry count and hit/miss counters"""
+        self.flush_counts()
+        counters = APICounter.get_values(HIT_COUNTER, MISS_COUNTER)
+        hits, misses = counters[HIT_COUNTER], counters[MISS_COUNTER]
+        lookups = hits + misses
+        return {
+            'entries': APIResponseCache.objects.count(),
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def get_response_cache():
+    """Return the configured response cache, or None when caching is disabled"""
+    if not getattr(settings, 'DEEPSEEK_CACHE_ENABLED', True):
+        return None
+    return ResponseCache()
@@ -2,12 +2,122 @@
 DeepSeek API Client for generating predictions
 """
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import asyncio
+import functools
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
+from django.db import connections, DatabaseError
+from .cache import get_response_cache, make_cache_key
+from .resilience import CircuitBreaker, get_rate_limiter
+from .endpoints import get_endpoint_pool
+from .models import APICallLog
+from . import prompts
+from .prompts import DIGIT_SYSTEM_MESSAGE, COMBINED_SYSTEM_MESSAGE, PACKED_SYSTEM_MESSAGE
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Status codes worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+PREDICTION_DIGITS = ('3', '1', '0')
+STRATEGIES = ('baseline', 'profitable', 'balanced')
+
+_session = None
+_deadline_session = None
+_client = None
+_lock = threading.RLock()
+
+
+def _build_session(retries=True):
+    """
+    Build a requests session with a pooled, retrying HTTP adapter.
+    Pool sizes and retry behaviour come from the DEEPSEEK_* settings;
+    retries=False builds one that never retries.
+    """
+    retry = Retry(
+        total=getattr(settings, 'DEEPSEEK_MAX_RETRIES', 3) if retries else 0,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset(['POST']),
+        backoff_factor=getattr(settings, 'DEEPSEEK_BACKOFF_FACTOR', 0.5),
+        backoff_jitter=getattr(settings, 'DEEPSEEK_BACKOFF_JITTER', 0.5),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=getattr(settings, 'DEEPSEEK_POOL_CONNECTIONS', 4),
+        pool_maxsize=getattr(settings, 'DEEPSEEK_POOL_MAXSIZE', 10),
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """Return the process-wide keep-alive session used for DeepSeek calls"""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def get_deadline_session():
+    """
+    Return the process-wide session used for calls bound by a Deadline.
+    It does not retry: retries and their backoff would run past the
+    per-call timeout the deadline sets.
+    """
+    global _deadline_session
+    if _deadline_session is None:
+        with _lock:
+            if _deadline_session is None:
+                _deadline_session = _build_session(retries=False)
+    return _deadline_session
+
+
+def get_client():
+    """Return the process-wide DeepSeekClient"""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = DeepSeekClient()
+    return _client
+
+
+def get_connection_stats():
+    """
+    Report how many requests went over reused keep-alive connections
+    versus freshly opened ones, summed over every connection pool.
+    """
+    stats = {'requests': 0, 'new_connections': 0, 'reused_connections': 0}
+    sessions = [session for session in (_session, _deadline_session) if session is not None]
+    adapters = {adapter for session in sessions for adapter in session.adapters.values()}
+    
+    for adapter in adapters:
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            stats['requests'] += pool.num_requests
+            stats['new_connections'] += pool.num_connections
+    stats['reused_connections'] = max(stats['requests'] - stats['new_connections'], 0)
+    return stats
+
+
+class DeepSeekUnavailable(requests.exceptions.RequestException):
+    """Raised locally when the circuit breaker or rate limiter refuses a call"""
+
 
 class DeepSeekClient:
     """Client for interacting with DeepSeek API"""
@@ -15,8 +125,24 @@ class DeepSeekClient:
     def __init__(self):
         self.api_key = settings.DEEPSEEK_API_KEY
         self.api_url = settings.DEEPSEEK_API_URL
+        self.timeout = getattr(settings, 'DEEPSEEK_TIMEOUT', 30)
+        self.session = get_session()
+        self.deadline_session = get_deadline_session()
+        self.endpoints = get_endpoint_pool()
+        self.breaker = CircuitBreaker()
+        self.rate_limiter = get_rate_limiter()
+    
+    def is_available(self):
+        """False while the circuit breaker is failing calls fast"""
+        return not self.breaker.is_open()
+    
+    def connection_stats(self):
+        """Connection reuse counters for the shared session"""
+        return get_connection_stats()
         
-    def _make_request(self, prompt, model="deepseek-chat", return_full_response=False):
+    def _make_request(self, prompt, model="deepseek-chat", return_full_response=False,
+                      system_message=DIGIT_SYSTEM_MESSAGE, max_tokens=10, match=None, strategy='',
+                      deadline=None):
         """
         Make API request to DeepSeek
         
@@ -24,6 +150,11 @@ class DeepSeekClient:
             prompt: The user prompt to send
             model: The model to use (default: deepseek-chat)
             return_full_response: If True, return full API response instead of just the prediction digit
+            system_message: System instruction sent ahead of the prompt
+            max_tokens: Completion token limit
+            match: Match the call is for, recorded in the usage ledger
+            strategy: Prediction strategy (or 'combined'/'packed'), recorded in the usage ledger
+            deadline: Optional resilience.Deadline; caps the timeout and skips the call once spent
         
         Returns:
             If return_full_response=False: Single digit ('3', '1', or '0') or None
@@ -39,7 +170,7 @@ class DeepSeekClient:
             'messages': [
                 {
                     'role': 'system',
-                    'content': 'You are a sport prediction expert. Always respond with a single digit: 3 for Team A win, 1 for draw, 0 for Team B win.'
+                    'content': system_message
                 },
                 {
                     'role': 'user',
@@ -47,28 +178,129 @@ class DeepSeekClient:
                 }
             ],
             'temperature': 0.3,
-            'max_tokens': 10
+            'max_tokens': max_tokens
         }
         
-        # Log the request data
-        logger.info(f"Sending request to DeepSeek API: {self.api_url}")
-        logger.debug(f"Request payload: {json.dumps(payload, indent=2)}")
+        # Identical requests get identical replies, so check the shared cache first. An
+        # endpoint may override the model, so replies are keyed by the model that answers
+        # them and looked up under the one the fastest endpoint would use
+        cache = get_response_cache()
+        cache_key = functools.partial(
+            make_cache_key, system_message=system_message, prompt=prompt, temperature=payload['temperature']
+        )
+        lookup_model = self.endpoints.ranked()[0].model_for(model)
+        data = cache.get(cache_key(lookup_model)) if cache else None
+        cached = data is not None
         
+        started = time.perf_counter()
+        ledger = {
+            'status': APICallLog.STATUS_CACHED if cached else APICallLog.STATUS_ERROR,
+            'http_status': None,
+            'endpoint': '',
+            'hedged': False,
+            'model': lookup_model,
+        }
         try:
-            response = requests.post(self.api_url, headers=headers, json=payload, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-            
-            # Log the response
-            logger.info(f"Received response from DeepSeek API")
-            logger.debug(f"Response data: {json.dumps(data, indent=2)}")
+            return self._send(payload, headers, prompt, model, return_full_response, cache, cache_key, data, ledger, deadline)
+        finally:
+            elapsed = time.perf_counter() - started
+            if deadline is not None:
+                deadline.add_ai_time(elapsed)
+            self._record_call(match, strategy, ledger['model'], ledger, elapsed)
+    
+    def _record_call(self, match, strategy, model, ledger, elapsed):
+        """Append one row to the usage ledger; never lets a ledger failure break the call"""
+        usage = ledger.get('usage') or {}
+        try:
+            APICallLog.objects.create(
+                match=match if getattr(match, 'pk', None) else None,
+                strategy=strategy or '',
+                model=model,
+                prompt_version=prompts.PROMPT_VERSION,
+                status=ledger['status'],
+                http_status=ledger['http_status'],
+                endpoint=ledger['endpoint'],
+                hedged=ledger['hedged'],
+                latency_ms=round(elapsed * 1000, 2),
+                prompt_tokens=usage.get('prompt_tokens', 0) or 0,
+                completion_tokens=usage.get('completion_tokens', 0) or 0,
+                cache_hit_tokens=usage.get('prompt_cache_hit_tokens', 0) or 0,
+                cache_miss_tokens=usage.get('prompt_cache_miss_tokens', 0) or 0,
+            )
+        except DatabaseError as e:
+            logger.warning(f"Could not record DeepSeek call: {e}")
+    
+    def _send(self, payload, headers, prompt, model, return_full_response, cache, cache_key, data, ledger, deadline=None):
+        """
+        Serve a request from the cache or the API; fills ledger with the outcome
+
+        cache_key maps the model that answers to the reply's cache key.
+        """
+        cached = data is not None
+        url = self.api_url
+        try:
+            if cached:
+                logger.info(f"Serving DeepSeek response from cache")
+            else:
+                # Log the request data
+                logger.info(f"Sending request to DeepSeek API")
+                logger.debug(f"Request payload: {json.dumps(payload, indent=2)}")
+                
+                if deadline is not None and deadline.expired():
+                    ledger['status'] = APICallLog.STATUS_UNAVAILABLE
+                    raise DeepSeekUnavailable("Request deadline spent, skipping DeepSeek call")
+                # Rate limit first: a half-open trial must not be granted to a call that then never goes out
+                max_wait = deadline.timeout(self.rate_limiter.max_wait) if deadline is not None else None
+                if not self.rate_limiter.acquire(max_wait=max_wait):
+                    ledger['status'] = APICallLog.STATUS_UNAVAILABLE
+                    raise DeepSeekUnavailable("Rate limit wait exceeded, skipping DeepSeek call")
+                timeout = deadline.timeout(self.timeout) if deadline is not None else self.timeout
+                if timeout <= 0:
+                    # The budget ran out while waiting for the rate limiter
+                    ledger['status'] = APICallLog.STATUS_UNAVAILABLE
+                    raise DeepSeekUnavailable("Request deadline spent, skipping DeepSeek call")
+                if not self.breaker.allow_request():
+                    ledger['status'] = APICallLog.STATUS_UNAVAILABLE
+                    raise DeepSeekUnavailable("Circuit breaker is open, skipping DeepSeek call")
+                
+                try:
+                    session = self.session if deadline is None else self.deadline_session
+                    endpoint, response, hedged = self.endpoints.post(
+                        session, payload, headers, timeout,
+                        allow_hedge=lambda: self.rate_limiter.acquire(max_wait=0),
+                    )
+                    ledger.update(
+                        endpoint=endpoint.name, hedged=hedged, http_status=response.status_code,
+                        model=endpoint.model_for(model),
+                    )
+                    url = endpoint.url
+                    data = response.json()
+                except requests.exceptions.RequestException as e:
+                    if e.response is not None:
+                        ledger['http_status'] = e.response.status_code
+                    # Includes bodies that aren't JSON (requests' JSONDecodeError). Local errors
+                    # are not the API's fault and don't count; a half-open trial they abandon is
+                    # retried after a cool-down (see CircuitBreaker.allow_request)
+                    self.breaker.record_failure(e)
+                    raise
+                self.breaker.record_success()
+                ledger['status'] = APICallLog.STATUS_SUCCESS
+                ledger['usage'] = data.get('usage')
+                
+                # Log the response
+                logger.info(f"Received response from DeepSeek API")
+                logger.debug(f"Response data: {json.dumps(data, indent=2)}")
+                
+                if cache and data.get('choices'):
+                    cache.set(cache_key(ledger['model']), ledger['model'], data)
             
             if return_full_response:
                 return {
                     'success': True,
+                    'cached': cached,
                     'request': {
-                        'url': self.api_url,
-                        'model': model,
+                        'url': url,
+                        'model': ledger['model'],
                         'prompt': prompt,
                         'payload': payload
                     },
@@ -78,13 +310,7 @@ class DeepSeekClient:
             
             if 'choices' in data and len(data['choices']) > 0:
                 content = data['choices'][0]['message']['content'].strip()
-                # Extract single digit from response
-                for char in content:
-                    if char in ['3', '1', '0']:
-                        logger.info(f"Extracted prediction: {char}")
-                        return char
-                logger.warning(f"Unexpected response format: {content}")
-                return None
+                return self.extract_digit(content)
             return None
             
         except requests.exceptions.RequestException as e:
@@ -94,121 +320,232 @@ class DeepSeekClient:
                     'success': False,
                     'error': str(e),
                     'request': {
-                        'url': self.api_url,
-                        'model': model,
+                        'url': url,
+                        'model': ledger['model'],
                         'prompt': prompt,
                         'payload': payload
                     }
                 }
             return None
     
-    def generate_baseline_prediction(self, match):
-        """Generate baseline prediction based on probabilities"""
-        prompt = f"""Match: {match.team_a} vs {match.team_b}
-Probabilities: {match.team_a} {match.prob_a_percent}%, {match.team_b} {match.prob_b_percent}%
-Draw probability: {match.draw_prob_percent}%
-
-Rules:
-- If {match.team_a} probability is significantly higher (difference > 15%) → 3
-- If {match.team_b} probability is significantly higher (difference > 15%) → 0
-- If probabilities are close (difference ≤ 15%) → 1
-
-Output: single digit (3, 1, or 0)"""
+    @staticmethod
+    def extract_digit(content):
+        """Extract the first prediction digit from a reply, or None"""
+        for char in content or '':
+            if char in PREDICTION_DIGITS:
+                logger.info(f"Extracted prediction: {char}")
+                return char
+        logger.warning(f"Unexpected response format: {content}")
+        return None
+    
+    @staticmethod
+    def parse_combined_response(content):
+        """
+        Parse a combined reply such as {"baseline": "3", "profitable": "1", "balanced": "0"}
+        
+        Returns:
+            Dict with one digit per strategy, or None if the reply is malformed
+        """
+        if not content:
+            return None
+        start = content.find('{')
+        end = content.rfind('}')
+        if start == -1 or end <= start:
+            logger.warning(f"Combined response is not JSON: {content}")
+            return None
+        try:
+            data = json.loads(content[start:end + 1])
+        except ValueError:
+            logger.warning(f"Combined response is not valid JSON: {content}")
+            return None
+        if not isinstance(data, dict):
+            return None
         
-        return self._make_request(prompt)
+        result = {}
+        for strategy in STRATEGIES:
+            value = str(data.get(strategy, '')).strip()
+            if value not in PREDICTION_DIGITS:
+                logger.warning(f"Combined response missing a valid '{strategy}' digit: {content}")
+                return None
+            result[strategy] = value
+        return result
     
-    def generate_profitable_prediction(self, match):
-        """Generate profitable prediction comparing odds vs implied probability"""
-        implied_prob_a = match.implied_prob_a
-        implied_prob_b = match.implied_prob_b
+    @classmethod
+    def response_digit(cls, response):
+        """Extract the prediction digit from a full response record, or None"""
+        if not response or not response.get('success'):
+            return None
+        return cls.extract_digit(response.get('raw_content'))
+    
+    def build_prompt(self, match, prediction_type='baseline'):
+        """Build the user prompt for a single prediction strategy"""
+        return prompts.strategy_prompt(match, prediction_type)
+    
+    def build_combined_prompt(self, match):
+        """Build the user prompt asking for all three strategies at once"""
+        return prompts.combined_prompt(match)
+    
+    def build_packed_prompt(self, matches):
+        """Build one prompt asking for all three strategies for several matches"""
+        return prompts.packed_prompt(matches)
+    
+    def get_full_packed_response(self, matches, deadline=None):
+        """Get the full API response for a packed (several matches) request"""
+        return self._make_request(
+            self.build_packed_prompt(matches),
+            return_full_response=True,
+            system_message=PACKED_SYSTEM_MESSAGE,
+            max_tokens=40 * len(matches) + 20,
+            strategy='packed',
+            deadline=deadline,
+        )
+    
+    @classmethod
+    def parse_packed_response(cls, content, count):
+        """
+        Parse a packed reply holding one JSON object per match
+        
+        Args:
+            content: Raw reply text
+            count: Number of matches sent
         
-        prompt = f"""Match: {match.team_a} vs {match.team_b}
-Actual Probabilities: {match.team_a} {match.prob_a_percent}%, {match.team_b} {match.prob_b_percent}%
-Odds: {match.team_a} {match.odds_a}, {match.team_b} {match.odds_b}
-Implied Probabilities from Odds: {match.team_a} {implied_prob_a*100:.2f}%, {match.team_b} {implied_prob_b*100:.2f}%
-
-Rules:
-- If actual probability > implied probability by at least 10% → that team is undervalued
-- If {match.team_a} is undervalued → 3
-- If {match.team_b} is undervalued → 0
-- If neither team is significantly undervalued → 1
-
-Output: single digit (3, 1, or 0)"""
+        Returns:
+            List of length count with a strategy->digit dict for each match, or
+            None where that match's item was missing or malformed
+        """
+        results = [None] * count
+        if not content:
+            return results
+        start = content.find('[')
+        end = content.rfind(']')
+        if start == -1 or end <= start:
+            logger.warning(f"Packed response is not a JSON array: {content}")
+            return results
+        try:
+            items = json.loads(content[start:end + 1])
+        except ValueError:
+            logger.warning(f"Packed response is not valid JSON: {content}")
+            return results
+        if not isinstance(items, list):
+            return results
+        if len(items) != count:
+            logger.warning(f"Packed response returned {len(items)} items for {count} matches")
         
-        return self._make_request(prompt)
+        for position, item in enumerate(items):
+            if not isinstance(item, dict):
+                continue
+            try:
+                index = int(item.get('id', position + 1)) - 1
+            except (TypeError, ValueError):
+                continue
+            if not 0 <= index < count or results[index] is not None:
+                continue
+            results[index] = cls.parse_combined_response(json.dumps(item))
+        return results
+    
+    def get_full_combined_response(self, match, deadline=None):
+        """Get the full API response for a combined (all strategies) request"""
+        return self._make_request(
+            self.build_combined_prompt(match),
+            return_full_response=True,
+            system_message=COMBINED_SYSTEM_MESSAGE,
+            max_tokens=40,
+            match=match,
+            strategy='combined',
+            deadline=deadline,
+        )
     
-    def get_full_prediction_response(self, match, prediction_type='baseline'):
+    def generate_combined_prediction(self, match, deadline=None):
+        """
+        Generate baseline, profitable and balanced predictions in a single call
+        
+        Returns:
+            Dict with 'baseline', 'profitable' and 'balanced' digits, or None if
+            the request failed or the reply could not be parsed
+        """
+        response = self.get_full_combined_response(match, deadline=deadline)
+        if not response.get('success'):
+            return None
+        return self.parse_combined_response(response.get('raw_content'))
+    
+    def generate_baseline_prediction(self, match, deadline=None):
+        """Generate baseline prediction based on probabilities"""
+        return self._make_request(self.build_prompt(match, 'baseline'), match=match, strategy='baseline', deadline=deadline)
+    
+    def generate_profitable_prediction(self, match, deadline=None):
+        """Generate profitable prediction comparing odds vs implied probability"""
+        return self._make_request(self.build_prompt(match, 'profitable'), match=match, strategy='profitable', deadline=deadline)
+    
+    def get_full_prediction_response(self, match, prediction_type='baseline', deadline=None):
         """
         Get full API response from DeepSeek for a match prediction
         
         Args:
             match: Match object
             prediction_type: 'baseline', 'profitable', or 'balanced'
+            deadline: Optional resilience.Deadline bounding the call
         
         Returns:
             Dictionary with full request and response data
         """
-        if prediction_type == 'baseline':
-            prompt = f"""Match: {match.team_a} vs {match.team_b}
-Probabilities: {match.team_a} {match.prob_a_percent}%, {match.team_b} {match.prob_b_percent}%
-Draw probability: {match.draw_prob_percent}%
-
-Rules:
-- If {match.team_a} probability is significantly higher (difference > 15%) → 3
-- If {match.team_b} probability is significantly higher (difference > 15%) → 0
-- If probabilities are close (difference ≤ 15%) → 1
-
-Output: single digit (3, 1, or 0)"""
-        elif prediction_type == 'profitable':
-            implied_prob_a = match.implied_prob_a
-            implied_prob_b = match.implied_prob_b
-            prompt = f"""Match: {match.team_a} vs {match.team_b}
-Actual Probabilities: {match.team_a} {match.prob_a_percent}%, {match.team_b} {match.prob_b_percent}%
-Odds: {match.team_a} {match.odds_a}, {match.team_b} {match.odds_b}
-Implied Probabilities from Odds: {match.team_a} {implied_prob_a*100:.2f}%, {match.team_b} {implied_prob_b*100:.2f}%
-
-Rules:
-- If actual probability > implied probability by at least 10% → that team is undervalued
-- If {match.team_a} is undervalued → 3
-- If {match.team_b} is undervalued → 0
-- If neither team is significantly undervalued → 1
-
-Output: single digit (3, 1, or 0)"""
-        else:  # balanced
-            implied_prob_a = match.implied_prob_a
-            implied_prob_b = match.implied_prob_b
-            prompt = f"""Match: {match.team_a} vs {match.team_b}
-Actual Probabilities: {match.team_a} {match.prob_a_percent}%, {match.team_b} {match.prob_b_percent}%
-Odds: {match.team_a} {match.odds_a}, {match.team_b} {match.odds_b}
-Implied Probabilities: {match.team_a} {implied_prob_a*100:.2f}%, {match.team_b} {implied_prob_b*100:.2f}%
-
-Rules:
-- Combine actual probability and odds alignment
-- If {match.team_a} has high actual probability (>45%) AND good odds value → 3
-- If {match.team_b} has high actual probability (>45%) AND good odds value → 0
-- If probabilities and odds don't align clearly → 1
-
-Output: single digit (3, 1, or 0)"""
-        
-        return self._make_request(prompt, return_full_response=True)
+        return self._make_request(
+            self.build_prompt(match, prediction_type),
+            return_full_response=True,
+            match=match,
+            strategy=prediction_type,
+            deadline=deadline,
+        )
     
-    def generate_balanced_prediction(self, match):
+    def generate_balanced_prediction(self, match, deadline=None):
         """Generate balanced prediction combining probability and odds"""
-        implied_prob_a = match.implied_prob_a
-        implied_prob_b = match.implied_prob_b
-        
-        prompt = f"""Match: {match.team_a} vs {match.team_b}
-Actual Probabilities: {match.team_a} {match.prob_a_percent}%, {match.team_b} {match.prob_b_percent}%
-Odds: {match.team_a} {match.odds_a}, {match.team_b} {match.odds_b}
-Implied Probabilities: {match.team_a} {implied_prob_a*100:.2f}%, {match.team_b} {implied_prob_b*100:.2f}%
-
-Rules:
-- Combine actual probability and odds alignment
-- If {match.team_a} has high actual probability (>45%) AND good odds value → 3
-- If {match.team_b} has high actual probability (>45%) AND good odds value → 0
-- If probabilities and odds don't align clearly → 1
-
-Output: single digit (3, 1, or 0)"""
-        
-        return self._make_request(prompt)
+        return self._make_request(self.build_prompt(match, 'balanced'), match=match, strategy='balanced', deadline=deadline)
 
+
+class AsyncDeepSeekClient:
+    """
+    Asyncio front-end for DeepSeekClient with bounded concurrency.
+    
+    Calls go through the process-wide pooled session on a dedicated thread
+    pool; a semaphore caps how many are in flight at once. Keep
+    DEEPSEEK_POOL_MAXSIZE at least as large as the concurrency so every
+    in-flight call can hold a keep-alive connection.
+    """
+    
+    def __init__(self, concurrency=None, client=None):
+        self.concurrency = concurrency or getattr(settings, 'DEEPSEEK_BULK_CONCURRENCY', 8)
+        self.client = client or get_client()
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='deepseek')
+        self.calls = 0
+        self.call_time = 0.0  # summed duration of individual calls, in seconds
+    
+    async def _call(self, func, *args, **kwargs):
+        """Run a blocking client method under the concurrency limit"""
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            started = time.perf_counter()
+            try:
+                return await loop.run_in_executor(self.executor, functools.partial(self._run, func, *args, **kwargs))
+            finally:
+                self.calls += 1
+                self.call_time += time.perf_counter() - started
+    
+    @staticmethod
+    def _run(func, *args, **kwargs):
+        """Worker-thread wrapper that releases the thread's database connections"""
+        try:
+            return func(*args, **kwargs)
+        finally:
+            connections.close_all()
+    
+    async def get_full_prediction_response(self, match, prediction_type='baseline', deadline=None):
+        """Async variant of DeepSeekClient.get_full_prediction_response"""
+        return await self._call(self.client.get_full_prediction_response, match, prediction_type, deadline=deadline)
+    
+    async def get_full_combined_response(self, match, deadline=None):
+        """Async variant of DeepSeekClient.get_full_combined_response"""
+        return await self._call(self.client.get_full_combined_response, match, deadline=deadline)
+    
+    def close(self):
+        """Shut down the worker threads"""
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,245 @@
+"""
+Pool of OpenAI-compatible chat-completion endpoints
+
+Calls go to the endpoint with the lowest recent latency. Once the primary
+has been slower than its DEEPSEEK_HEDGE_PERCENTILE latency, a duplicate
+request is sent to the next endpoint and whichever answers first wins.
+Hedging needs a second endpoint with a different URL; duplicating a call
+to the same host only doubles token spend and rate-limit use. A primary
+that fails fast (connection refused, 429 or 5xx) fails over to that
+endpoint with whatever is left of the timeout.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, TimeoutError as FutureTimeout, wait
+import requests
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+EWMA_ALPHA = 0.2  # weight of the newest sample in the moving average
+LATENCY_SAMPLES = 200  # recent successful latencies kept per endpoint
+
+_pool = None
+_lock = threading.Lock()
+
+
+class Endpoint:
+    """One chat-completions URL plus its recent latency history"""
+
+    def __init__(self, name, url, api_key=None, model=None):
+        self.name = name
+        self.url = url
+        self.api_key = api_key
+        self.model = model
+        self.ewma = None
+        self.samples = deque(maxlen=LATENCY_SAMPLES)
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def model_for(self, model):
+        """The model this endpoint answers with when model is requested"""
+        return self.model or model
+
+    def record(self, seconds, ok=True):
+        """Fold one call into the latency stats; failures count as slow but are not hedge samples"""
+        with self.lock:
+            self.requests += 1
+            if ok:
+                self.samples.append(seconds)
+            else:
+                self.errors += 1
+            self.ewma = seconds if self.ewma is None else EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * self.ewma
+
+    def percentile(self, percent):
+        """Nearest-rank percentile of recent successful latencies, in seconds"""
+        with self.lock:
+            samples = sorted(self.samples)
+        if not samples:
+            return None
+        rank = max(int(round(percent / 100 * len(samples))) - 1, 0)
+        return samples[min(rank, len(samples) - 1)]
+
+    def status(self):
+        p50, p95 = self.percentile(50), self.percentile(95)
+        return {
+            'name': self.name,
+            'url': self.url,
+            'ewma_ms': round(self.ewma * 1000, 1) if self.ewma is not None else None,
+            'p50_ms': round(p50 * 1000, 1) if p50 is not None else None,
+            'p95_ms': round(p95 * 1000, 1) if p95 is not None else None,
+            'requests': self.requests,
+            'errors': self.errors,
+        }
+
+
+class EndpointPool:
+    """Routes each call to the fastest endpoint and hedges calls that run long"""
+
+    def __init__(self, endpoints, hedge_percentile=None, hedge_min_samples=20, workers=None):
+        if not endpoints:
+            raise ValueError("EndpointPool needs at least one endpoint")
+        self.endpoints = list(endpoints)
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers or 2 * getattr(settings, 'DEEPSEEK_POOL_MAXSIZE', 10),
+            thread_name_prefix='deepseek-hedge',
+        )
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+        self.lock = threading.Lock()
+
+    def ranked(self):
+        """Endpoints fastest first; endpoints with no samples yet come first so they get tried"""
+        return sorted(self.endpoints, key=lambda endpoint: endpoint.ewma if endpoint.ewma is not None else -1.0)
+
+    def backup(self, primary, ranked):
+        """Fastest endpoint with a different URL than primary, or None if there is none to hedge to"""
+        return next((endpoint for endpoint in ranked if endpoint.url != primary.url), None)
+
+    def hedge_delay(self, endpoint):
+        """Seconds to wait on endpoint before hedging, or None while hedging is off or under-sampled"""
+        if self.hedge_percentile is None or len(endpoint.samples) < self.hedge_min_samples:
+            return None
+        return endpoint.percentile(self.hedge_percentile)
+
+    @staticmethod
+    def can_fail_over(error):
+        """Whether another endpoint might answer: connection errors, rate limiting and server errors"""
+        if isinstance(error, requests.exceptions.ConnectionError):
+            return True
+        response = getattr(error, 'response', None)
+        return response is not None and (response.status_code == 429 or response.status_code >= 500)
+
+    def _fail_over(self, error, primary, backup, session, payload, headers, timeout, started):
+        """Send the call to backup after primary failed, or re-raise when there's no point"""
+        remaining = timeout - (time.perf_counter() - started)
+        if backup is None or remaining <= 0 or not self.can_fail_over(error):
+            raise error
+        with self.lock:
+            self.failovers += 1
+        logger.info(f"DeepSeek call on {primary.name} failed ({error}), failing over to {backup.name}")
+        return backup, self._post(backup, session, payload, headers, remaining), False
+
+    def _post(self, endpoint, session, payload, headers, timeout):
+        if endpoint.api_key:
+            headers = dict(headers, Authorization=f'Bearer {endpoint.api_key}')
+        if endpoint.model:
+            payload = dict(payload, model=endpoint.model)
+        started = time.perf_counter()
+        try:
+            response = session.post(endpoint.url, headers=headers, json=payload, timeout=timeout)
+            response.raise_for_status()
+        except requests.exceptions.RequestException:
+            endpoint.record(max(time.perf_counter() - started, timeout), ok=False)
+            raise
+        endpoint.record(time.perf_counter() - started)
+        return response
+
+    def post(self, session, payload, headers, timeout, allow_hedge=None):
+        """
+        POST payload to the fastest endpoint, hedging to the runner-up if it runs long
+
+        Args:
+            session: requests session to send with
+            payload, headers: Request body and headers; an endpoint's own
+                api_key and model override the ones given
+            timeout: Per-request timeout in seconds
+            allow_hedge: Optional callable asked before a hedge is sent
+                (e.g. a non-blocking rate-limiter check); False skips it
+
+        Returns:
+            (endpoint, response, hedged) for the first successful response.
+            Raises the last RequestException if every attempt failed.
+        """
+        ranked = self.ranked()
+        primary = ranked[0]
+        backup = self.backup(primary, ranked)
+        delay = self.hedge_delay(primary) if backup is not None else None
+        started = time.perf_counter()
+        if delay is None or delay >= timeout:
+            try:
+                return primary, self._post(primary, session, payload, headers, timeout), False
+            except requests.exceptions.RequestException as e:
+                return self._fail_over(e, primary, backup, session, payload, headers, timeout, started)
+
+        first = self.executor.submit(self._post, primary, session, payload, headers, timeout)
+        try:
+            return primary, first.result(timeout=delay), False
+        except FutureTimeout:
+            pass
+        except requests.exceptions.RequestException as e:
+            return self._fail_over(e, primary, backup, session, payload, headers, timeout, started)
+        if allow_hedge is not None and not allow_hedge():
+            return primary, first.result(), False
+
+        second = self.executor.submit(self._post, backup, session, payload, headers, timeout - delay)
+        with self.lock:
+            self.hedges += 1
+        logger.info(f"Hedging DeepSeek call on {primary.name} after {delay * 1000:.0f}ms to {backup.name}")
+
+        # The losing request is left to finish in the background; its latency still counts
+        attempts = {first: primary, second: backup}
+        pending = set(attempts)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except requests.exceptions.RequestException as e:
+                    error = e
+                    continue
+                if future is second:
+                    with self.lock:
+                        self.hedge_wins += 1
+                return attempts[future], response, True
+        raise error
+
+    def status(self):
+        return {
+            'hedge_percentile': self.hedge_percentile,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'failovers': self.failovers,
+            'endpoints': [endpoint.status() for endpoint in self.ranked()],
+        }
+
+
+def build_endpoints():
+    """
+    Endpoints from settings.DEEPSEEK_ENDPOINTS, a list of dicts with 'name',
+    'url' and optional 'api_key'/'model'. Falls back to the single
+    DEEPSEEK_API_URL when the list is empty.
+    """
+    configured = getattr(settings, 'DEEPSEEK_ENDPOINTS', None) or [
+        {'name': 'primary', 'url': settings.DEEPSEEK_API_URL}
+    ]
+    return [
+        Endpoint(
+            name=entry.get('name') or entry['url'],
+            url=entry['url'],
+            api_key=entry.get('api_key'),
+            model=entry.get('model'),
+        )
+        for entry in configured
+    ]
+
+
+def get_endpoint_pool():
+    """Return the process-wide EndpointPool"""
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = EndpointPool(
+                    build_endpoints(),
+                    hedge_percentile=getattr(settings, 'DEEPSEEK_HEDGE_PERCENTILE', 95),
+                    hedge_min_samples=getattr(settings, 'DEEPSEEK_HEDGE_MIN_SAMPLES', 20),
+                )
+    return _pool
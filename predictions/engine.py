@@ -1,19 +1,68 @@
 """
 Prediction Engine: Rule-based prediction logic
 """
-from .deepseek_client import DeepSeekClient
+from django.conf import settings
+from .deepseek_client import get_client, AsyncDeepSeekClient
+from .models import APICounter
+from .surrogate import get_surrogate
+from . import prompts, rules
+import asyncio
+import hashlib
+import json
 import logging
+import math
+import random
+import time
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# Bump whenever the rule logic changes so stored predictions are detected as stale
+ENGINE_VERSION = 1
+# Match fields a prediction depends on (the rules and every prompt); see input_fingerprint()
+INPUT_FIELDS = ('team_a_id', 'team_b_id', 'prob_a', 'prob_b', 'draw_prob', 'odds_a', 'odds_b')
+
 
 class PredictionEngine:
     """Engine for generating predictions using rules and AI"""
     
-    def __init__(self, use_ai=True):
+    def __init__(self, use_ai=True, threshold=0.15, value_threshold=0.10,
+                 balanced_prob_threshold=0.45, balanced_value_margin=0.05):
         self.use_ai = use_ai
-        self.ai_client = DeepSeekClient() if use_ai else None
-        self.threshold = 0.15  # 15% difference threshold for "close" matches
+        self.ai_client = get_client() if use_ai else None
+        self.threshold = threshold  # 15% difference threshold for "close" matches
+        self.value_threshold = value_threshold  # 10% minimum value for "profitable"
+        self.balanced_prob_threshold = balanced_prob_threshold  # 45% probability for "balanced"
+        self.balanced_value_margin = balanced_value_margin  # 5% advantage over the odds for "balanced"
+    
+    @property
+    def version(self):
+        """
+        Engine version, prompt version and thresholds predictions are computed with
+        
+        Stored on Prediction.engine_version; a prediction computed under any
+        other version is stale.
+        """
+        return ':'.join(str(value) for value in (
+            ENGINE_VERSION, prompts.PROMPT_VERSION, self.threshold, self.value_threshold,
+            self.balanced_prob_threshold, self.balanced_value_margin,
+        ))
+    
+    @staticmethod
+    def input_fingerprint(match=None, values=None):
+        """
+        Hash of the match inputs a prediction depends on
+        
+        Args:
+            match: Match instance, or
+            values: Its INPUT_FIELDS values in order, e.g. straight from values_list()
+        """
+        if values is None:
+            values = [getattr(match, field) for field in INPUT_FIELDS]
+        team_a_id, team_b_id, *numbers = values
+        # Normalise so 2 and 2.0 (unsaved form input vs database value) hash the same
+        payload = [int(team_a_id), int(team_b_id), *(float(number) for number in numbers)]
+        return hashlib.sha1(json.dumps(payload).encode()).hexdigest()
     
     def calculate_baseline_prediction(self, match):
         """
@@ -41,7 +90,7 @@ class PredictionEngine:
         # Calculate value: actual_prob - implied_prob
         value_a = match.prob_a - implied_prob_a
         value_b = match.prob_b - implied_prob_b
-        value_threshold = 0.10  # 10% minimum value
+        value_threshold = self.value_threshold
         
         if value_a >= value_threshold and value_a > value_b:
             return '3'  # Team A undervalued
@@ -61,16 +110,16 @@ class PredictionEngine:
         
         # Team A: High actual prob (>45%) AND good odds value (>5% advantage)
         team_a_score = 0
-        if match.prob_a > 0.45:
+        if match.prob_a > self.balanced_prob_threshold:
             team_a_score += 1
-        if match.prob_a > implied_prob_a + 0.05:
+        if match.prob_a > implied_prob_a + self.balanced_value_margin:
             team_a_score += 1
         
         # Team B: High actual prob (>45%) AND good odds value (>5% advantage)
         team_b_score = 0
-        if match.prob_b > 0.45:
+        if match.prob_b > self.balanced_prob_threshold:
             team_b_score += 1
-        if match.prob_b > implied_prob_b + 0.05:
+        if match.prob_b > implied_prob_b + self.balanced_value_margin:
             team_b_score += 1
         
         if team_a_score >= 2 and team_a_score > team_b_score:
@@ -80,34 +129,471 @@ class PredictionEngine:
         else:
             return '1'  # Not clearly aligned
     
-    def generate_prediction(self, match, use_ai=False):
+    def predict_arrays(self, prob_a, prob_b, odds_a, odds_b):
+        """
+        Vectorized baseline, profitable and balanced predictions
+        
+        Applies exactly the same rules as the calculate_* methods to whole
+        arrays of inputs at once.
+        
+        Args:
+            prob_a, prob_b, odds_a, odds_b: Equal-length array-likes of floats
+        
+        Returns:
+            {'baseline': array, 'profitable': array, 'balanced': array} of
+            '3'/'1'/'0' strings
+        """
+        prob_a = np.asarray(prob_a, dtype=float)
+        prob_b = np.asarray(prob_b, dtype=float)
+        implied_prob_a = rules.implied_probability(odds_a)
+        implied_prob_b = rules.implied_probability(odds_b)
+        return {
+            'baseline': rules.baseline(prob_a, prob_b, self.threshold),
+            'profitable': rules.profitable(prob_a, prob_b, implied_prob_a, implied_prob_b, self.value_threshold),
+            'balanced': rules.balanced(
+                prob_a, prob_b, implied_prob_a, implied_prob_b,
+                self.balanced_prob_threshold, self.balanced_value_margin,
+            ),
+        }
+    
+    def rule_predictions(self, match):
+        """The three rule-based predictions keyed by strategy"""
+        return {
+            'baseline': self.calculate_baseline_prediction(match),
+            'profitable': self.calculate_profitable_prediction(match),
+            'balanced': self.calculate_balanced_prediction(match),
+        }
+    
+    def boundary_margins(self, match):
+        """
+        Distance of a match from each strategy's nearest decision boundary
+        
+        Measured in probability units against the thresholds the rules (and
+        the AI prompts) apply: the 15% gap, the 10% value and the 45%/5%
+        alignment cutoffs. A large margin means a small change in the inputs
+        cannot flip the rule's answer.
+        """
+        implied_prob_a = match.implied_prob_a
+        implied_prob_b = match.implied_prob_b
+        value_a = match.prob_a - implied_prob_a
+        value_b = match.prob_b - implied_prob_b
+        
+        profitable = min(abs(value_a - self.value_threshold), abs(value_b - self.value_threshold))
+        if max(value_a, value_b) >= self.value_threshold:
+            profitable = min(profitable, abs(value_a - value_b))
+        
+        return {
+            'baseline': abs(abs(match.prob_a - match.prob_b) - self.threshold),
+            'profitable': profitable,
+            'balanced': min(
+                abs(match.prob_a - self.balanced_prob_threshold),
+                abs(match.prob_a - implied_prob_a - self.balanced_value_margin),
+                abs(match.prob_b - self.balanced_prob_threshold),
+                abs(match.prob_b - implied_prob_b - self.balanced_value_margin),
+            ),
+        }
+    
+    def confident_strategies(self, match):
+        """
+        Strategies whose rule answer lies further than settings.DEEPSEEK_AI_SKIP_MARGIN
+        from every decision boundary, so the AI call for them can be skipped
+        """
+        margin = getattr(settings, 'DEEPSEEK_AI_SKIP_MARGIN', None)
+        if not margin:
+            return set()
+        return {strategy for strategy, distance in self.boundary_margins(match).items() if distance > margin}
+    
+    def local_answers(self, match):
+        """
+        AI answers that can be filled in without an API call
+        
+        Returns (local, shadow). local maps strategy to (digit, source): 'rules'
+        for strategies outside DEEPSEEK_AI_SKIP_MARGIN, then 'surrogate' where
+        the trained surrogate is at least DEEPSEEK_SURROGATE_CONFIDENCE sure.
+        A DEEPSEEK_SURROGATE_SHADOW_RATE share of surrogate answers is still
+        sent to the API to keep measuring agreement; shadow maps those
+        strategies to the surrogate's guess for record_shadow().
+        """
+        local = {}
+        confident = self.confident_strategies(match)
+        if confident:
+            rule_answers = self.rule_predictions(match)
+            local = {strategy: (rule_answers[strategy], 'rules') for strategy in confident}
+        
+        shadow = {}
+        surrogate = get_surrogate()
+        if surrogate is not None and len(local) < 3:
+            threshold = settings.DEEPSEEK_SURROGATE_CONFIDENCE
+            shadow_rate = getattr(settings, 'DEEPSEEK_SURROGATE_SHADOW_RATE', 0.05)
+            for strategy, (digit, confidence) in surrogate.predict(match, engine=self).items():
+                if strategy in local or confidence < threshold:
+                    continue
+                if random.random() < shadow_rate:
+                    shadow[strategy] = digit
+                else:
+                    local[strategy] = (digit, 'surrogate')
+        return local, shadow
+    
+    @staticmethod
+    def record_shadow(shadow, ai_predictions):
+        """Score the surrogate's withheld guesses against the answers DeepSeek gave"""
+        checked = [strategy for strategy in shadow if ai_predictions.get(strategy)]
+        if not checked:
+            return
+        APICounter.increment('surrogate_shadow_checks', len(checked))
+        agreed = sum(1 for strategy in checked if shadow[strategy] == ai_predictions[strategy])
+        if agreed:
+            APICounter.increment('surrogate_shadow_agreements', agreed)
+    
+    @staticmethod
+    def ai_sources(ai_predictions, local=None):
+        """Where each AI column came from: 'rules' or 'surrogate' when filled locally, 'ai' when answered"""
+        local = local or {}
+        sources = {}
+        for strategy, value in ai_predictions.items():
+            if strategy in local:
+                sources[strategy] = local[strategy][1]
+            elif value:
+                sources[strategy] = 'ai'
+        return sources
+    
+    @staticmethod
+    def _count_skipped(local, combined):
+        """Add one match's locally answered strategies (and the calls that saves) to the shared counters"""
+        if not local:
+            return
+        APICounter.increment('ai_skipped_strategies', len(local))
+        calls = len(local) if not combined else (1 if len(local) == 3 else 0)
+        if calls:
+            APICounter.increment('ai_skipped_calls', calls)
+        surrogate_answers = sum(1 for digit, source in local.values() if source == 'surrogate')
+        if surrogate_answers:
+            APICounter.increment('surrogate_answers', surrogate_answers)
+    
+    def generate_ai_predictions(self, match, combined=True, deadline=None, local=None):
+        """
+        Ask DeepSeek for the three AI predictions
+        
+        The per-strategy fallback is skipped once deadline (a
+        resilience.Deadline) is spent. Strategies in local (by default from
+        local_answers(match)) take that (digit, source) answer instead of a call.
+        
+        Returns:
+            (ai_predictions, api_responses) where ai_predictions maps each strategy
+            to a digit (or None) and api_responses holds the full request/response
+            record of every call made, keyed by 'combined' or strategy name
+        """
+        shadow = {}
+        if local is None:
+            local, shadow = self.local_answers(match)
+            self._count_skipped(local, combined)
+        ai_predictions, api_responses = self._request_ai_predictions(match, combined, deadline, local)
+        self.record_shadow(shadow, ai_predictions)
+        return ai_predictions, api_responses
+    
+    def _request_ai_predictions(self, match, combined, deadline, local):
+        """Call DeepSeek for the strategies local does not answer"""
+        ai_predictions = {'baseline': None, 'profitable': None, 'balanced': None}
+        api_responses = {}
+        
+        answers = {strategy: digit for strategy, (digit, source) in local.items()}
+        ai_predictions.update(answers)
+        if len(answers) == len(ai_predictions):
+            return ai_predictions, api_responses
+        
+        if combined:
+            response = self.ai_client.get_full_combined_response(match, deadline=deadline)
+            api_responses['combined'] = response
+            parsed = None
+            if response.get('success'):
+                parsed = self.ai_client.parse_combined_response(response.get('raw_content'))
+            if parsed:
+                return dict(parsed, **answers), api_responses
+            if deadline is not None and deadline.expired():
+                return ai_predictions, api_responses
+            logger.info("Combined AI prediction unavailable, falling back to per-strategy requests")
+        
+        for strategy in ai_predictions:
+            if strategy in answers:
+                continue
+            response = self.ai_client.get_full_prediction_response(match, strategy, deadline=deadline)
+            api_responses[strategy] = response
+            ai_predictions[strategy] = self.ai_client.response_digit(response)
+        return ai_predictions, api_responses
+    
+    async def _generate_ai_predictions_async(self, async_client, match, combined=True, local=None):
+        """
+        Async counterpart of generate_ai_predictions; per-strategy fallbacks run concurrently.
+        local must be worked out beforehand since it may touch the database.
+        """
+        ai_predictions = {'baseline': None, 'profitable': None, 'balanced': None}
+        api_responses = {}
+        
+        answers = {strategy: digit for strategy, (digit, source) in (local or {}).items()}
+        ai_predictions.update(answers)
+        if len(answers) == len(ai_predictions):
+            return ai_predictions, api_responses
+        
+        if combined:
+            response = await async_client.get_full_combined_response(match)
+            api_responses['combined'] = response
+            parsed = None
+            if response.get('success'):
+                parsed = self.ai_client.parse_combined_response(response.get('raw_content'))
+            if parsed:
+                return dict(parsed, **answers), api_responses
+            logger.info("Combined AI prediction unavailable, falling back to per-strategy requests")
+        
+        strategies = [strategy for strategy in ai_predictions if strategy not in answers]
+        responses = await asyncio.gather(*[
+            async_client.get_full_prediction_response(match, strategy) for strategy in strategies
+        ])
+        for strategy, response in zip(strategies, responses):
+            api_responses[strategy] = response
+            ai_predictions[strategy] = self.ai_client.response_digit(response)
+        return ai_predictions, api_responses
+    
+    async def _generate_predictions_bulk_async(self, matches, concurrency, combined, include_responses, locals_):
+        async_client = AsyncDeepSeekClient(concurrency=concurrency, client=self.ai_client)
+        
+        async def run(match):
+            result = self.generate_prediction(match, use_ai=False)
+            local = locals_.get(match.pk, {})
+            try:
+                ai_predictions, api_responses = await self._generate_ai_predictions_async(
+                    async_client, match, combined=combined, local=local
+                )
+                result['ai_baseline'] = ai_predictions['baseline']
+                result['ai_profitable'] = ai_predictions['profitable']
+                result['ai_balanced'] = ai_predictions['balanced']
+                result['ai_sources'] = self.ai_sources(ai_predictions, local)
+            except Exception as e:
+                logger.error(f"Error generating AI predictions for match {match.pk}: {e}")
+                api_responses = {}
+            if include_responses:
+                result['api_responses'] = api_responses
+            return match, result
+        
+        results = {}
+        try:
+            for future in asyncio.as_completed([run(match) for match in matches]):
+                match, result = await future
+                results[match.pk] = result
+        finally:
+            async_client.close()
+        return results, async_client.calls, async_client.call_time
+    
+    def generate_predictions_bulk(self, matches, concurrency=None, combined=None, include_responses=False):
+        """
+        Generate predictions for many matches, fanning the AI calls out concurrently
+        
+        Args:
+            matches: Iterable of Match objects (use select_related('team_a', 'team_b')
+                so prompts can be built without extra queries)
+            concurrency: Maximum DeepSeek calls in flight. Defaults to
+                settings.DEEPSEEK_BULK_CONCURRENCY.
+            combined: Same as generate_prediction
+            include_responses: Same as generate_prediction
+        
+        Returns:
+            (results, stats) where results maps match pk to the generate_prediction
+            dict and stats reports 'matches', 'calls', 'wall_time' and 'call_time'
+            (summed duration of the individual calls) in seconds
+        """
+        if combined is None:
+            combined = getattr(settings, 'DEEPSEEK_COMBINED_PREDICTIONS', True)
+        matches = list(matches)
+        
+        started = time.perf_counter()
+        if self.ai_client and matches and self.ai_client.is_available():
+            # Resolve team names here so worker threads never touch the database
+            locals_, shadows = {}, {}
+            for match in matches:
+                match.team_a, match.team_b
+                locals_[match.pk], shadows[match.pk] = self.local_answers(match)
+                self._count_skipped(locals_[match.pk], combined)
+            results, calls, call_time = asyncio.run(
+                self._generate_predictions_bulk_async(matches, concurrency, combined, include_responses, locals_)
+            )
+            for pk, shadow in shadows.items():
+                result = results[pk]
+                self.record_shadow(shadow, {strategy: result[f'ai_{strategy}'] for strategy in shadow})
+        else:
+            results = {
+                match.pk: self.generate_prediction(match, use_ai=False, include_responses=include_responses)
+                for match in matches
+            }
+            calls, call_time = 0, 0.0
+        wall_time = time.perf_counter() - started
+        
+        stats = {
+            'matches': len(matches),
+            'calls': calls,
+            'wall_time': round(wall_time, 3),
+            'call_time': round(call_time, 3),
+        }
+        logger.info(
+            f"Bulk predictions: {stats['matches']} matches, {calls} calls, "
+            f"{stats['wall_time']}s wall time vs {stats['call_time']}s summed call time"
+        )
+        return results, stats
+    
+    def generate_predictions_packed(self, matches, pack_size=None, include_responses=False, deadline=None):
+        """
+        Generate predictions for many matches, packing several matches into each AI request
+        
+        Matches whose item is missing or malformed in a packed reply are
+        re-queried on their own through generate_ai_predictions.
+        
+        Args:
+            matches: Iterable of Match objects
+            pack_size: Matches per request. Defaults to settings.DEEPSEEK_PACK_SIZE.
+            include_responses: Add 'api_responses' to each result
+            deadline: Optional resilience.Deadline; once spent, no further packs
+                or re-queries are sent and the remaining matches keep rule-only results
+        
+        Matches for which local_answers() covers all three strategies are
+        answered locally and left out of the packs.
+        
+        Returns:
+            (results, stats) where results maps match pk to the generate_prediction
+            dict and stats reports 'matches', 'calls', 'requeried', 'skipped'
+            (past the deadline) and 'confident' (answered from the rules)
+        """
+        pack_size = pack_size or getattr(settings, 'DEEPSEEK_PACK_SIZE', 10)
+        matches = list(matches)
+        results = {
+            match.pk: self.generate_prediction(match, use_ai=False, include_responses=include_responses)
+            for match in matches
+        }
+        stats = {'matches': len(matches), 'calls': 0, 'requeried': 0, 'skipped': 0, 'confident': 0}
+        if not self.ai_client or not self.ai_client.is_available():
+            return results, stats
+        
+        # Only a match answered locally on every strategy saves its place in a pack
+        to_query = []
+        locals_, shadows = {}, {}
+        surrogate_answers = 0
+        for match in matches:
+            local, shadows[match.pk] = self.local_answers(match)
+            locals_[match.pk] = local
+            if len(local) < 3:
+                to_query.append(match)
+                continue
+            result = results[match.pk]
+            for strategy, (digit, source) in local.items():
+                result[f'ai_{strategy}'] = digit
+                surrogate_answers += source == 'surrogate'
+            result['ai_sources'] = {strategy: source for strategy, (digit, source) in local.items()}
+            stats['confident'] += 1
+        if stats['confident']:
+            APICounter.increment('ai_skipped_strategies', 3 * stats['confident'])
+            saved = math.ceil(len(matches) / pack_size) - math.ceil(len(to_query) / pack_size)
+            if saved:
+                APICounter.increment('ai_skipped_calls', saved)
+            if surrogate_answers:
+                APICounter.increment('surrogate_answers', surrogate_answers)
+        matches = to_query
+        
+        failed = []
+        for offset in range(0, len(matches), pack_size):
+            chunk = matches[offset:offset + pack_size]
+            if deadline is not None and deadline.expired():
+                stats['skipped'] += len(chunk)
+                continue
+            try:
+                response = self.ai_client.get_full_packed_response(chunk, deadline=deadline)
+            except Exception as e:
+                logger.error(f"Error generating packed AI predictions: {e}")
+                failed.extend(chunk)
+                continue
+            stats['calls'] += 1
+            
+            parsed = [None] * len(chunk)
+            if response.get('success'):
+                parsed = self.ai_client.parse_packed_response(response.get('raw_content'), len(chunk))
+            for match, ai_predictions in zip(chunk, parsed):
+                if ai_predictions is None:
+                    failed.append(match)
+                    continue
+                self.record_shadow(shadows[match.pk], ai_predictions)
+                local = locals_[match.pk]
+                ai_predictions = dict(ai_predictions, **{strategy: digit for strategy, (digit, source) in local.items()})
+                result = results[match.pk]
+                result['ai_baseline'] = ai_predictions['baseline']
+                result['ai_profitable'] = ai_predictions['profitable']
+                result['ai_balanced'] = ai_predictions['balanced']
+                result['ai_sources'] = self.ai_sources(ai_predictions, local)
+                if include_responses:
+                    result['api_responses'] = {'packed': response}
+        
+        # Re-query only the matches the packed replies did not cover
+        for match in failed:
+            if deadline is not None and deadline.expired():
+                stats['skipped'] += 1
+                continue
+            result = self.generate_prediction(match, use_ai=True, include_responses=True, deadline=deadline)
+            stats['requeried'] += 1
+            stats['calls'] += len(result['api_responses'])
+            if not include_responses:
+                del result['api_responses']
+            results[match.pk] = result
+        
+        logger.info(
+            f"Packed predictions: {stats['matches']} matches in {stats['calls']} calls "
+            f"({stats['requeried']} re-queried individually, {stats['skipped']} skipped past the deadline, "
+            f"{stats['confident']} answered from the rules)"
+        )
+        return results, stats
+    
+    def generate_prediction(self, match, use_ai=False, combined=None, include_responses=False, deadline=None):
         """
         Generate all three prediction types for a match
+        
+        Args:
+            match: Match object
+            use_ai: Also ask DeepSeek for the three AI predictions
+            combined: Ask for all three AI digits in one request, falling back to
+                per-strategy requests if the reply is malformed. Defaults to
+                settings.DEEPSEEK_COMBINED_PREDICTIONS.
+            include_responses: Add an 'api_responses' entry with the full
+                request/response records of the calls that produced the AI digits
+            deadline: Optional resilience.Deadline bounding the AI calls; once it
+                is spent the AI predictions are left as None
         """
+        if combined is None:
+            combined = getattr(settings, 'DEEPSEEK_COMBINED_PREDICTIONS', True)
+        
         # Calculate rule-based predictions
-        baseline = self.calculate_baseline_prediction(match)
-        profitable = self.calculate_profitable_prediction(match)
-        balanced = self.calculate_balanced_prediction(match)
+        rule_answers = self.rule_predictions(match)
         
         # Generate AI predictions if enabled
-        ai_baseline = None
-        ai_profitable = None
-        ai_balanced = None
+        ai_predictions = {'baseline': None, 'profitable': None, 'balanced': None}
+        api_responses = {}
+        local = {}
         
-        if use_ai and self.ai_client:
+        if deadline is not None and deadline.expired():
+            use_ai = False
+        if use_ai and self.ai_client and self.ai_client.is_available():
             try:
-                ai_baseline = self.ai_client.generate_baseline_prediction(match)
-                ai_profitable = self.ai_client.generate_profitable_prediction(match)
-                ai_balanced = self.ai_client.generate_balanced_prediction(match)
+                local, shadow = self.local_answers(match)
+                self._count_skipped(local, combined)
+                ai_predictions, api_responses = self.generate_ai_predictions(
+                    match, combined=combined, deadline=deadline, local=local
+                )
+                self.record_shadow(shadow, ai_predictions)
             except Exception as e:
                 logger.error(f"Error generating AI predictions: {e}")
         
-        return {
-            'baseline': baseline,
-            'profitable': profitable,
-            'balanced': balanced,
-            'ai_baseline': ai_baseline,
-            'ai_profitable': ai_profitable,
-            'ai_balanced': ai_balanced
+        result = {
+            'baseline': rule_answers['baseline'],
+            'profitable': rule_answers['profitable'],
+            'balanced': rule_answers['balanced'],
+            'ai_baseline': ai_predictions['baseline'],
+            'ai_profitable': ai_predictions['profitable'],
+            'ai_balanced': ai_predictions['balanced'],
+            'ai_sources': self.ai_sources(ai_predictions, local),
         }
-
+        if include_responses:
+            result['api_responses'] = api_responses
+        return result
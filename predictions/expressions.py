@@ -0,0 +1,155 @@
+"""
+PredictionEngine's rule strategies as SQL expressions
+
+Lets the database evaluate baseline, profitable and balanced for whole
+querysets: Match.objects.with_rule_predictions() annotates them and
+write_rule_predictions() stores them in Prediction with set-based
+UPDATE and INSERT ... SELECT statements, with no per-row round trips.
+"""
+from django.db import connections, router, transaction
+from django.db.models import Case, CharField, DateTimeField, F, FloatField, IntegerField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Abs
+from django.db.models.lookups import GreaterThan, GreaterThanOrEqual, LessThanOrEqual
+from django.utils import timezone
+from .engine import PredictionEngine
+
+STRATEGIES = ('baseline', 'profitable', 'balanced')
+
+
+def _pick(team_a, team_b):
+    """'3' where team_a holds, else '0' where team_b holds, else '1'"""
+    return Case(
+        When(team_a, then=Value('3')),
+        When(team_b, then=Value('0')),
+        default=Value('1'),
+        output_field=CharField(max_length=1),
+    )
+
+
+def implied_probability(odds):
+    """1 / odds, or 0 for missing odds, as Match.implied_prob_a/b"""
+    return Case(
+        When(GreaterThan(odds, 0), then=Value(1.0) / odds),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def rule_prediction_expressions(engine=None, prefix=''):
+    """
+    {'baseline': expr, 'profitable': expr, 'balanced': expr} matching PredictionEngine
+
+    Args:
+        engine: PredictionEngine whose thresholds to use (default thresholds if None)
+        prefix: Lookup prefix to the Match columns, e.g. 'match__' from Prediction
+    """
+    engine = engine or PredictionEngine(use_ai=False)
+    prob_a, prob_b = F(f'{prefix}prob_a'), F(f'{prefix}prob_b')
+    implied_prob_a = implied_probability(F(f'{prefix}odds_a'))
+    implied_prob_b = implied_probability(F(f'{prefix}odds_b'))
+
+    close = LessThanOrEqual(Abs(prob_a - prob_b), engine.threshold)
+    baseline = Case(
+        When(close, then=Value('1')),
+        When(GreaterThan(prob_a, prob_b), then=Value('3')),
+        default=Value('0'),
+        output_field=CharField(max_length=1),
+    )
+
+    value_a = prob_a - implied_prob_a
+    value_b = prob_b - implied_prob_b
+    profitable = _pick(
+        GreaterThanOrEqual(value_a, engine.value_threshold) & GreaterThan(value_a, value_b),
+        GreaterThanOrEqual(value_b, engine.value_threshold) & GreaterThan(value_b, value_a),
+    )
+
+    def score(prob, implied):
+        return (
+            Case(When(GreaterThan(prob, engine.balanced_prob_threshold), then=1), default=0, output_field=IntegerField())
+            + Case(
+                When(GreaterThan(prob, implied + engine.balanced_value_margin), then=1),
+                default=0,
+                output_field=IntegerField(),
+            )
+        )
+
+    team_a_score = score(prob_a, implied_prob_a)
+    team_b_score = score(prob_b, implied_prob_b)
+    balanced = _pick(
+        GreaterThanOrEqual(team_a_score, 2) & GreaterThan(team_a_score, team_b_score),
+        GreaterThanOrEqual(team_b_score, 2) & GreaterThan(team_b_score, team_a_score),
+    )
+    return {'baseline': baseline, 'profitable': profitable, 'balanced': balanced}
+
+
+def write_rule_predictions(matches, engine=None):
+    """
+    Store the rule predictions for a Match queryset in Prediction, set-based
+
+    Existing predictions whose picks change get one UPDATE with correlated
+    subqueries; matches without one get a single INSERT ... SELECT. As in
+    regenerate_predictions, changed and new rows get updated_at bumped (so
+    the ROI backtest cache sees the new picks) and their accuracy
+    recomputed, and a changed row whose fingerprint no longer matches its
+    match has its engine_version cleared, so stale_rows() still finds its
+    outdated AI answers. AI columns and signals are left untouched.
+
+    Returns:
+        (updated, inserted) row counts
+    """
+    from .engine import INPUT_FIELDS
+    from .models import Prediction
+
+    engine = engine or PredictionEngine(use_ai=False)
+    using = router.db_for_write(Prediction)
+    matches = matches.order_by()
+    annotated = matches.model.objects.filter(pk=OuterRef('match_id')).with_rule_predictions(engine)
+    now = timezone.now()
+
+    with transaction.atomic(using=using):
+        changed = Prediction.objects.using(using).filter(match__in=matches.values('pk')).alias(
+            **{f'new_{strategy}': Subquery(annotated.values(strategy)[:1]) for strategy in STRATEGIES}
+        ).exclude(**{strategy: F(f'new_{strategy}') for strategy in STRATEGIES})
+        # The fingerprint is a hash computed in Python, so rows whose inputs changed
+        # since they were stamped are found before the UPDATE hides their match edit
+        inputs_changed = [
+            pk
+            for pk, fingerprint, *values in changed.filter(engine_version=engine.version).exclude(input_fingerprint='')
+            .values_list('pk', 'input_fingerprint', *(f'match__{field}' for field in INPUT_FIELDS))
+            if fingerprint != engine.input_fingerprint(values=values)
+        ]
+        updated = changed.update(
+            updated_at=now,
+            **{strategy: Subquery(annotated.values(strategy)[:1]) for strategy in STRATEGIES},
+        )
+        Prediction.objects.using(using).filter(pk__in=inputs_changed).update(engine_version='')
+
+        new_rows = matches.filter(predictions__isnull=True).with_rule_predictions(engine).annotate(
+            empty_sources=Value('{}'),
+            unstamped=Value(''),
+            created=Value(now, output_field=DateTimeField()),
+        ).values_list(
+            'pk', 'baseline', 'profitable', 'balanced', 'empty_sources', 'unstamped', 'unstamped', 'created', 'created'
+        )
+        select_sql, params = new_rows.query.get_compiler(using).as_sql()
+
+        opts = Prediction._meta
+        columns = [
+            opts.get_field(name).column
+            for name in (
+                'match', 'baseline', 'profitable', 'balanced', 'ai_sources', 'input_fingerprint', 'engine_version',
+                'created_at', 'updated_at',
+            )
+        ]
+        connection = connections[using]
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {quote(opts.db_table)} ({', '.join(quote(column) for column in columns)}) {select_sql}",
+                params,
+            )
+            inserted = cursor.rowcount
+
+        # New picks can change which pick was scored and whether it was right
+        Prediction.objects.using(using).filter(match__in=matches.values('pk'), updated_at=now).recompute_accuracy()
+    return updated, inserted
@@ -0,0 +1,185 @@
+"""
+Database-backed queue for AI prediction jobs
+
+With PREDICTION_ASYNC_JOBS on, views store rule-based predictions, queue
+the AI work as PredictionJob rows and return at once. `manage.py
+run_prediction_worker` processes claim jobs with a compare-and-set UPDATE
+(so no two workers run the same job, on SQLite or PostgreSQL alike), run
+them on a thread pool and retry failures with jittered exponential
+backoff. AI throughput then scales with the number of worker threads and
+processes rather than with web workers.
+"""
+import logging
+import os
+import random
+import socket
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Min, Q
+from django.utils import timezone
+from . import leases
+from .engine import PredictionEngine
+from .models import AI_STRATEGIES, Prediction, PredictionJob
+
+logger = logging.getLogger(__name__)
+
+
+def async_enabled():
+    """Whether views should queue AI work instead of running it in the request"""
+    return getattr(settings, 'PREDICTION_ASYNC_JOBS', False)
+
+
+def worker_name():
+    """Identifies this process in PredictionJob.claimed_by"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue(matches, source=''):
+    """
+    Queue an AI prediction job for each match that has none pending or running
+
+    Args:
+        matches: Match instances or pks
+        source: What queued the jobs (weekly, batch, generate, admin)
+
+    Returns:
+        Number of jobs queued (a concurrent enqueue of the same match is ignored)
+    """
+    match_ids = {getattr(match, 'pk', match) for match in matches}
+    active = set(
+        PredictionJob.objects.filter(match_id__in=match_ids, status__in=PredictionJob.ACTIVE_STATUSES)
+        .values_list('match_id', flat=True)
+    )
+    jobs = [PredictionJob(match_id=match_id, source=source) for match_id in sorted(match_ids - active)]
+    # The partial unique constraint turns a lost race with another enqueue into a no-op
+    PredictionJob.objects.bulk_create(jobs, ignore_conflicts=True)
+    return len(jobs)
+
+
+def claim(worker, limit=1):
+    """
+    Atomically take up to limit ready jobs for this worker
+
+    Ready means pending and past its backoff, or running but claimed more
+    than PREDICTION_JOB_TIMEOUT seconds ago by a worker that presumably died.
+    """
+    now = timezone.now()
+    stuck_before = now - timedelta(seconds=getattr(settings, 'PREDICTION_JOB_TIMEOUT', 300))
+    ready = (
+        Q(status=PredictionJob.STATUS_PENDING, available_at__lte=now)
+        | Q(status=PredictionJob.STATUS_RUNNING, claimed_at__lt=stuck_before)
+    )
+    # Read a few extra candidates since other workers may take some first
+    candidates = (
+        PredictionJob.objects.filter(ready).order_by('available_at', 'pk')
+        .values_list('pk', 'status', 'claimed_at')[:limit * 2]
+    )
+    claimed = []
+    for pk, status, claimed_at in candidates:
+        if len(claimed) >= limit:
+            break
+        # Compare-and-set: only the worker whose UPDATE still sees the row as read wins it
+        if PredictionJob.objects.filter(pk=pk, status=status, claimed_at=claimed_at).update(
+            status=PredictionJob.STATUS_RUNNING,
+            claimed_by=worker,
+            claimed_at=now,
+            attempts=F('attempts') + 1,
+        ):
+            claimed.append(pk)
+    return list(PredictionJob.objects.filter(pk__in=claimed).select_related('match__team_a', 'match__team_b'))
+
+
+def save_prediction(match, predictions, engine):
+    """
+    Store PredictionEngine.generate_prediction() output for a match
+
+    Rule columns are always written; AI columns only where an answer came
+    back. Returns (prediction, created).
+    """
+    pred, created = Prediction.objects.get_or_create(match=match)
+    pred.match = match
+    pred.baseline = predictions['baseline']
+    pred.profitable = predictions['profitable']
+    pred.balanced = predictions['balanced']
+    refreshed = [field for field in AI_STRATEGIES if predictions.get(field)]
+    for field in refreshed:
+        setattr(pred, field, predictions[field])
+    pred.ai_sources.update(predictions.get('ai_sources') or {})
+    pred.stamp_inputs(engine, refreshed_ai=refreshed)
+    pred.save()
+    if match.actual_result:
+        pred.update_accuracy()
+    return pred, created
+
+
+def run_job(job):
+    """
+    Generate and store the AI predictions for a claimed job
+
+    A job that gets no AI answer at all (API down, breaker open), or whose
+    match is leased by a request generating it right now, goes back to
+    pending with backoff until PREDICTION_JOB_MAX_ATTEMPTS is reached.
+    Returns True when the job is done.
+    """
+    mine = PredictionJob.objects.filter(
+        pk=job.pk, status=PredictionJob.STATUS_RUNNING, claimed_by=job.claimed_by, claimed_at=job.claimed_at
+    )
+    try:
+        engine = PredictionEngine(use_ai=True)
+        with leases.single_flight([job.match]) as leased:
+            if not leased:
+                raise RuntimeError("Match is being generated by another request")
+            # A web request may have filled in the AI predictions since the job was queued
+            current = Prediction.objects.filter(match=job.match).first()
+            if current:
+                current.match = job.match
+            if not (current and current.ai_profitable and current.ai_balanced and not current.is_stale(engine)):
+                predictions = engine.generate_prediction(job.match, use_ai=True)
+                if not any(predictions[field] for field in AI_STRATEGIES):
+                    raise RuntimeError("No AI prediction returned")
+                save_prediction(job.match, predictions, engine)
+    except Exception as e:
+        now = timezone.now()
+        if job.attempts >= getattr(settings, 'PREDICTION_JOB_MAX_ATTEMPTS', 5):
+            logger.error(f"Prediction job {job.pk} for match {job.match_id} failed after {job.attempts} attempts: {e}")
+            mine.update(status=PredictionJob.STATUS_FAILED, finished_at=now, last_error=str(e)[:1000])
+        else:
+            delay = getattr(settings, 'PREDICTION_JOB_BACKOFF', 10) * 2 ** (job.attempts - 1) * random.uniform(0.5, 1.0)
+            logger.warning(f"Prediction job {job.pk} for match {job.match_id} failed, retrying in {delay:.0f}s: {e}")
+            mine.update(
+                status=PredictionJob.STATUS_PENDING,
+                available_at=now + timedelta(seconds=delay),
+                last_error=str(e)[:1000],
+            )
+        return False
+    mine.update(status=PredictionJob.STATUS_DONE, finished_at=timezone.now(), last_error='')
+    return True
+
+
+def queue_stats(window=300):
+    """
+    Queue depth, throughput and job age for monitoring
+
+    Args:
+        window: Seconds of finished jobs that jobs_per_second and avg_turnaround_seconds
+            (queued to done) cover
+    """
+    now = timezone.now()
+    counts = dict(PredictionJob.objects.order_by().values_list('status').annotate(total=Count('id')))
+    oldest = PredictionJob.objects.filter(status=PredictionJob.STATUS_PENDING).aggregate(oldest=Min('created_at'))['oldest']
+    recent = PredictionJob.objects.filter(status=PredictionJob.STATUS_DONE, finished_at__gte=now - timedelta(seconds=window))
+    recent_stats = recent.aggregate(
+        total=Count('id'),
+        duration=Avg(ExpressionWrapper(F('finished_at') - F('created_at'), output_field=DurationField())),
+    )
+    return {
+        'depth': counts.get(PredictionJob.STATUS_PENDING, 0),
+        'ready': PredictionJob.objects.filter(status=PredictionJob.STATUS_PENDING, available_at__lte=now).count(),
+        'running': counts.get(PredictionJob.STATUS_RUNNING, 0),
+        'done': counts.get(PredictionJob.STATUS_DONE, 0),
+        'failed': counts.get(PredictionJob.STATUS_FAILED, 0),
+        'oldest_pending_seconds': round((now - oldest).total_seconds(), 1) if oldest else None,
+        'jobs_per_second': round(recent_stats['total'] / window, 3),
+        'avg_turnaround_seconds': round(recent_stats['duration'].total_seconds(), 2) if recent_stats['duration'] else None,
+        'window_seconds': window,
+    }
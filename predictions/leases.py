@@ -0,0 +1,87 @@
+"""
+Single-flight leases for prediction generation
+
+Before calling DeepSeek for a match, a request or worker takes the match's
+PredictionLease row. The unique match column makes exactly one concurrent
+INSERT win, in any number of processes, so only the holder generates and
+writes the prediction; everyone else waits for its result (or serves the
+rule-based picks). Leases expire after PREDICTION_LEASE_TTL seconds so a
+crashed holder never blocks a match for long.
+"""
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from .models import PredictionLease
+
+
+def acquire(matches, owner, ttl=None):
+    """
+    Take the lease on each match that nobody else holds
+
+    Args:
+        matches: Match instances or pks
+        owner: Token identifying the holder
+        ttl: Seconds until the lease expires (default PREDICTION_LEASE_TTL)
+
+    Returns:
+        Set of match pks now leased to owner
+    """
+    match_ids = {getattr(match, 'pk', match) for match in matches}
+    if not match_ids:
+        return set()
+    now = timezone.now()
+    ttl = ttl if ttl is not None else getattr(settings, 'PREDICTION_LEASE_TTL', 120)
+    # Expired leases go first; a lease taken over meanwhile is not expired and survives this
+    PredictionLease.objects.filter(match_id__in=match_ids, expires_at__lte=now).delete()
+    PredictionLease.objects.bulk_create(
+        [PredictionLease(match_id=match_id, owner=owner, expires_at=now + timedelta(seconds=ttl)) for match_id in match_ids],
+        ignore_conflicts=True,
+    )
+    return set(PredictionLease.objects.filter(match_id__in=match_ids, owner=owner).values_list('match_id', flat=True))
+
+
+def release(matches, owner):
+    """Give up the owner's leases; leases another holder has taken over are left alone"""
+    match_ids = {getattr(match, 'pk', match) for match in matches}
+    if match_ids:
+        PredictionLease.objects.filter(match_id__in=match_ids, owner=owner).delete()
+
+
+def wait(matches, timeout=None, poll_interval=0.1):
+    """
+    Wait until other holders release (or let expire) the leases on these matches
+
+    Returns:
+        Set of match pks still leased when the timeout ran out
+    """
+    match_ids = {getattr(match, 'pk', match) for match in matches}
+    timeout = timeout if timeout is not None else getattr(settings, 'PREDICTION_LEASE_WAIT', 5)
+    give_up = time.monotonic() + timeout
+    while match_ids:
+        match_ids = set(
+            PredictionLease.objects.filter(match_id__in=match_ids, expires_at__gt=timezone.now())
+            .values_list('match_id', flat=True)
+        )
+        if not match_ids or time.monotonic() >= give_up:
+            break
+        time.sleep(min(poll_interval, max(give_up - time.monotonic(), 0)))
+    return match_ids
+
+
+@contextmanager
+def single_flight(matches, ttl=None):
+    """
+    Lease the given matches for the duration of the block
+
+    Yields the set of match pks this caller won and should generate; the
+    rest are being generated by someone else (see wait()).
+    """
+    owner = uuid.uuid4().hex
+    acquired = acquire(matches, owner, ttl)
+    try:
+        yield acquired
+    finally:
+        release(acquired, owner)
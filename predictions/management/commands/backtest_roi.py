@@ -0,0 +1,65 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from predictions import backtest
+from predictions.models import Prediction
+
+
+def _rounded(value, digits):
+    """value rounded to the printed precision, so a tiny loss prints as +0.00, not -0.00"""
+    return round(value, digits) + 0.0
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay stored predictions of settled matches as bets at the stored odds and report "
+        "flat- and proportional-stake ROI, drawdown and hit rate per strategy"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--strategy', action='append', choices=backtest.BET_STRATEGIES,
+            help="Strategy column to replay (repeatable, default all)"
+        )
+        parser.add_argument('--league', help="League/competition (game title), case-insensitive exact match")
+        parser.add_argument('--week', type=int, help="Week number (1-53)")
+        parser.add_argument(
+            '--stake-fraction', type=float, default=backtest.DEFAULT_STAKE_FRACTION,
+            help="Share of the bankroll staked per bet for proportional staking"
+        )
+
+    def handle(self, *args, **options):
+        if not 0 < options['stake_fraction'] < 1:
+            raise CommandError("--stake-fraction must be between 0 and 1")
+
+        predictions = Prediction.objects.all()
+        if options['league']:
+            predictions = predictions.filter(match__game_title__iexact=options['league'])
+        if options['week']:
+            predictions = predictions.filter(match__week_number=options['week'])
+
+        started = time.perf_counter()
+        data = backtest.load_bets(predictions)
+        loaded = time.perf_counter() - started
+        report = backtest.roi_report(
+            data, options['strategy'] or backtest.BET_STRATEGIES, options['stake_fraction']
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{len(data['actual'])} settled matches (loaded in {loaded:.2f}s, total {elapsed:.2f}s), "
+            f"proportional stake {options['stake_fraction']:.1%}\n"
+        )
+
+        self.stdout.write(
+            f"{'strategy':<14} {'bets':>8} {'hit rate':>9} {'flat ROI':>9} {'profit':>10} {'drawdown':>9} "
+            f"{'prop ROI':>9} {'bankroll':>10} {'drawdown':>9}"
+        )
+        for strategy, row in report.items():
+            if not row['bets']:
+                self.stdout.write(f"{strategy:<14} {0:>8}  (no bets)")
+                continue
+            self.stdout.write(
+                f"{strategy:<14} {row['bets']:>8} {row['hit_rate']:>9.2%} {_rounded(row['flat_roi'], 4):>+9.2%} "
+                f"{_rounded(row['flat_profit'], 2):>+10.2f} {row['flat_max_drawdown']:>9.2f} "
+                f"{_rounded(row['proportional_roi'], 4):>+9.2%} {row['proportional_bankroll']:>9.3g}x "
+                f"{row['proportional_max_drawdown']:>9.2%}"
+            )
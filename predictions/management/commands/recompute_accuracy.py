@@ -0,0 +1,55 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from predictions.models import Prediction
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute is_correct and prediction_type_used for the predictions of settled matches "
+        "with one set-based UPDATE"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--league', help="League/competition (game title), case-insensitive exact match")
+        parser.add_argument('--week', type=int, help="Week number (1-53)")
+        parser.add_argument(
+            '--verify', action='store_true',
+            help="Also run Prediction.update_accuracy() row by row (rolled back) and fail on any difference"
+        )
+
+    def handle(self, *args, **options):
+        predictions = Prediction.objects.all()
+        if options['league']:
+            predictions = predictions.filter(match__game_title__iexact=options['league'])
+        if options['week']:
+            predictions = predictions.filter(match__week_number=options['week'])
+
+        expected = self._per_row_results(predictions) if options['verify'] else None
+
+        started = time.perf_counter()
+        updated = predictions.recompute_accuracy()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Recomputed accuracy of {updated} predictions in {elapsed:.2f}s"))
+
+        if expected is not None:
+            actual = self._results(predictions)
+            mismatches = [pk for pk in expected.keys() | actual.keys() if expected.get(pk) != actual.get(pk)]
+            if mismatches:
+                for pk in sorted(mismatches)[:20]:
+                    self.stderr.write(f"Prediction {pk}: per-row {expected.get(pk)}, set-based {actual.get(pk)}")
+                raise CommandError(f"{len(mismatches)} predictions differ from Prediction.update_accuracy()")
+            self.stdout.write(self.style.SUCCESS(f"Verified {len(expected)} predictions against update_accuracy()"))
+
+    @staticmethod
+    def _results(predictions):
+        return {pk: (is_correct, used) for pk, is_correct, used in predictions.values_list('pk', 'is_correct', 'prediction_type_used')}
+
+    def _per_row_results(self, predictions):
+        """What update_accuracy() stores for each prediction, computed in a rolled-back transaction"""
+        with transaction.atomic():
+            for pred in predictions.select_related('match').iterator(chunk_size=2000):
+                pred.update_accuracy()
+            results = self._results(predictions)
+            transaction.set_rollback(True)
+        return results
@@ -0,0 +1,141 @@
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+from predictions.engine import PredictionEngine
+from predictions.models import AI_STRATEGIES, Prediction
+
+STRATEGIES = ('baseline', 'profitable', 'balanced')
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute only the predictions whose match inputs or engine/prompt version changed since they "
+        "were computed. Candidates are found in SQL and confirmed against the input fingerprint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--league', help="League/competition (game title), case-insensitive exact match")
+        parser.add_argument('--week', type=int, help="Week number (1-53)")
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Predictions per chunk and transaction")
+        parser.add_argument(
+            '--ai', action='store_true',
+            help="Also ask DeepSeek again for stale predictions (otherwise their AI answers are cleared)"
+        )
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be refreshed")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be positive")
+
+        predictions = Prediction.objects.all()
+        if options['league']:
+            predictions = predictions.filter(match__game_title__iexact=options['league'])
+        if options['week']:
+            predictions = predictions.filter(match__week_number=options['week'])
+
+        engine = PredictionEngine(use_ai=False)
+        ai_engine = PredictionEngine(use_ai=True) if options['ai'] and not options['dry_run'] else None
+        totals = {'current': 0, 'unstamped': 0, 'stale': 0, 'ai': 0}
+        started = time.perf_counter()
+
+        # Walk pk ranges so each chunk is one indexed query and memory stays bounded
+        bounds = predictions.aggregate(first=Min('pk'), last=Max('pk'))
+        if bounds['first'] is not None:
+            for start in range(bounds['first'], bounds['last'] + 1, chunk_size):
+                chunk = predictions.filter(pk__gte=start, pk__lt=start + chunk_size)
+                by_state = defaultdict(list)
+                for pk, _, state in chunk.stale_rows(engine):
+                    by_state[state].append(pk)
+                for state, pks in by_state.items():
+                    totals[state] += len(pks)
+                if not options['dry_run'] and by_state:
+                    totals['ai'] += self._refresh_chunk(engine, ai_engine, by_state)
+
+        elapsed = time.perf_counter() - started
+        verb = 'Would refresh' if options['dry_run'] else 'Refreshed'
+        message = (
+            f"{verb} {totals['stale']} stale predictions in {elapsed:.2f}s "
+            f"({totals['unstamped']} never fingerprinted, {totals['current']} with edited matches but unchanged inputs)"
+        )
+        if ai_engine:
+            message += f"; {totals['ai']} got new AI predictions"
+        self.stdout.write(self.style.SUCCESS(message))
+
+    def _refresh_chunk(self, engine, ai_engine, by_state):
+        """
+        Write one chunk: recompute the rule columns of stale and
+        never-fingerprinted rows (a legacy row may come from old inputs or
+        thresholds) before stamping them, and touch confirmed-unchanged rows
+        so they stop being candidates. Never-fingerprinted rows keep their AI
+        answers, as stamp_inputs() does. Returns how many rows got new AI
+        predictions.
+        """
+        stale_ids = set(by_state['stale'])
+        recomputed_ids = stale_ids | set(by_state['unstamped'])
+        preds = list(
+            Prediction.objects.filter(pk__in=recomputed_ids)
+            .select_related('match__team_a', 'match__team_b')
+        )
+
+        # AI calls happen before the transaction so no write lock is held while waiting on the API
+        generated = {}
+        stale_matches = [pred.match for pred in preds if pred.pk in stale_ids]
+        if ai_engine and stale_matches:
+            if getattr(settings, 'DEEPSEEK_PACKED_PREDICTIONS', False):
+                generated, _ = ai_engine.generate_predictions_packed(stale_matches)
+            else:
+                generated, _ = ai_engine.generate_predictions_bulk(stale_matches)
+
+        now = timezone.now()
+        refreshed_ai = 0
+        for pred in preds:
+            for strategy, value in engine.rule_predictions(pred.match).items():
+                setattr(pred, strategy, value)
+            predictions = generated.get(pred.match_id, {})
+            refreshed = [field for field in AI_STRATEGIES if predictions.get(field)]
+            for field in refreshed:
+                setattr(pred, field, predictions[field])
+            pred.ai_sources.update({
+                strategy: source for strategy, source in (predictions.get('ai_sources') or {}).items()
+                if f'ai_{strategy}' in refreshed
+            })
+            refreshed_ai += bool(refreshed)
+            pred.stamp_inputs(engine, refreshed_ai=refreshed)
+            pred.updated_at = now
+
+        with transaction.atomic():
+            Prediction.objects.filter(pk__in=by_state['current']).update(updated_at=now)
+            self._write_rows(
+                preds, [*STRATEGIES, *AI_STRATEGIES, 'ai_sources', 'input_fingerprint', 'engine_version', 'updated_at']
+            )
+
+        # Rule and AI columns changed, so is_correct may have too
+        Prediction.objects.filter(pk__in=recomputed_ids).recompute_accuracy()
+        return refreshed_ai
+
+    @staticmethod
+    def _write_rows(preds, field_names):
+        """
+        Save the given fields of each prediction with one prepared UPDATE run
+        through executemany(); bulk_update()'s CASE WHEN per column is
+        quadratic on SQLite and far slower for thousands of distinct rows
+        """
+        using = router.db_for_write(Prediction)
+        connection = connections[using]
+        opts = Prediction._meta
+        fields = [opts.get_field(name) for name in field_names]
+        quote = connection.ops.quote_name
+        assignments = ', '.join(f"{quote(field.column)} = %s" for field in fields)
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"UPDATE {quote(opts.db_table)} SET {assignments} WHERE {quote(opts.pk.column)} = %s",
+                [
+                    [field.get_db_prep_save(getattr(pred, field.attname), connection) for field in fields] + [pred.pk]
+                    for pred in preds
+                ],
+            )
@@ -0,0 +1,145 @@
+import time
+from collections import defaultdict
+from datetime import datetime, time as dt_time, timedelta
+from itertools import islice
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from matches.models import Match
+from predictions.engine import INPUT_FIELDS, PredictionEngine
+from predictions.models import Prediction
+
+STRATEGIES = ('baseline', 'profitable', 'balanced')
+
+
+class Command(BaseCommand):
+    help = (
+        "Regenerate rule-based predictions for many matches in bounded memory: matches are streamed "
+        "in chunks, predicted with PredictionEngine.predict_arrays and written with bulk_create "
+        "and grouped set-based updates"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', help="First match date (YYYY-MM-DD)")
+        parser.add_argument('--to', dest='date_to', help="Last match date, inclusive (YYYY-MM-DD)")
+        parser.add_argument('--league', help="League/competition (game title), case-insensitive exact match")
+        parser.add_argument('--country', help="Country, case-insensitive exact match")
+        parser.add_argument('--week', type=int, help="Week number (1-53)")
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Matches per chunk and transaction")
+        parser.add_argument('--dry-run', action='store_true', help="Compute and count changes without writing")
+
+    def _date(self, value, option):
+        try:
+            day = datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f"{option} must be a date in YYYY-MM-DD format, got {value!r}")
+        return timezone.make_aware(datetime.combine(day, dt_time.min))
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be positive")
+
+        matches = Match.objects.all()
+        if options['date_from']:
+            matches = matches.filter(date__gte=self._date(options['date_from'], '--from'))
+        if options['date_to']:
+            matches = matches.filter(date__lt=self._date(options['date_to'], '--to') + timedelta(days=1))
+        if options['league']:
+            matches = matches.filter(game_title__iexact=options['league'])
+        if options['country']:
+            matches = matches.filter(country__iexact=options['country'])
+        if options['week']:
+            matches = matches.filter(week_number=options['week'])
+
+        rows = matches.order_by('pk').values_list('pk', *INPUT_FIELDS).iterator(chunk_size=chunk_size)
+        engine = PredictionEngine(use_ai=False)
+        totals = {'matches': 0, 'created': 0, 'updated': 0, 'unchanged': 0}
+        started = time.perf_counter()
+
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            pks, inputs = zip(*((pk, values) for pk, *values in chunk))
+            columns = dict(zip(INPUT_FIELDS, zip(*inputs)))
+            predicted = engine.predict_arrays(columns['prob_a'], columns['prob_b'], columns['odds_a'], columns['odds_b'])
+            counts = self._write_chunk(engine, pks, inputs, predicted, options['dry_run'])
+            totals['matches'] += len(chunk)
+            for key, value in counts.items():
+                totals[key] += value
+
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{totals['matches']} matches, {totals['matches'] / elapsed:,.0f} rows/s", ending='\r'
+            )
+            self.stdout.flush()
+
+        elapsed = time.perf_counter() - started
+        rate = totals['matches'] / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Would regenerate' if options['dry_run'] else 'Regenerated'} {totals['matches']} matches in "
+            f"{elapsed:.2f}s ({rate:,.0f} rows/s): {totals['created']} created, "
+            f"{totals['updated']} updated, {totals['unchanged']} unchanged"
+        ))
+
+    def _write_chunk(self, engine, pks, inputs, predicted, dry_run):
+        """
+        Create or update the predictions for one chunk in a single transaction
+
+        New predictions are stamped with their input fingerprint; updated ones
+        keep theirs and get updated_at bumped (so the ROI backtest cache sees
+        the new picks) and their accuracy recomputed. An updated prediction
+        whose fingerprint no longer matches its match has its engine_version
+        cleared: the bumped updated_at would otherwise hide the match edit
+        from stale_candidates(), and refresh_predictions must still find its
+        outdated AI answers.
+        """
+        counts = {'created': 0, 'updated': 0, 'unchanged': 0}
+        version = engine.version
+        with transaction.atomic():
+            existing = {
+                match_id: (tuple(values), (fingerprint, stamped_version))
+                for match_id, fingerprint, stamped_version, *values in (
+                    Prediction.objects.filter(match_id__in=pks)
+                    .values_list('match_id', 'input_fingerprint', 'engine_version', *STRATEGIES)
+                )
+            }
+            to_create = []
+            # At most 27 distinct (baseline, profitable, balanced) triples, so changed
+            # rows are grouped by their new values and updated one triple at a time
+            to_update = defaultdict(list)
+            inputs_changed = []
+            rows = zip(pks, inputs, zip(*(predicted[strategy].tolist() for strategy in STRATEGIES)))
+            for pk, match_inputs, values in rows:
+                fingerprint = engine.input_fingerprint(values=match_inputs)
+                if pk not in existing:
+                    to_create.append(Prediction(
+                        match_id=pk,
+                        input_fingerprint=fingerprint,
+                        engine_version=version,
+                        **dict(zip(STRATEGIES, values)),
+                    ))
+                    continue
+                current, (stamped_fingerprint, stamped_version) = existing[pk]
+                if current != values:
+                    to_update[values].append(pk)
+                    if stamped_fingerprint and stamped_version == version and stamped_fingerprint != fingerprint:
+                        inputs_changed.append(pk)
+                else:
+                    counts['unchanged'] += 1
+
+            if not dry_run:
+                Prediction.objects.bulk_create(to_create)
+                now = timezone.now()
+                for values, match_ids in to_update.items():
+                    Prediction.objects.filter(match_id__in=match_ids).update(updated_at=now, **dict(zip(STRATEGIES, values)))
+                Prediction.objects.filter(match_id__in=inputs_changed).update(engine_version='')
+                # New rule picks can change which pick was scored and whether it was right
+                Prediction.objects.filter(
+                    match_id__in=[pk for match_ids in to_update.values() for pk in match_ids]
+                    + [pred.match_id for pred in to_create]
+                ).recompute_accuracy()
+        counts['created'] = len(to_create)
+        counts['updated'] = sum(len(match_ids) for match_ids in to_update.values())
+        return counts
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from predictions.stub_server import StubConfig, make_server
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local stand-in for the DeepSeek chat-completions API. Point the client at it with "
+        "DEEPSEEK_API_URL=http://HOST:PORT/v1/chat/completions"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8001)
+        parser.add_argument('--latency', type=float, default=300.0, help="Median latency in milliseconds")
+        parser.add_argument(
+            '--latency-dist', default='lognormal', choices=StubConfig.LATENCY_DISTRIBUTIONS,
+            help="Latency distribution around the median"
+        )
+        parser.add_argument(
+            '--latency-spread', type=float, default=0.5,
+            help="Sigma for lognormal, or +/- fraction of the median for uniform"
+        )
+        parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+        parser.add_argument('--burst-every', type=float, default=0.0, help="Seconds between 429 bursts (0 disables)")
+        parser.add_argument('--burst-length', type=float, default=0.0, help="Length of each 429 burst in seconds")
+        parser.add_argument('--seed', type=int, default=None, help="Random seed for reproducible runs")
+
+    def handle(self, *args, **options):
+        try:
+            config = StubConfig(
+                latency_ms=options['latency'],
+                latency_dist=options['latency_dist'],
+                latency_spread=options['latency_spread'],
+                error_rate=options['error_rate'],
+                burst_every=options['burst_every'],
+                burst_length=options['burst_length'],
+                seed=options['seed'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        
+        server = make_server(options['host'], options['port'], config)
+        url = f"http://{options['host']}:{server.server_port}/v1/chat/completions"
+        self.stdout.write(self.style.SUCCESS(f"DeepSeek stub listening on {url}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,103 @@
+import signal
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+from predictions import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued AI prediction jobs (PredictionJob) on a thread pool. Start several processes to "
+        "scale out; jobs are claimed atomically so each runs once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads', type=int, default=getattr(settings, 'PREDICTION_WORKER_THREADS', 4),
+            help="Jobs run concurrently by this process"
+        )
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds between polls of an empty queue")
+        parser.add_argument('--stats-interval', type=float, default=30.0, help="Seconds between queue status lines")
+        parser.add_argument('--once', action='store_true', help="Exit once no job is ready and none is running")
+        parser.add_argument('--max-jobs', type=int, help="Exit after claiming this many jobs")
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        if threads < 1:
+            raise CommandError("--threads must be positive")
+        worker = jobs.worker_name()
+        stopping = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+
+        self.stdout.write(f"Prediction worker {worker} running {threads} threads")
+        claimed_total = 0
+        results = {True: 0, False: 0}
+        running = set()
+        last_stats = time.monotonic()
+        executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='prediction-job')
+        try:
+            while not stopping.is_set():
+                done = {future for future in running if future.done()}
+                for future in done:
+                    results[future.result()] += 1
+                running -= done
+
+                free = threads - len(running)
+                if options['max_jobs'] is not None:
+                    free = min(free, options['max_jobs'] - claimed_total)
+                claimed = []
+                if free > 0:
+                    try:
+                        claimed = jobs.claim(worker, free)
+                    except DatabaseError as e:
+                        # e.g. SQLite "database is locked" under write contention; try again next poll
+                        self.stderr.write(f"Could not claim jobs: {e}")
+                for job in claimed:
+                    running.add(executor.submit(self._run, job))
+                claimed_total += len(claimed)
+
+                if time.monotonic() - last_stats >= options['stats_interval']:
+                    self._write_stats(results)
+                    last_stats = time.monotonic()
+
+                limit_reached = options['max_jobs'] is not None and claimed_total >= options['max_jobs']
+                if (options['once'] or limit_reached) and not claimed and not running:
+                    break
+                if not claimed:
+                    if running:
+                        wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                    else:
+                        stopping.wait(options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping: waiting for running jobs to finish")
+        finally:
+            executor.shutdown(wait=True)
+            for future in running:
+                if future.done() and not future.cancelled():
+                    results[future.result()] += 1
+
+        self._write_stats(results)
+        self.stdout.write(self.style.SUCCESS(f"Worker {worker} stopped: {results[True]} done, {results[False]} failed attempts"))
+
+    @staticmethod
+    def _run(job):
+        try:
+            return jobs.run_job(job)
+        except Exception:
+            return False
+        finally:
+            # Pool threads outlive the job; don't keep a connection open per idle thread
+            connection.close()
+
+    def _write_stats(self, results):
+        stats = jobs.queue_stats()
+        oldest = stats['oldest_pending_seconds']
+        self.stdout.write(
+            f"queue: {stats['depth']} pending ({stats['ready']} ready), {stats['running']} running, "
+            f"{stats['failed']} failed; {stats['jobs_per_second']} jobs/s over {stats['window_seconds']}s; "
+            f"oldest pending {f'{oldest:.0f}s' if oldest is not None else '-'}; "
+            f"this worker: {results[True]} done, {results[False]} failed attempts"
+        )
@@ -0,0 +1,97 @@
+import csv
+import time
+from django.core.management.base import BaseCommand, CommandError
+from matches.models import Match
+from predictions import backtest
+from predictions.engine import PredictionEngine
+
+
+class Command(BaseCommand):
+    help = (
+        "Backtest grids of rule thresholds against settled matches and report the most accurate "
+        "configuration of each strategy, evaluated in parallel worker processes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--strategy', action='append', choices=list(backtest.STRATEGY_PARAMETERS),
+            help="Strategy to sweep (repeatable, default all)"
+        )
+        parser.add_argument(
+            '--grid', action='append', default=[], metavar='PARAMETER=START:STOP:STEP',
+            help=f"Override a parameter's grid, one of {', '.join(backtest.DEFAULT_GRIDS)} (repeatable)"
+        )
+        parser.add_argument('--league', help="League/competition (game title), case-insensitive exact match")
+        parser.add_argument('--workers', type=int, help="Worker processes (default: CPU count, 1 = in-process)")
+        parser.add_argument('--top', type=int, default=5, help="Configurations to show per strategy")
+        parser.add_argument('--output', help="Write every evaluated configuration to this CSV file")
+
+    def _grids(self, specs):
+        grids = {}
+        for spec in specs:
+            name, _, bounds = spec.partition('=')
+            if name not in backtest.DEFAULT_GRIDS:
+                raise CommandError(f"Unknown grid parameter {name!r}")
+            try:
+                start, stop, step = (float(value) for value in bounds.split(':'))
+            except ValueError:
+                raise CommandError(f"--grid must look like {name}=START:STOP:STEP, got {spec!r}")
+            if step <= 0 or stop < start:
+                raise CommandError(f"--grid {spec!r} needs a positive step and STOP >= START")
+            grids[name] = backtest.grid(start, stop, step)
+        return grids
+
+    def handle(self, *args, **options):
+        if options['workers'] is not None and options['workers'] < 1:
+            raise CommandError("--workers must be positive")
+        grids = self._grids(options['grid'])
+        strategies = options['strategy'] or list(backtest.STRATEGY_PARAMETERS)
+
+        matches = Match.objects.all()
+        if options['league']:
+            matches = matches.filter(game_title__iexact=options['league'])
+        started = time.perf_counter()
+        data = backtest.load_settled(matches)
+        total = len(data['actual'])
+        if not total:
+            raise CommandError("No settled matches to backtest")
+        self.stdout.write(f"Loaded {total} settled matches in {time.perf_counter() - started:.2f}s")
+
+        started = time.perf_counter()
+        results = backtest.sweep(data, strategies=strategies, grids=grids, workers=options['workers'])
+        elapsed = time.perf_counter() - started
+        evaluated = sum(len(rows) for rows in results.values())
+        self.stdout.write(
+            f"Evaluated {evaluated} configurations in {elapsed:.2f}s ({evaluated / elapsed:,.0f}/s)\n"
+        )
+
+        engine = PredictionEngine(use_ai=False)
+        for strategy, rows in backtest.best(results, options['top']).items():
+            names = backtest.STRATEGY_PARAMETERS[strategy]
+            current = {name: getattr(engine, name) for name in names}
+            correct = int((backtest.predict(data, strategy, current) == data['actual']).sum())
+            self.stdout.write(self.style.MIGRATE_HEADING(strategy))
+            self.stdout.write(f"  current  {self._params(current)}: {correct / total:.2%} ({correct}/{total})")
+            for rank, row in enumerate(rows, 1):
+                gain = row['accuracy'] - correct / total
+                self.stdout.write(
+                    f"  #{rank:<7} {self._params(row['params'])}: {row['accuracy']:.2%} "
+                    f"({row['correct']}/{total}, {gain:+.2%})"
+                )
+
+        if options['output']:
+            with open(options['output'], 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['strategy', *backtest.DEFAULT_GRIDS, 'correct', 'total', 'accuracy'])
+                for strategy, rows in results.items():
+                    for row in rows:
+                        writer.writerow([
+                            strategy,
+                            *(row['params'].get(name, '') for name in backtest.DEFAULT_GRIDS),
+                            row['correct'], total, f"{row['accuracy']:.6f}",
+                        ])
+            self.stdout.write(self.style.SUCCESS(f"\nWrote {evaluated} rows to {options['output']}"))
+
+    @staticmethod
+    def _params(params):
+        return ', '.join(f"{name}={value:g}" for name, value in params.items())
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from predictions import surrogate
+
+
+class Command(BaseCommand):
+    help = (
+        "Train the local surrogate that predicts DeepSeek's answers from match inputs, "
+        "using the AI predictions stored in the Prediction table, and report its agreement with the API"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--holdout', type=float, default=0.2, help="Fraction of answers held out for scoring")
+        parser.add_argument('--min-samples', type=int, default=50, help="Minimum stored answers to train a strategy")
+        parser.add_argument(
+            '--threshold', type=float, default=None,
+            help="Confidence to report coverage at (default DEEPSEEK_SURROGATE_CONFIDENCE, else 0.9)"
+        )
+        parser.add_argument('--iterations', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--dry-run', action='store_true', help="Report agreement without saving the models")
+
+    def handle(self, *args, **options):
+        reports = surrogate.train(
+            holdout=options['holdout'],
+            min_samples=options['min_samples'],
+            threshold=options['threshold'],
+            seed=options['seed'],
+            save=not options['dry_run'],
+            iterations=options['iterations'],
+        )
+        for strategy, report in reports.items():
+            if not report['trained']:
+                self.stdout.write(self.style.WARNING(
+                    f"{strategy}: only {report['samples']} stored answers, not trained"
+                ))
+                continue
+            confident = report['confident_agreement']
+            self.stdout.write(
+                f"{strategy}: {report['samples']} answers, holdout agreement {report['agreement']:.1%}; "
+                f"{report['coverage']:.1%} of holdout at confidence >= {report['threshold']} "
+                f"with agreement {'-' if confident is None else f'{confident:.1%}'}"
+            )
+        if options['dry_run']:
+            self.stdout.write("Dry run: models not saved")
+        else:
+            self.stdout.write(self.style.SUCCESS("Surrogate models saved"))
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matches', '0003_update_match_actual_result_choices'),
+        ('predictions', '0005_api_rate_limit_circuit_breaker'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='APICallLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('strategy', models.CharField(help_text='baseline, profitable, balanced, combined or packed', max_length=20)),
+                ('model', models.CharField(max_length=50)),
+                ('status', models.CharField(choices=[('success', 'Success'), ('cached', 'Served from cache'), ('error', 'Error'), ('unavailable', 'Refused by breaker/rate limiter')], max_length=12)),
+                ('http_status', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('latency_ms', models.FloatField(default=0.0)),
+                ('prompt_tokens', models.PositiveIntegerField(default=0)),
+                ('completion_tokens', models.PositiveIntegerField(default=0)),
+                ('cache_hit_tokens', models.PositiveIntegerField(default=0)),
+                ('cache_miss_tokens', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('match', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='api_calls', to='matches.match')),
+            ],
+            options={
+                'verbose_name': 'API call',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0006_api_call_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apicalllog',
+            name='prompt_version',
+            field=models.PositiveSmallIntegerField(default=1, help_text='predictions.prompts.PROMPT_VERSION the prompt was built with'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0007_api_call_log_prompt_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apicalllog',
+            name='endpoint',
+            field=models.CharField(blank=True, help_text='Name of the endpoint that answered', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='apicalllog',
+            name='hedged',
+            field=models.BooleanField(default=False, help_text='A duplicate request was sent to a second endpoint'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0008_api_call_log_endpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prediction',
+            name='ai_sources',
+            field=models.JSONField(blank=True, default=dict, help_text="Where each AI prediction came from: 'ai' (DeepSeek) or 'rules' (call skipped, rule answer unambiguous)"),
+        ),
+    ]
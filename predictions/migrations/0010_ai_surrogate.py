@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0009_prediction_ai_sources'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AISurrogate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('strategy', models.CharField(max_length=20, unique=True)),
+                ('parameters', models.JSONField(help_text='Feature scaling and softmax-regression weights')),
+                ('samples', models.PositiveIntegerField(default=0, help_text='Stored AI answers trained on')),
+                ('holdout_agreement', models.FloatField(blank=True, help_text='Share of holdout answers matching DeepSeek', null=True)),
+                ('confident_agreement', models.FloatField(blank=True, help_text='Agreement on holdout answers at or above the confidence threshold', null=True)),
+                ('coverage', models.FloatField(blank=True, help_text='Share of holdout answers at or above the threshold', null=True)),
+                ('threshold', models.FloatField(default=0.9)),
+                ('trained_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'AI surrogate',
+                'ordering': ['strategy'],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0010_ai_surrogate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prediction',
+            name='engine_version',
+            field=models.CharField(blank=True, default='', help_text='PredictionEngine.version (engine, prompt version and thresholds) used', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='prediction',
+            name='input_fingerprint',
+            field=models.CharField(blank=True, default='', help_text='Hash of the match inputs (teams, probabilities, odds) the predictions were computed from', max_length=40),
+        ),
+    ]
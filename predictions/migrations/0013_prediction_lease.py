@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matches', '0003_update_match_actual_result_choices'),
+        ('predictions', '0012_prediction_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PredictionLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner', models.CharField(help_text='Token of the request or job holding the lease', max_length=64)),
+                ('acquired_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True, help_text='Others may take over the lease after this')),
+                ('match', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='prediction_lease', to='matches.match')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0013_prediction_lease'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='prediction',
+            name='ai_sources',
+            field=models.JSONField(blank=True, default=dict, help_text="Where each AI prediction came from: 'ai' (DeepSeek), 'rules' (call skipped, rule answer unambiguous) or 'surrogate' (call skipped, local model's confident guess at DeepSeek's answer)"),
+        ),
+    ]
@@ -1,9 +1,85 @@
 from django.db import models
-from django.db.models import Count, Q, Avg, Case, When, IntegerField
+from django.db.models import Count, Q, Avg, Case, When, IntegerField, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, NullIf
+from django.db.models.lookups import Exact
+from django.utils import timezone
 from matches.models import Match
 import json
 
 
+AI_STRATEGIES = ('ai_baseline', 'ai_profitable', 'ai_balanced')
+# Prediction scored against the result, first non-empty wins (see Prediction.update_accuracy)
+ACCURACY_PRIORITY = ('ai_balanced', 'ai_profitable', 'ai_baseline', 'balanced', 'profitable', 'baseline')
+
+
+class PredictionQuerySet(models.QuerySet):
+    def stale_candidates(self, engine_version):
+        """
+        Predictions that may be stale, found in SQL: never fingerprinted, computed
+        under another engine/prompt version, or older than their match's last edit
+        """
+        return self.filter(
+            Q(input_fingerprint='')
+            | ~Q(engine_version=engine_version)
+            | Q(match__updated_at__gt=F('updated_at'))
+        )
+
+    def stale_rows(self, engine):
+        """
+        Yield (pk, match_id, state) for every stale candidate, confirmed against
+        the fingerprint of the match's current inputs
+
+        state is 'current' (match edited, inputs unchanged), 'unstamped'
+        (never fingerprinted) or 'stale' (inputs or version changed).
+        """
+        from .engine import INPUT_FIELDS
+
+        rows = self.stale_candidates(engine.version).order_by().values_list(
+            'pk', 'match_id', 'input_fingerprint', 'engine_version', *(f'match__{field}' for field in INPUT_FIELDS)
+        )
+        for pk, match_id, fingerprint, version, *values in rows.iterator(chunk_size=2000):
+            if not fingerprint:
+                state = 'unstamped'
+            elif version == engine.version and fingerprint == engine.input_fingerprint(values=values):
+                state = 'current'
+            else:
+                state = 'stale'
+            yield pk, match_id, state
+
+    def stale(self, engine=None):
+        """Predictions whose match inputs or engine/prompt version changed since they were computed"""
+        if engine is None:
+            from .engine import PredictionEngine
+            engine = PredictionEngine(use_ai=False)
+        return self.filter(pk__in=[pk for pk, _, state in self.stale_rows(engine) if state == 'stale'])
+
+    def recompute_accuracy(self):
+        """
+        Set is_correct and prediction_type_used for every prediction in the
+        queryset whose match has a result, in one UPDATE
+
+        Scores the same pick as Prediction.update_accuracy(): the first
+        non-empty column of ACCURACY_PRIORITY, compared with the match's
+        actual_result. Predictions without any pick are left alone.
+
+        Returns:
+            Number of predictions updated
+        """
+        # update() can't join, so the result comes in through a correlated subquery
+        actual_result = Subquery(Match.objects.filter(pk=OuterRef('match_id')).order_by().values('actual_result')[:1])
+        picked = Coalesce(*(NullIf(field, Value('')) for field in ACCURACY_PRIORITY))
+        return (
+            self.exclude(match__actual_result__isnull=True).exclude(match__actual_result='')
+            .alias(picked=picked).filter(picked__isnull=False)
+            .update(
+                is_correct=Case(When(Exact(picked, actual_result), then=Value(True)), default=Value(False)),
+                prediction_type_used=Case(
+                    *(When(Q(**{f'{field}__isnull': False}) & ~Q(**{field: ''}), then=Value(field)) for field in ACCURACY_PRIORITY)
+                ),
+            )
+        )
+
+
 class Prediction(models.Model):
     """Prediction model for storing AI-generated predictions"""
     match = models.ForeignKey(
@@ -47,6 +123,14 @@ class Prediction(models.Model):
         choices=[('3', 'Team A'), ('1', 'Draw'), ('0', 'Team B')],
         help_text="AI-generated balanced prediction"
     )
+    ai_sources = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text=(
+            "Where each AI prediction came from: 'ai' (DeepSeek), 'rules' (call skipped, rule answer "
+            "unambiguous) or 'surrogate' (call skipped, local model's confident guess at DeepSeek's answer)"
+        )
+    )
     # Store full API response data for analysis
     api_response_data = models.JSONField(
         blank=True,
@@ -65,9 +149,24 @@ class Prediction(models.Model):
         null=True,
         help_text="Which prediction type was used (baseline, profitable, balanced)"
     )
+    # What the predictions were computed from, for stale detection
+    input_fingerprint = models.CharField(
+        max_length=40,
+        blank=True,
+        default='',
+        help_text="Hash of the match inputs (teams, probabilities, odds) the predictions were computed from"
+    )
+    engine_version = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        help_text="PredictionEngine.version (engine, prompt version and thresholds) used"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = PredictionQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
         unique_together = ['match']
@@ -96,6 +195,32 @@ class Prediction(models.Model):
             return self.balanced == self.match.actual_result
         return None
     
+    def is_stale(self, engine):
+        """
+        Whether the match inputs or engine/prompt version changed since this was
+        computed (never for a prediction that was never stamped)
+        """
+        return bool(self.input_fingerprint) and (
+            self.engine_version != engine.version
+            or self.input_fingerprint != engine.input_fingerprint(self.match)
+        )
+
+    def stamp_inputs(self, engine, refreshed_ai=()):
+        """
+        Record the inputs and engine version the rule columns were just computed from
+
+        AI predictions answered for different inputs are cleared unless they
+        were regenerated in the same pass (listed in refreshed_ai); a
+        never-stamped row keeps its AI predictions.
+        """
+        if self.is_stale(engine):
+            for field in AI_STRATEGIES:
+                if field not in refreshed_ai:
+                    setattr(self, field, None)
+                    self.ai_sources.pop(field[3:], None)
+        self.input_fingerprint = engine.input_fingerprint(self.match)
+        self.engine_version = engine.version
+
     def update_accuracy(self):
         """Update accuracy based on actual match result"""
         if self.match.actual_result:
@@ -163,3 +288,215 @@ class Prediction(models.Model):
             'by_type': by_type
         }
 
+
+
+class APIResponseCache(models.Model):
+    """DeepSeek responses cached by a hash of (model, system message, prompt, temperature)"""
+    key = models.CharField(max_length=64, unique=True)
+    model = models.CharField(max_length=50)
+    response_data = models.JSONField(help_text="Raw chat-completions response body")
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_accessed = models.DateTimeField(db_index=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ['-last_accessed']
+        verbose_name = "API response cache entry"
+        verbose_name_plural = "API response cache"
+
+    def __str__(self):
+        return f"{self.model} {self.key[:12]} (hits: {self.hit_count})"
+
+
+class APICounter(models.Model):
+    """Named counters shared across worker processes (cache hits/misses, etc.)"""
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+    @classmethod
+    def increment(cls, name, amount=1):
+        """Atomically add amount to the named counter"""
+        updated = cls.objects.filter(name=name).update(value=F('value') + amount, updated_at=timezone.now())
+        if not updated:
+            counter, created = cls.objects.get_or_create(name=name, defaults={'value': amount})
+            if not created:
+                cls.objects.filter(name=name).update(value=F('value') + amount, updated_at=timezone.now())
+
+    @classmethod
+    def get_values(cls, *names):
+        """Return {name: value} for the given counters, defaulting to 0"""
+        values = dict(cls.objects.filter(name__in=names).values_list('name', 'value'))
+        return {name: values.get(name, 0) for name in names}
+
+
+class APIRateLimit(models.Model):
+    """Token bucket shared by every process using the same database"""
+    name = models.CharField(max_length=50, unique=True)
+    tokens = models.FloatField(default=0.0)
+    refilled_at = models.FloatField(default=0.0, help_text="Unix timestamp of the last refill")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['name']
+        verbose_name = "API rate limit"
+
+    def __str__(self):
+        return f"{self.name}: {self.tokens:.2f} tokens"
+
+
+class APICircuitBreaker(models.Model):
+    """Circuit breaker state for an external API, shared across processes"""
+    STATE_CLOSED = 'closed'
+    STATE_OPEN = 'open'
+    STATE_HALF_OPEN = 'half_open'
+    STATE_CHOICES = [
+        (STATE_CLOSED, 'Closed'),
+        (STATE_OPEN, 'Open'),
+        (STATE_HALF_OPEN, 'Half-open'),
+    ]
+
+    name = models.CharField(max_length=50, unique=True)
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default=STATE_CLOSED)
+    consecutive_failures = models.PositiveIntegerField(default=0)
+    total_trips = models.PositiveIntegerField(default=0)
+    opened_at = models.DateTimeField(blank=True, null=True)
+    last_failure_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, default='')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return f"{self.name}: {self.get_state_display()}"
+
+
+class APICallLog(models.Model):
+    """Append-only ledger of DeepSeek calls: latency, outcome and token usage"""
+    STATUS_SUCCESS = 'success'
+    STATUS_CACHED = 'cached'
+    STATUS_ERROR = 'error'
+    STATUS_UNAVAILABLE = 'unavailable'
+    STATUS_CHOICES = [
+        (STATUS_SUCCESS, 'Success'),
+        (STATUS_CACHED, 'Served from cache'),
+        (STATUS_ERROR, 'Error'),
+        (STATUS_UNAVAILABLE, 'Refused by breaker/rate limiter'),
+    ]
+
+    match = models.ForeignKey(
+        Match,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='api_calls'
+    )
+    strategy = models.CharField(max_length=20, help_text="baseline, profitable, balanced, combined or packed")
+    model = models.CharField(max_length=50)
+    prompt_version = models.PositiveSmallIntegerField(
+        default=1,
+        help_text="predictions.prompts.PROMPT_VERSION the prompt was built with"
+    )
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES)
+    http_status = models.PositiveSmallIntegerField(blank=True, null=True)
+    endpoint = models.CharField(max_length=50, blank=True, help_text="Name of the endpoint that answered")
+    hedged = models.BooleanField(default=False, help_text="A duplicate request was sent to a second endpoint")
+    latency_ms = models.FloatField(default=0.0)
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    cache_hit_tokens = models.PositiveIntegerField(default=0)
+    cache_miss_tokens = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "API call"
+
+    def __str__(self):
+        return f"{self.strategy} {self.status} {self.latency_ms:.0f}ms"
+
+
+class AISurrogate(models.Model):
+    """Local classifier trained on stored DeepSeek answers (see predictions.surrogate)"""
+    strategy = models.CharField(max_length=20, unique=True)
+    parameters = models.JSONField(help_text="Feature scaling and softmax-regression weights")
+    samples = models.PositiveIntegerField(default=0, help_text="Stored AI answers trained on")
+    holdout_agreement = models.FloatField(blank=True, null=True, help_text="Share of holdout answers matching DeepSeek")
+    confident_agreement = models.FloatField(
+        blank=True,
+        null=True,
+        help_text="Agreement on holdout answers at or above the confidence threshold"
+    )
+    coverage = models.FloatField(blank=True, null=True, help_text="Share of holdout answers at or above the threshold")
+    threshold = models.FloatField(default=0.9)
+    trained_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['strategy']
+        verbose_name = "AI surrogate"
+
+    def __str__(self):
+        return f"{self.strategy} surrogate ({self.samples} samples)"
+
+
+class PredictionJob(models.Model):
+    """AI prediction work queued by the web views and run by manage.py run_prediction_worker"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    ACTIVE_STATUSES = (STATUS_PENDING, STATUS_RUNNING)
+
+    match = models.ForeignKey(Match, on_delete=models.CASCADE, related_name='prediction_jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    source = models.CharField(max_length=20, blank=True, help_text="What queued the job: weekly, batch, generate, admin")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now, help_text="Not claimed before this (retry backoff)")
+    claimed_by = models.CharField(max_length=100, blank=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'available_at'])]
+        constraints = [
+            # A match is queued at most once at a time; enqueueing it again is a no-op
+            models.UniqueConstraint(
+                fields=['match'],
+                condition=Q(status__in=['pending', 'running']),
+                name='one_active_job_per_match',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Job {self.pk} for match {self.match_id}: {self.status}"
+
+
+class PredictionLease(models.Model):
+    """
+    Single-flight lock on generating a match's predictions, shared by all
+    web and worker processes through the database (see predictions.leases)
+    """
+    match = models.OneToOneField(Match, on_delete=models.CASCADE, related_name='prediction_lease')
+    owner = models.CharField(max_length=64, help_text="Token of the request or job holding the lease")
+    acquired_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True, help_text="Others may take over the lease after this")
+
+    def __str__(self):
+        return f"Lease on match {self.match_id} until {self.expires_at}"
@@ -0,0 +1,71 @@
+"""
+Prompt templates for DeepSeek predictions
+
+Every prompt starts with text that is identical for all matches (system
+message, rules, output format) and ends with the match-specific data, so
+DeepSeek's prompt-prefix cache can serve the shared part across matches.
+Bump PROMPT_VERSION whenever the wording changes; it is recorded with each
+API call so cache-hit ratios can be compared between layouts.
+"""
+
+PROMPT_VERSION = 2
+
+DIGIT_SYSTEM_MESSAGE = 'You are a sport prediction expert. Always respond with a single digit: 3 for Team A win, 1 for draw, 0 for Team B win.'
+COMBINED_SYSTEM_MESSAGE = 'You are a sport prediction expert. Always respond with a single JSON object mapping each strategy to a digit: 3 for Team A win, 1 for draw, 0 for Team B win.'
+PACKED_SYSTEM_MESSAGE = 'You are a sport prediction expert. Always respond with a JSON array holding one object per match, each mapping the match id and every strategy to a digit: 3 for Team A win, 1 for draw, 0 for Team B win.'
+
+RULES = {
+    'baseline': """Baseline rules:
+- If Team A probability is significantly higher (difference > 15%) → 3
+- If Team B probability is significantly higher (difference > 15%) → 0
+- If probabilities are close (difference ≤ 15%) → 1""",
+    'profitable': """Profitable rules:
+- If actual probability > implied probability by at least 10% → that team is undervalued
+- If Team A is undervalued → 3
+- If Team B is undervalued → 0
+- If neither team is significantly undervalued → 1""",
+    'balanced': """Balanced rules:
+- Combine actual probability and odds alignment
+- If Team A has high actual probability (>45%) AND good odds value → 3
+- If Team B has high actual probability (>45%) AND good odds value → 0
+- If probabilities and odds don't align clearly → 1""",
+}
+
+DIGIT_OUTPUT = "Output: single digit (3, 1, or 0)"
+COMBINED_OUTPUT = 'Output: JSON object only, e.g. {"baseline": "3", "profitable": "1", "balanced": "0"}'
+PACKED_OUTPUT = """Output: JSON array only, one object per match in the same order, e.g.
+[{"id": 1, "baseline": "3", "profitable": "1", "balanced": "0"}]"""
+
+ALL_RULES = '\n\n'.join(RULES[strategy] for strategy in ('baseline', 'profitable', 'balanced'))
+
+
+def match_fields(match):
+    """The match-specific values every prompt ends with"""
+    return [
+        f"Team A: {match.team_a}",
+        f"Team B: {match.team_b}",
+        f"Probabilities: Team A {match.prob_a_percent}%, Team B {match.prob_b_percent}%, Draw {match.draw_prob_percent}%",
+        f"Odds: Team A {match.odds_a}, Team B {match.odds_b}",
+        f"Implied Probabilities from Odds: Team A {match.implied_prob_a*100:.2f}%, Team B {match.implied_prob_b*100:.2f}%",
+    ]
+
+
+def strategy_prompt(match, strategy):
+    """Prompt for a single strategy: its rules, the output format, then the match"""
+    match_data = '\n'.join(match_fields(match))
+    return f"{RULES[strategy]}\n\n{DIGIT_OUTPUT}\n\nMatch:\n{match_data}"
+
+
+def combined_prompt(match):
+    """Prompt asking for all three strategies for one match"""
+    match_data = '\n'.join(match_fields(match))
+    return f"Predict the match below with three strategies.\n\n{ALL_RULES}\n\n{COMBINED_OUTPUT}\n\nMatch:\n{match_data}"
+
+
+def packed_prompt(matches):
+    """Prompt asking for all three strategies for several matches, one numbered line each"""
+    match_lines = '\n'.join(
+        f"{index}. " + ' | '.join(match_fields(match))
+        for index, match in enumerate(matches, start=1)
+    )
+    return f"Predict every match below with three strategies.\n\n{ALL_RULES}\n\n{PACKED_OUTPUT}\n\nMatches:\n{match_lines}"
@@ -0,0 +1,285 @@
+"""
+Rate limiting and circuit breaking for DeepSeek calls
+
+A token bucket caps request rate per process and another, stored in the
+database, caps it across all processes. The circuit breaker trips after
+consecutive failures so callers fail fast to rule-based predictions
+until the cool-down has passed.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError
+from django.db.models import F
+from django.utils import timezone
+from .models import APIRateLimit, APICircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+BREAKER_NAME = 'deepseek'
+RATE_LIMIT_NAME = 'deepseek'
+
+
+class TokenBucket:
+    """In-process token bucket; rate is tokens per second"""
+    
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(rate, 1))
+        self.tokens = self.capacity
+        self.refilled_at = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def try_acquire(self):
+        """Take a token if one is available; otherwise return seconds until the next one"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.refilled_at) * self.rate)
+            self.refilled_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+
+class DatabaseTokenBucket:
+    """Token bucket stored in the database so its limit holds across processes"""
+    
+    def __init__(self, name, rate, capacity=None):
+        self.name = name
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(rate, 1))
+    
+    def try_acquire(self):
+        """Take a token if one is available; otherwise return seconds until the next one"""
+        for _ in range(5):
+            bucket = APIRateLimit.objects.filter(name=self.name).first()
+            now = time.time()
+            if bucket is None:
+                try:
+                    APIRateLimit.objects.create(name=self.name, tokens=self.capacity - 1, refilled_at=now)
+                    return 0.0
+                except IntegrityError:
+                    continue
+            
+            tokens = min(self.capacity, bucket.tokens + (now - bucket.refilled_at) * self.rate)
+            if tokens < 1:
+                return (1 - tokens) / self.rate
+            # Compare-and-swap on the previous refill time so concurrent takers cannot overspend
+            updated = APIRateLimit.objects.filter(pk=bucket.pk, refilled_at=bucket.refilled_at).update(
+                tokens=tokens - 1,
+                refilled_at=now,
+                updated_at=timezone.now()
+            )
+            if updated:
+                return 0.0
+        return 1.0 / self.rate
+
+
+class RateLimiter:
+    """Combines the per-process and per-database buckets configured in settings"""
+    
+    def __init__(self):
+        self.buckets = []
+        process_rate = getattr(settings, 'DEEPSEEK_PROCESS_RATE_LIMIT', None)
+        database_rate = getattr(settings, 'DEEPSEEK_DATABASE_RATE_LIMIT', None)
+        if process_rate:
+            self.buckets.append(TokenBucket(process_rate))
+        if database_rate:
+            self.buckets.append(DatabaseTokenBucket(RATE_LIMIT_NAME, database_rate))
+        self.max_wait = getattr(settings, 'DEEPSEEK_RATE_LIMIT_WAIT', 10)
+    
+    def acquire(self, max_wait=None):
+        """Block until every bucket grants a token; False if that takes longer than max_wait"""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        deadline = time.monotonic() + max_wait
+        for bucket in self.buckets:
+            while True:
+                try:
+                    wait = bucket.try_acquire()
+                except DatabaseError as e:
+                    logger.warning(f"Rate limit bucket unavailable: {e}")
+                    break
+                if wait <= 0:
+                    break
+                if time.monotonic() + wait > deadline:
+                    return False
+                time.sleep(wait)
+        return True
+
+
+class CircuitBreaker:
+    """
+    Closed → open after DEEPSEEK_BREAKER_FAILURE_THRESHOLD consecutive failures.
+    Open → half-open once DEEPSEEK_BREAKER_COOLDOWN seconds have passed, letting
+    a single trial request through; its outcome closes or re-opens the breaker.
+    """
+    
+    def __init__(self, name=BREAKER_NAME):
+        self.name = name
+        self.failure_threshold = getattr(settings, 'DEEPSEEK_BREAKER_FAILURE_THRESHOLD', 5)
+        self.cooldown = getattr(settings, 'DEEPSEEK_BREAKER_COOLDOWN', 60)
+    
+    def _get(self):
+        breaker, _ = APICircuitBreaker.objects.get_or_create(name=self.name)
+        return breaker
+    
+    def allow_request(self):
+        """Whether a call may go out now"""
+        try:
+            breaker = self._get()
+            if breaker.state == APICircuitBreaker.STATE_CLOSED:
+                return True
+            
+            now = timezone.now()
+            cooled_down = breaker.opened_at is None or now - breaker.opened_at >= timedelta(seconds=self.cooldown)
+            if not cooled_down:
+                return False
+            # Only the process that wins the transition gets to send the trial request;
+            # a half-open trial that never reported back is retried after another cool-down
+            return bool(APICircuitBreaker.objects.filter(
+                pk=breaker.pk, state=breaker.state, opened_at=breaker.opened_at
+            ).update(state=APICircuitBreaker.STATE_HALF_OPEN, opened_at=now, updated_at=now))
+        except DatabaseError as e:
+            logger.warning(f"Circuit breaker unavailable: {e}")
+            return True
+    
+    def is_open(self):
+        """
+        True while calls are being refused: open and not yet cooled down, or
+        half-open with a trial in flight. A trial that never reported back
+        stops counting after a cool-down, so allow_request() can send another.
+        """
+        try:
+            breaker = APICircuitBreaker.objects.filter(name=self.name).first()
+        except DatabaseError:
+            return False
+        if breaker is None or breaker.state == APICircuitBreaker.STATE_CLOSED:
+            return False
+        return breaker.opened_at is not None and timezone.now() - breaker.opened_at < timedelta(seconds=self.cooldown)
+    
+    def record_success(self):
+        try:
+            APICircuitBreaker.objects.filter(name=self.name).exclude(
+                state=APICircuitBreaker.STATE_CLOSED, consecutive_failures=0
+            ).update(
+                state=APICircuitBreaker.STATE_CLOSED,
+                consecutive_failures=0,
+                opened_at=None,
+                updated_at=timezone.now()
+            )
+        except DatabaseError as e:
+            logger.warning(f"Circuit breaker unavailable: {e}")
+    
+    def record_failure(self, error=''):
+        try:
+            now = timezone.now()
+            breaker = self._get()
+            APICircuitBreaker.objects.filter(pk=breaker.pk).update(
+                consecutive_failures=F('consecutive_failures') + 1,
+                last_failure_at=now,
+                last_error=str(error)[:1000],
+                updated_at=now
+            )
+            breaker.refresh_from_db()
+            should_open = (
+                breaker.state == APICircuitBreaker.STATE_HALF_OPEN
+                or (breaker.state == APICircuitBreaker.STATE_CLOSED
+                    and breaker.consecutive_failures >= self.failure_threshold)
+            )
+            if should_open:
+                tripped = APICircuitBreaker.objects.filter(pk=breaker.pk, state=breaker.state).update(
+                    state=APICircuitBreaker.STATE_OPEN,
+                    opened_at=now,
+                    total_trips=F('total_trips') + 1,
+                    updated_at=now
+                )
+                if tripped:
+                    logger.warning(
+                        f"Circuit breaker '{self.name}' opened after {breaker.consecutive_failures} "
+                        f"consecutive failures; failing fast for {self.cooldown}s"
+                    )
+        except DatabaseError as e:
+            logger.warning(f"Circuit breaker unavailable: {e}")
+    
+    def reset(self):
+        APICircuitBreaker.objects.filter(name=self.name).update(
+            state=APICircuitBreaker.STATE_CLOSED,
+            consecutive_failures=0,
+            opened_at=None,
+            updated_at=timezone.now()
+        )
+    
+    def status(self):
+        breaker = self._get()
+        retry_in = None
+        if breaker.state == APICircuitBreaker.STATE_OPEN and breaker.opened_at:
+            elapsed = (timezone.now() - breaker.opened_at).total_seconds()
+            retry_in = max(round(self.cooldown - elapsed, 1), 0.0)
+        return {
+            'name': breaker.name,
+            'state': breaker.state,
+            'consecutive_failures': breaker.consecutive_failures,
+            'failure_threshold': self.failure_threshold,
+            'total_trips': breaker.total_trips,
+            'opened_at': breaker.opened_at.isoformat() if breaker.opened_at else None,
+            'retry_in_seconds': retry_in,
+            'last_failure_at': breaker.last_failure_at.isoformat() if breaker.last_failure_at else None,
+            'last_error': breaker.last_error,
+        }
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Return the process-wide rate limiter (its in-process bucket must be shared)"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = RateLimiter()
+    return _rate_limiter
+
+
+class Deadline:
+    """
+    Time budget for the AI work done while serving one request.
+    
+    Passed down through PredictionEngine and DeepSeekClient: each call's
+    timeout is capped at the remaining budget and no call is started once
+    it is spent. ai_time accumulates the time actually spent in API calls.
+    """
+    
+    def __init__(self, seconds):
+        self.budget = float(seconds)
+        self.started = time.monotonic()
+        self.ai_time = 0.0
+        self.lock = threading.Lock()
+    
+    def remaining(self):
+        return max(self.budget - (time.monotonic() - self.started), 0.0)
+    
+    def expired(self):
+        return self.remaining() <= 0
+    
+    def timeout(self, default):
+        """Per-call timeout: the default, capped at the remaining budget"""
+        return min(default, self.remaining())
+    
+    def add_ai_time(self, seconds):
+        with self.lock:
+            self.ai_time += seconds
+    
+    def headers(self, pending=0):
+        """Response headers reporting how much of the budget went to AI"""
+        used = min(self.ai_time / self.budget, 1.0) if self.budget else 0.0
+        return {
+            'X-AI-Budget': f"{self.budget:.3f}",
+            'X-AI-Time-Spent': f"{self.ai_time:.3f}",
+            'X-AI-Budget-Used': f"{used:.0%}",
+            'X-AI-Pending': str(pending),
+        }
@@ -0,0 +1,42 @@
+"""
+Vectorized rule strategies over NumPy arrays
+
+The same rules as PredictionEngine.calculate_*, with every threshold passed
+in explicitly. Kept free of Django imports so backtest worker processes can
+use it without setting Django up.
+"""
+import numpy as np
+
+
+def implied_probability(odds):
+    """1 / odds, or 0 where there are no odds"""
+    odds = np.asarray(odds, dtype=float)
+    return np.divide(1, odds, out=np.zeros_like(odds), where=odds > 0)
+
+
+def pick(team_a, team_b):
+    """'3' where team_a holds, else '0' where team_b holds, else '1'"""
+    return np.where(team_a, '3', np.where(team_b, '0', '1'))
+
+
+def baseline(prob_a, prob_b, threshold):
+    close = np.abs(prob_a - prob_b) <= threshold
+    return pick(~close & (prob_a > prob_b), ~close & (prob_a <= prob_b))
+
+
+def profitable(prob_a, prob_b, implied_prob_a, implied_prob_b, value_threshold):
+    value_a = prob_a - implied_prob_a
+    value_b = prob_b - implied_prob_b
+    return pick(
+        (value_a >= value_threshold) & (value_a > value_b),
+        (value_b >= value_threshold) & (value_b > value_a),
+    )
+
+
+def balanced(prob_a, prob_b, implied_prob_a, implied_prob_b, prob_threshold, value_margin):
+    team_a_score = (prob_a > prob_threshold).astype(int) + (prob_a > implied_prob_a + value_margin)
+    team_b_score = (prob_b > prob_threshold).astype(int) + (prob_b > implied_prob_b + value_margin)
+    return pick(
+        (team_a_score >= 2) & (team_a_score > team_b_score),
+        (team_b_score >= 2) & (team_b_score > team_a_score),
+    )
@@ -1,11 +1,84 @@
 """
 Signals to auto-generate predictions when matches are created/updated
 """
+import logging
+import threading
+from contextlib import contextmanager
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from matches.models import Match
 from .models import Prediction
-from .engine import PredictionEngine
+from .engine import INPUT_FIELDS, PredictionEngine
+
+logger = logging.getLogger(__name__)
+
+# Matches saved inside deferred_prediction_signals() on this thread, handled on exit
+_deferred = threading.local()
+
+
+@contextmanager
+def deferred_prediction_signals(chunk_size=2000):
+    """
+    Batch scope for bulk match saves (imports): the prediction signal
+    handlers only record the saved match ids, and one bulk prediction and
+    accuracy pass over them runs on exit instead of several queries per
+    save. Nested scopes join the outermost one.
+    """
+    if getattr(_deferred, 'scope', None) is not None:
+        yield _deferred.scope
+        return
+    scope = _deferred.scope = {'created': set(), 'saved': set()}
+    try:
+        yield scope
+    except BaseException:
+        _deferred.scope = None
+        # Matches saved before the error still get their predictions, but a failing
+        # flush must not replace the error that ended the block
+        try:
+            flush_deferred_predictions(scope['created'], scope['saved'], chunk_size)
+        except Exception:
+            logger.exception("Deferred prediction pass failed after an error in the batch")
+        raise
+    _deferred.scope = None
+    flush_deferred_predictions(scope['created'], scope['saved'], chunk_size)
+
+
+def flush_deferred_predictions(created_ids, saved_ids, chunk_size=2000):
+    """
+    What auto_generate_predictions and update_prediction_accuracy would have
+    done for these matches, in bulk: rule predictions for created matches
+    without one, then set-based accuracy for all saved matches with a result
+    """
+    from django.conf import settings
+    if created_ids and getattr(settings, 'AUTO_GENERATE_PREDICTIONS', False):
+        engine = PredictionEngine(use_ai=False)
+        version = engine.version
+        created_ids = sorted(created_ids)
+        for start in range(0, len(created_ids), chunk_size):
+            rows = list(
+                Match.objects.filter(pk__in=created_ids[start:start + chunk_size], predictions__isnull=True)
+                .values_list('pk', *INPUT_FIELDS)
+            )
+            if not rows:
+                continue
+            columns = dict(zip(('pk', *INPUT_FIELDS), zip(*rows)))
+            predicted = engine.predict_arrays(columns['prob_a'], columns['prob_b'], columns['odds_a'], columns['odds_b'])
+            picks = zip(*(predicted[strategy].tolist() for strategy in ('baseline', 'profitable', 'balanced')))
+            Prediction.objects.bulk_create([
+                Prediction(
+                    match_id=pk,
+                    baseline=baseline,
+                    profitable=profitable,
+                    balanced=balanced,
+                    input_fingerprint=engine.input_fingerprint(values=values),
+                    engine_version=version,
+                )
+                for (pk, *values), (baseline, profitable, balanced) in zip(rows, picks)
+            ])
+
+    saved_ids = sorted(saved_ids)
+    for start in range(0, len(saved_ids), chunk_size):
+        Prediction.objects.filter(match_id__in=saved_ids[start:start + chunk_size]).recompute_accuracy()
 
 
 @receiver(post_save, sender=Match)
@@ -16,10 +89,17 @@ def auto_generate_predictions(sender, instance, created, **kwargs):
     """
     from django.conf import settings
     if getattr(settings, 'AUTO_GENERATE_PREDICTIONS', False):
+        scope = getattr(_deferred, 'scope', None)
+        if scope is not None:
+            if created:
+                scope['created'].add(instance.pk)
+            return
         if created and not Prediction.objects.filter(match=instance).exists():
             engine = PredictionEngine(use_ai=False)
             predictions = engine.generate_prediction(instance, use_ai=False)
-            Prediction.objects.create(match=instance, **predictions)
+            prediction = Prediction(match=instance, **predictions)
+            prediction.stamp_inputs(engine)
+            prediction.save()
 
 
 @receiver(post_save, sender=Match)
@@ -27,7 +107,11 @@ def update_prediction_accuracy(sender, instance, **kwargs):
     """
     Update prediction accuracy when match result is set or updated
     """
-    if instance.actual_result:
-        predictions = Prediction.objects.filter(match=instance)
-        for pred in predictions:
-            pred.update_accuracy()
+    # Edits that leave the result alone (country, odds, ...) can't change accuracy
+    changes = getattr(instance, 'saved_changes', None)
+    if instance.actual_result and (changes is None or 'actual_result' in changes):
+        scope = getattr(_deferred, 'scope', None)
+        if scope is not None:
+            scope['saved'].add(instance.pk)
+            return
+        Prediction.objects.filter(match=instance).recompute_accuracy()
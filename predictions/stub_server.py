@@ -0,0 +1,239 @@
+"""
+Local stand-in for the DeepSeek chat-completions API
+
+Answers the prompts built by DeepSeekClient with deterministic digits from
+PredictionEngine's rules, returns realistic usage blocks (including
+prefix-cache hit/miss tokens) and can inject latency, errors and 429 bursts
+so the client can be benchmarked offline. Started by
+`manage.py run_deepseek_stub`.
+"""
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .engine import PredictionEngine
+from . import prompts
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4
+CACHE_BLOCK_TOKENS = 64  # DeepSeek caches prompt prefixes in 64-token units
+NUMBER = r'(\d+(?:\.\d+)?)'
+
+
+class MatchInputs:
+    """The subset of Match that PredictionEngine's rules read"""
+    
+    def __init__(self, prob_a, prob_b, odds_a=0.0, odds_b=0.0):
+        self.prob_a = prob_a
+        self.prob_b = prob_b
+        self.odds_a = odds_a
+        self.odds_b = odds_b
+    
+    @property
+    def implied_prob_a(self):
+        return 1 / self.odds_a if self.odds_a > 0 else 0
+    
+    @property
+    def implied_prob_b(self):
+        return 1 / self.odds_b if self.odds_b > 0 else 0
+
+
+PROBABILITIES = re.compile(r'Probabilities: Team A ' + NUMBER + r'%, Team B ' + NUMBER + r'%')
+ODDS = re.compile(r'Odds: Team A ' + NUMBER + r', Team B ' + NUMBER)
+
+
+def _parse_inputs(text):
+    """Read probabilities and odds from the match data written by predictions.prompts"""
+    prob_a = prob_b = odds_a = odds_b = 0.0
+    probabilities = PROBABILITIES.search(text)
+    if probabilities:
+        prob_a, prob_b = float(probabilities.group(1)) / 100, float(probabilities.group(2)) / 100
+    odds = ODDS.search(text)
+    if odds:
+        odds_a, odds_b = float(odds.group(1)), float(odds.group(2))
+    return MatchInputs(prob_a, prob_b, odds_a, odds_b)
+
+
+def _parse_packed(prompt):
+    """Read one MatchInputs per numbered line of a packed prompt"""
+    match_lines = prompt.split('Matches:', 1)[-1]
+    return [
+        _parse_inputs(line)
+        for line in match_lines.splitlines()
+        if re.match(r'^\d+\. ', line)
+    ]
+
+
+def answer_prompt(prompt, engine=None):
+    """Return the reply text DeepSeek would be expected to give for one of our prompts"""
+    engine = engine or PredictionEngine(use_ai=False)
+    
+    def all_strategies(inputs):
+        return {
+            'baseline': engine.calculate_baseline_prediction(inputs),
+            'profitable': engine.calculate_profitable_prediction(inputs),
+            'balanced': engine.calculate_balanced_prediction(inputs),
+        }
+    
+    if 'Matches:' in prompt:
+        return json.dumps([
+            dict(id=index, **all_strategies(inputs))
+            for index, inputs in enumerate(_parse_packed(prompt), start=1)
+        ])
+    
+    inputs = _parse_inputs(prompt)
+    predictions = all_strategies(inputs)
+    requested = [strategy for strategy, rules in prompts.RULES.items() if rules in prompt]
+    if len(requested) == 1:
+        return predictions[requested[0]]
+    return json.dumps(predictions)
+
+
+class PrefixCache:
+    """Simulates DeepSeek's prompt-prefix cache to produce cache hit/miss token counts"""
+    
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self.blocks = OrderedDict()
+        self.lock = threading.Lock()
+    
+    def lookup_and_store(self, text):
+        """Return (hit_tokens, total_tokens) for text and remember its prefixes"""
+        total_tokens = max(len(text) // CHARS_PER_TOKEN, 1)
+        block_chars = CACHE_BLOCK_TOKENS * CHARS_PER_TOKEN
+        digest = hashlib.sha256()
+        hit_blocks = 0
+        still_hitting = True
+        with self.lock:
+            for block in range(len(text) // block_chars):
+                digest.update(text[block * block_chars:(block + 1) * block_chars].encode('utf-8'))
+                key = digest.hexdigest()
+                if still_hitting and key in self.blocks:
+                    hit_blocks += 1
+                    self.blocks.move_to_end(key)
+                else:
+                    still_hitting = False
+                    self.blocks[key] = True
+            while len(self.blocks) > self.max_entries:
+                self.blocks.popitem(last=False)
+        return min(hit_blocks * CACHE_BLOCK_TOKENS, total_tokens), total_tokens
+
+
+class StubConfig:
+    """Latency and failure injection settings"""
+    
+    LATENCY_DISTRIBUTIONS = ('fixed', 'uniform', 'exponential', 'lognormal')
+    
+    def __init__(self, latency_ms=300.0, latency_dist='lognormal', latency_spread=0.5,
+                 error_rate=0.0, burst_every=0.0, burst_length=0.0, seed=None):
+        if latency_dist not in self.LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {latency_dist}")
+        self.latency_ms = latency_ms
+        self.latency_dist = latency_dist
+        self.latency_spread = latency_spread
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.started_at = time.monotonic()
+    
+    def sample_latency(self):
+        """Seconds to wait before answering, drawn from the configured distribution"""
+        median = self.latency_ms / 1000
+        with self.random_lock:
+            if self.latency_dist == 'fixed':
+                return median
+            if self.latency_dist == 'uniform':
+                return max(self.random.uniform(median * (1 - self.latency_spread), median * (1 + self.latency_spread)), 0)
+            if self.latency_dist == 'exponential':
+                return self.random.expovariate(1 / median) if median > 0 else 0
+            return self.random.lognormvariate(0, self.latency_spread) * median
+    
+    def should_fail(self):
+        with self.random_lock:
+            return self.random.random() < self.error_rate
+    
+    def in_burst(self):
+        """True while inside a simulated 429 burst window"""
+        if self.burst_every <= 0 or self.burst_length <= 0:
+            return False
+        return (time.monotonic() - self.started_at) % self.burst_every < self.burst_length
+
+
+def make_handler(config, prefix_cache, engine):
+    
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        
+        def _send_json(self, status, body, headers=None):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+        
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            try:
+                payload = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                self._send_json(400, {'error': {'message': 'Invalid JSON body'}})
+                return
+            
+            time.sleep(config.sample_latency())
+            
+            if config.in_burst():
+                self._send_json(429, {'error': {'message': 'Rate limit reached'}}, {'Retry-After': '1'})
+                return
+            if config.should_fail():
+                self._send_json(500, {'error': {'message': 'Injected server error'}})
+                return
+            
+            messages = payload.get('messages') or []
+            prompt = next((m.get('content', '') for m in reversed(messages) if m.get('role') == 'user'), '')
+            full_text = ''.join(m.get('content', '') for m in messages)
+            content = answer_prompt(prompt, engine)
+            hit_tokens, prompt_tokens = prefix_cache.lookup_and_store(full_text)
+            completion_tokens = max(len(content) // CHARS_PER_TOKEN, 1)
+            
+            self._send_json(200, {
+                'id': f'stub-{uuid.uuid4().hex}',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': payload.get('model', 'deepseek-chat'),
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': content},
+                    'finish_reason': 'stop',
+                }],
+                'usage': {
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': completion_tokens,
+                    'total_tokens': prompt_tokens + completion_tokens,
+                    'prompt_cache_hit_tokens': hit_tokens,
+                    'prompt_cache_miss_tokens': prompt_tokens - hit_tokens,
+                },
+            })
+        
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+    
+    return StubHandler
+
+
+def make_server(host='127.0.0.1', port=8001, config=None):
+    """Build (but do not start) a threaded stub server"""
+    config = config or StubConfig()
+    handler = make_handler(config, PrefixCache(), PredictionEngine(use_ai=False))
+    return ThreadingHTTPServer((host, port), handler)
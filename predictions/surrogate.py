@@ -0,0 +1,257 @@
+"""
+Local surrogate for the DeepSeek predictions
+
+A small softmax-regression classifier per strategy, trained on the AI
+answers already stored in the Prediction table, that guesses what DeepSeek
+would answer for a match and how sure it is. PredictionEngine uses it in
+place of the API call when the confidence clears
+settings.DEEPSEEK_SURROGATE_CONFIDENCE. Trained with `manage.py train_surrogate`.
+"""
+import logging
+import threading
+import time
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+from .models import Prediction, AISurrogate
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ('baseline', 'profitable', 'balanced')
+CLASSES = ('3', '1', '0')
+INPUT_FIELDS = ('prob_a', 'prob_b', 'draw_prob', 'odds_a', 'odds_b')
+
+_surrogate = None
+_loaded_at = 0.0
+_lock = threading.Lock()
+
+
+def thresholds(engine=None):
+    """The rule thresholds of a PredictionEngine (default thresholds if None), in features() order"""
+    if engine is None:
+        from .engine import PredictionEngine
+        engine = PredictionEngine(use_ai=False)
+    return (engine.threshold, engine.value_threshold, engine.balanced_prob_threshold, engine.balanced_value_margin)
+
+
+def features(prob_a, prob_b, draw_prob, odds_a, odds_b, engine=None):
+    """
+    Feature matrix for arrays of match inputs: the raw numbers, the values
+    the rules derive from them and an indicator per rule threshold of the
+    engine, so a linear model can follow the step-shaped rules the prompts
+    describe.
+    """
+    prob_a, prob_b, draw_prob, odds_a, odds_b = (
+        np.asarray(column, dtype=float) for column in (prob_a, prob_b, draw_prob, odds_a, odds_b)
+    )
+    close_threshold, value_threshold, prob_threshold, value_margin = thresholds(engine)
+    implied_a = np.divide(1.0, odds_a, out=np.zeros_like(odds_a), where=odds_a > 0)
+    implied_b = np.divide(1.0, odds_b, out=np.zeros_like(odds_b), where=odds_b > 0)
+    value_a = prob_a - implied_a
+    value_b = prob_b - implied_b
+    diff = prob_a - prob_b
+    close = np.abs(diff) <= close_threshold
+    return np.column_stack([
+        prob_a, prob_b, draw_prob, implied_a, implied_b, value_a, value_b, diff,
+        close, ~close & (diff > 0), ~close & (diff < 0),
+        value_a >= value_threshold, value_b >= value_threshold, value_a > value_b,
+        prob_a > prob_threshold, prob_b > prob_threshold,
+        prob_a > implied_a + value_margin, prob_b > implied_b + value_margin,
+    ]).astype(float)
+
+
+def _softmax(scores):
+    scores = scores - scores.max(axis=1, keepdims=True)
+    exp = np.exp(scores)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+class StrategyModel:
+    """
+    Multinomial logistic regression over features(), for one strategy;
+    thresholds are the engine thresholds its features were built with
+    """
+
+    def __init__(self, mean, scale, coef, intercept, thresholds=None):
+        self.thresholds = tuple(thresholds) if thresholds is not None else None
+        self.mean = np.asarray(mean, dtype=float)
+        self.scale = np.asarray(scale, dtype=float)
+        self.coef = np.asarray(coef, dtype=float)
+        self.intercept = np.asarray(intercept, dtype=float)
+
+    @classmethod
+    def fit(cls, X, labels, iterations=500, learning_rate=0.5, l2=1e-3, thresholds=None):
+        """Full-batch gradient descent on standardized features; labels are digits from CLASSES"""
+        mean = X.mean(axis=0)
+        scale = X.std(axis=0)
+        scale[scale == 0] = 1.0
+        Z = (X - mean) / scale
+        targets = np.zeros((len(labels), len(CLASSES)))
+        targets[np.arange(len(labels)), [CLASSES.index(label) for label in labels]] = 1.0
+
+        coef = np.zeros((Z.shape[1], len(CLASSES)))
+        intercept = np.zeros(len(CLASSES))
+        for _ in range(iterations):
+            error = (_softmax(Z @ coef + intercept) - targets) / len(Z)
+            coef -= learning_rate * (Z.T @ error + l2 * coef)
+            intercept -= learning_rate * error.sum(axis=0)
+        return cls(mean, scale, coef, intercept, thresholds)
+
+    def predict_proba(self, X):
+        return _softmax(((X - self.mean) / self.scale) @ self.coef + self.intercept)
+
+    def predict(self, X):
+        """(digits, confidences) for each row of X"""
+        probabilities = self.predict_proba(X)
+        best = probabilities.argmax(axis=1)
+        return [CLASSES[index] for index in best], probabilities[np.arange(len(best)), best]
+
+    def to_dict(self):
+        return {
+            'mean': self.mean.tolist(),
+            'scale': self.scale.tolist(),
+            'coef': self.coef.tolist(),
+            'intercept': self.intercept.tolist(),
+            'thresholds': list(self.thresholds) if self.thresholds is not None else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        # Models saved before thresholds were recorded used the default ones
+        return cls(data['mean'], data['scale'], data['coef'], data['intercept'], data.get('thresholds') or thresholds())
+
+
+def training_data(engine=None):
+    """
+    Inputs and stored AI answers per strategy, from every prediction with that
+    AI column set (packed weekly answers only fill some of them), leaving out
+    answers that were filled locally (rules or this surrogate)
+    """
+    rows = Prediction.objects.filter(
+        Q(ai_baseline__in=CLASSES) | Q(ai_profitable__in=CLASSES) | Q(ai_balanced__in=CLASSES)
+    ).values_list(
+        *[f'match__{field}' for field in INPUT_FIELDS], 'ai_baseline', 'ai_profitable', 'ai_balanced', 'ai_sources'
+    )
+    data = {strategy: ([], []) for strategy in STRATEGIES}
+    for row in rows.iterator(chunk_size=2000):
+        inputs, answers, sources = row[:5], dict(zip(STRATEGIES, row[5:8])), row[8] or {}
+        for strategy in STRATEGIES:
+            if answers[strategy] in CLASSES and sources.get(strategy, 'ai') == 'ai':
+                data[strategy][0].append(inputs)
+                data[strategy][1].append(answers[strategy])
+    return {
+        strategy: (features(*np.array(inputs, dtype=float).reshape(-1, 5).T, engine=engine), labels)
+        for strategy, (inputs, labels) in data.items()
+    }
+
+
+def train(holdout=0.2, min_samples=50, threshold=None, seed=0, save=True, engine=None, **fit_options):
+    """
+    Train one model per strategy and measure agreement with DeepSeek on a holdout split
+
+    Features use the rule thresholds of engine (default thresholds if None);
+    the models are only used by engines with the same thresholds.
+
+    Returns {strategy: report} where report has 'samples', 'agreement' (all
+    holdout rows), and 'coverage'/'confident_agreement' for holdout rows at
+    or above threshold (default settings.DEEPSEEK_SURROGATE_CONFIDENCE).
+    Strategies with fewer than min_samples rows are reported but not trained.
+    """
+    if threshold is None:
+        threshold = getattr(settings, 'DEEPSEEK_SURROGATE_CONFIDENCE', None) or 0.9
+    rng = np.random.default_rng(seed)
+    fit_options['thresholds'] = thresholds(engine)
+    reports = {}
+    for strategy, (X, labels) in training_data(engine).items():
+        report = {'samples': len(labels), 'trained': False}
+        reports[strategy] = report
+        if len(labels) < min_samples:
+            continue
+
+        order = rng.permutation(len(labels))
+        cut = int(len(labels) * (1 - holdout))
+        train_idx, test_idx = order[:cut], order[cut:]
+        labels = np.array(labels)
+        model = StrategyModel.fit(X[train_idx], labels[train_idx], **fit_options)
+
+        predicted, confidence = model.predict(X[test_idx])
+        correct = np.array(predicted) == labels[test_idx]
+        confident = confidence >= threshold
+        report.update(
+            trained=True,
+            holdout=len(test_idx),
+            agreement=float(correct.mean()) if len(test_idx) else None,
+            threshold=threshold,
+            coverage=float(confident.mean()) if len(test_idx) else None,
+            confident_agreement=float(correct[confident].mean()) if confident.any() else None,
+        )
+
+        if save:
+            # Refit on every row now that the holdout has been scored
+            model = StrategyModel.fit(X, labels, **fit_options)
+            AISurrogate.objects.update_or_create(
+                strategy=strategy,
+                defaults={
+                    'parameters': model.to_dict(),
+                    'samples': len(labels),
+                    'holdout_agreement': report['agreement'],
+                    'confident_agreement': report['confident_agreement'],
+                    'coverage': report['coverage'],
+                    'threshold': threshold,
+                },
+            )
+    reset_surrogate()
+    return reports
+
+
+class Surrogate:
+    """The trained per-strategy models, as loaded from AISurrogate"""
+
+    def __init__(self, models):
+        self.models = models
+
+    @classmethod
+    def load(cls):
+        return cls({
+            row.strategy: StrategyModel.from_dict(row.parameters)
+            for row in AISurrogate.objects.all()
+        })
+
+    def predict(self, match, engine=None):
+        """
+        {strategy: (digit, confidence)} for the strategies with a model trained
+        under engine's rule thresholds (default thresholds if None)
+        """
+        current = thresholds(engine)
+        models = {strategy: model for strategy, model in self.models.items() if model.thresholds == current}
+        if not models:
+            return {}
+        X = features(*[[getattr(match, field)] for field in INPUT_FIELDS], engine=engine)
+        guesses = {}
+        for strategy, model in models.items():
+            digits, confidence = model.predict(X)
+            guesses[strategy] = (digits[0], float(confidence[0]))
+        return guesses
+
+
+def get_surrogate():
+    """
+    Return the process-wide Surrogate, or None when disabled. Reloaded from the
+    database every DEEPSEEK_SURROGATE_RELOAD seconds to pick up retraining.
+    """
+    global _surrogate, _loaded_at
+    if not getattr(settings, 'DEEPSEEK_SURROGATE_CONFIDENCE', None):
+        return None
+    reload_after = getattr(settings, 'DEEPSEEK_SURROGATE_RELOAD', 300)
+    if _surrogate is None or time.monotonic() - _loaded_at > reload_after:
+        with _lock:
+            if _surrogate is None or time.monotonic() - _loaded_at > reload_after:
+                _surrogate = Surrogate.load()
+                _loaded_at = time.monotonic()
+    return _surrogate
+
+
+def reset_surrogate():
+    """Drop the cached models so the next get_surrogate() reloads them"""
+    global _surrogate
+    _surrogate = None
@@ -0,0 +1,588 @@
+import json
+import time
+from datetime import timedelta
+from io import StringIO
+from itertools import product
+from unittest import mock
+import requests
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.db.models import F, FloatField, Q, Value
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from matches.models import Match, Team
+from . import cache, jobs, leases, surrogate
+from .deepseek_client import DeepSeekClient
+from .endpoints import Endpoint, EndpointPool
+from .engine import PredictionEngine
+from .expressions import implied_probability, write_rule_predictions
+from .models import ACCURACY_PRIORITY, APICallLog, APICircuitBreaker, APICounter, APIResponseCache, Prediction, PredictionJob, PredictionLease
+from .resilience import CircuitBreaker, Deadline
+
+STRATEGIES = ('baseline', 'profitable', 'balanced')
+
+
+class RulePredictionExpressionTests(TestCase):
+    """The SQL rule expressions agree with PredictionEngine.calculate_*_prediction"""
+
+    # Probabilities on the grid the thresholds sit on, so |prob_a - prob_b| == 0.15,
+    # prob == 0.45 and equal probabilities all occur
+    PROBABILITIES = (0.0, 0.1, 0.15, 0.2, 0.25, 0.3, 0.35, 0.4, 0.45, 0.5, 0.55, 0.6, 0.7, 0.85)
+    # Zero odds (no implied probability), even money and odds whose implied probability
+    # lands exactly on a value or margin boundary for some probability above
+    ODDS = (0.0, 1.0, 2.0, 2.5, 4.0, 5.0, 10.0)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.team_a = Team.objects.create(name='Home')
+        cls.team_b = Team.objects.create(name='Away')
+        date = timezone.now()
+        Match.objects.bulk_create([
+            Match(
+                team_a=cls.team_a, team_b=cls.team_b, date=date,
+                prob_a=prob_a, prob_b=prob_b, odds_a=odds_a, odds_b=odds_b,
+                draw_prob=max(1 - prob_a - prob_b, 0.0), week_number=1,
+            )
+            for prob_a, prob_b, odds_a, odds_b in product(cls.PROBABILITIES, cls.PROBABILITIES, cls.ODDS, cls.ODDS)
+        ])
+
+    def expected(self, engine, match):
+        return (
+            engine.calculate_baseline_prediction(match),
+            engine.calculate_profitable_prediction(match),
+            engine.calculate_balanced_prediction(match),
+        )
+
+    def assertMatchesEngine(self, engine, computed):
+        """computed maps match pk to the (baseline, profitable, balanced) read from the database"""
+        mismatches = [
+            (match.pk, match.prob_a, match.prob_b, match.odds_a, match.odds_b, computed[match.pk], self.expected(engine, match))
+            for match in Match.objects.all()
+            if computed[match.pk] != self.expected(engine, match)
+        ]
+        self.assertEqual(mismatches, [])
+
+    def test_with_rule_predictions_matches_engine(self):
+        engine = PredictionEngine(use_ai=False)
+        rows = Match.objects.with_rule_predictions(engine).values_list('pk', *STRATEGIES)
+        self.assertMatchesEngine(engine, {pk: tuple(values) for pk, *values in rows})
+
+    def test_custom_thresholds(self):
+        engine = PredictionEngine(
+            use_ai=False, threshold=0.1, value_threshold=0.05, balanced_prob_threshold=0.5, balanced_value_margin=0.1
+        )
+        rows = Match.objects.with_rule_predictions(engine).values_list('pk', *STRATEGIES)
+        self.assertMatchesEngine(engine, {pk: tuple(values) for pk, *values in rows})
+
+    def test_write_rule_predictions_inserts_and_updates(self):
+        engine = PredictionEngine(use_ai=False)
+        matches = list(Match.objects.order_by('pk'))
+        # Half the matches already have a prediction, with wrong rule picks and an AI pick
+        Prediction.objects.bulk_create([
+            Prediction(match=match, baseline='0', profitable='0', balanced='0', ai_balanced='3')
+            for match in matches[::2]
+        ])
+
+        updated, inserted = write_rule_predictions(Match.objects.all(), engine)
+
+        # Only predictions whose picks change are updated
+        changed = [match for match in matches[::2] if self.expected(engine, match) != ('0', '0', '0')]
+        self.assertEqual((updated, inserted), (len(changed), len(matches) - len(matches[::2])))
+        rows = Prediction.objects.values_list('match_id', *STRATEGIES)
+        self.assertMatchesEngine(engine, {match_id: tuple(values) for match_id, *values in rows})
+        self.assertEqual(Prediction.objects.filter(ai_balanced='3').count(), len(matches[::2]))
+
+    def test_write_rule_predictions_bumps_rescores_and_unstamps(self):
+        engine = PredictionEngine(use_ai=False)
+        current = Match.objects.filter(prob_a=0.7, prob_b=0.1, odds_a=2.0, odds_b=5.0).first()
+        edited, unchanged = Match.objects.filter(prob_a=0.85, prob_b=0.0)[:2]
+        Match.objects.filter(pk__in=[current.pk, edited.pk, unchanged.pk]).update(actual_result='3')
+        long_ago = timezone.now() - timedelta(days=7)
+        rows = {}
+        for match, picks, fingerprint in (
+            (current, ('0', '0', '0'), engine.input_fingerprint(current)),
+            (edited, ('0', '0', '0'), 'fingerprint-of-older-inputs'),
+            (unchanged, self.expected(engine, unchanged), engine.input_fingerprint(unchanged)),
+        ):
+            rows[match.pk] = Prediction.objects.create(
+                match=match, input_fingerprint=fingerprint, engine_version=engine.version,
+                **dict(zip(STRATEGIES, picks)),
+            )
+        Prediction.objects.filter(pk__in=[pred.pk for pred in rows.values()]).update(updated_at=long_ago)
+
+        write_rule_predictions(Match.objects.filter(pk__in=rows), engine)
+
+        for match in (current, edited, unchanged):
+            pred = Prediction.objects.select_related('match').get(pk=rows[match.pk].pk)
+            with self.subTest(match=match.pk):
+                self.assertEqual((pred.baseline, pred.profitable, pred.balanced), self.expected(engine, match))
+                self.assertEqual(pred.updated_at == long_ago, match is unchanged)
+                self.assertEqual(pred.engine_version, '' if match is edited else engine.version)
+                if match is not unchanged:
+                    self.assertEqual((pred.prediction_type_used, pred.is_correct), ('balanced', pred.balanced == '3'))
+
+    def test_equal_probabilities_and_boundary_ties(self):
+        engine = PredictionEngine(use_ai=False)
+        cases = {
+            'equal': dict(prob_a=0.4, prob_b=0.4, odds_a=2.5, odds_b=2.5),
+            'baseline tie': dict(prob_a=0.45, prob_b=0.3, odds_a=2.0, odds_b=4.0),
+            'value tie': dict(prob_a=0.6, prob_b=0.2, odds_a=2.0, odds_b=5.0),
+            'balanced margin tie': dict(prob_a=0.55, prob_b=0.2, odds_a=2.0, odds_b=4.0),
+            'zero odds': dict(prob_a=0.6, prob_b=0.3, odds_a=0.0, odds_b=0.0),
+        }
+        for name, values in cases.items():
+            with self.subTest(name):
+                match = Match.objects.filter(**values).first()
+                self.assertIsNotNone(match)
+                computed = Match.objects.filter(pk=match.pk).with_rule_predictions(engine).values_list(*STRATEGIES).get()
+                self.assertEqual(tuple(computed), self.expected(engine, match))
+
+    def test_null_odds_count_as_no_implied_probability(self):
+        # The odds columns are NOT NULL, but the expression treats NULL like zero odds,
+        # the "missing odds" case of Match.implied_prob_a/b
+        implied = Match.objects.annotate(
+            missing=implied_probability(Value(None, output_field=FloatField())),
+            zero=implied_probability(F('odds_a') * 0),
+        ).values_list('missing', 'zero').first()
+        self.assertEqual(implied, (0.0, 0.0))
+
+
+@override_settings(DEEPSEEK_CACHE_ENABLED=False)
+class DeepSeekDeadlineTests(TestCase):
+    """Calls bound to a Deadline fail as DeepSeek being unavailable, not with local errors"""
+
+    def setUp(self):
+        self.api = DeepSeekClient()
+        self.api.endpoints = mock.Mock()
+        self.api.endpoints.ranked.return_value = [Endpoint('primary', 'http://primary')]
+
+    def breaker_failures(self):
+        breaker = APICircuitBreaker.objects.filter(name=self.api.breaker.name).first()
+        return breaker.consecutive_failures if breaker else 0
+
+    def test_deadline_spent_while_rate_limited(self):
+        deadline = Deadline(0.05)
+
+        def slow_acquire(max_wait=None):
+            time.sleep(0.1)
+            return True
+
+        with mock.patch.object(self.api.rate_limiter, 'acquire', side_effect=slow_acquire):
+            response = self.api._make_request("prompt", return_full_response=True, deadline=deadline)
+
+        self.assertFalse(response['success'])
+        self.api.endpoints.post.assert_not_called()
+        self.assertEqual(APICallLog.objects.get().status, APICallLog.STATUS_UNAVAILABLE)
+        self.assertEqual(self.breaker_failures(), 0)
+
+    def test_local_errors_are_not_breaker_failures(self):
+        self.api.endpoints.post.side_effect = TypeError("bad endpoint configuration")
+        with mock.patch.object(self.api.rate_limiter, 'acquire', return_value=True):
+            with self.assertRaises(TypeError):
+                self.api._make_request("prompt")
+        self.assertEqual(self.breaker_failures(), 0)
+
+
+def make_matches(count):
+    team_a = Team.objects.create(name='Home')
+    team_b = Team.objects.create(name='Away')
+    return [
+        Match.objects.create(
+            team_a=team_a, team_b=team_b, date=timezone.now(), prob_a=0.5, prob_b=0.3, draw_prob=0.2,
+            odds_a=2.0, odds_b=3.5, week_number=1,
+        )
+        for _ in range(count)
+    ]
+
+
+class LeaseTests(TestCase):
+    """Single-flight leases: one holder per match, expiry and waiting"""
+
+    def setUp(self):
+        self.match, self.other = make_matches(2)
+
+    def test_contended_acquire(self):
+        self.assertEqual(leases.acquire([self.match, self.other], 'first'), {self.match.pk, self.other.pk})
+        self.assertEqual(leases.acquire([self.match], 'second'), set())
+        leases.release([self.match], 'second')
+        self.assertEqual(PredictionLease.objects.get(match=self.match).owner, 'first')
+
+    def test_expired_lease_is_taken_over(self):
+        leases.acquire([self.match], 'crashed')
+        PredictionLease.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(leases.acquire([self.match], 'second'), {self.match.pk})
+        # The crashed holder releasing late leaves the new lease alone
+        leases.release([self.match], 'crashed')
+        self.assertEqual(PredictionLease.objects.get(match=self.match).owner, 'second')
+
+    def test_single_flight(self):
+        with leases.single_flight([self.match, self.other]) as first:
+            self.assertEqual(first, {self.match.pk, self.other.pk})
+            with leases.single_flight([self.match]) as second:
+                self.assertEqual(second, set())
+                self.assertEqual(leases.wait([self.match], timeout=0.05, poll_interval=0.01), {self.match.pk})
+        self.assertFalse(PredictionLease.objects.exists())
+        self.assertEqual(leases.wait([self.match], timeout=0.05), set())
+
+    def test_wait_ignores_expired_leases(self):
+        leases.acquire([self.match], 'crashed')
+        PredictionLease.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        started = time.monotonic()
+        self.assertEqual(leases.wait([self.match], timeout=5), set())
+        self.assertLess(time.monotonic() - started, 1)
+
+
+@override_settings(PREDICTION_JOB_MAX_ATTEMPTS=2, PREDICTION_JOB_BACKOFF=10, PREDICTION_JOB_TIMEOUT=300)
+class PredictionJobTests(TestCase):
+    """Job queue: one active job per match, compare-and-set claims and retries"""
+
+    def setUp(self):
+        self.match, self.other = make_matches(2)
+
+    def test_one_active_job_per_match(self):
+        self.assertEqual(jobs.enqueue([self.match, self.other]), 2)
+        self.assertEqual(jobs.enqueue([self.match]), 0)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            PredictionJob.objects.create(match=self.match)
+        PredictionJob.objects.filter(match=self.match).update(status=PredictionJob.STATUS_DONE)
+        self.assertEqual(jobs.enqueue([self.match]), 1)
+
+    def test_contended_claim(self):
+        jobs.enqueue([self.match])
+        claimed = jobs.claim('worker-1', limit=5)
+        self.assertEqual([job.match_id for job in claimed], [self.match.pk])
+        self.assertEqual(claimed[0].attempts, 1)
+        self.assertEqual(jobs.claim('worker-2', limit=5), [])
+
+    def test_stuck_job_is_reclaimed(self):
+        jobs.enqueue([self.match])
+        jobs.claim('crashed')
+        PredictionJob.objects.update(claimed_at=timezone.now() - timedelta(seconds=301))
+        reclaimed = jobs.claim('worker-2')
+        self.assertEqual([(job.claimed_by, job.attempts) for job in reclaimed], [('worker-2', 2)])
+
+    def test_failed_attempts_back_off_then_fail(self):
+        no_answer = {'baseline': '3', 'profitable': '1', 'balanced': '3',
+                     'ai_baseline': None, 'ai_profitable': None, 'ai_balanced': None}
+        jobs.enqueue([self.match])
+        with mock.patch.object(PredictionEngine, 'generate_prediction', return_value=no_answer):
+            self.assertFalse(jobs.run_job(jobs.claim('worker')[0]))
+            job = PredictionJob.objects.get()
+            self.assertEqual(job.status, PredictionJob.STATUS_PENDING)
+            self.assertGreater(job.available_at, timezone.now())
+            self.assertEqual(jobs.claim('worker'), [])
+
+            PredictionJob.objects.update(available_at=timezone.now())
+            self.assertFalse(jobs.run_job(jobs.claim('worker')[0]))
+        job = PredictionJob.objects.get()
+        self.assertEqual((job.status, job.attempts), (PredictionJob.STATUS_FAILED, 2))
+        self.assertFalse(PredictionLease.objects.exists())
+
+    def test_job_for_leased_match_is_retried(self):
+        jobs.enqueue([self.match])
+        leases.acquire([self.match], 'web-request')
+        with mock.patch.object(PredictionEngine, 'generate_prediction') as generate:
+            self.assertFalse(jobs.run_job(jobs.claim('worker')[0]))
+        generate.assert_not_called()
+        self.assertEqual(PredictionJob.objects.get().status, PredictionJob.STATUS_PENDING)
+
+    def test_admin_retry_skips_matches_with_active_job(self):
+        failed = [
+            PredictionJob.objects.create(match=self.match, status=PredictionJob.STATUS_FAILED),
+            PredictionJob.objects.create(match=self.other, status=PredictionJob.STATUS_FAILED),
+            PredictionJob.objects.create(match=self.other, status=PredictionJob.STATUS_FAILED),
+        ]
+        active = PredictionJob.objects.create(match=self.match)
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+
+        response = self.client.post(
+            '/admin/predictions/predictionjob/',
+            {'action': 'retry_jobs', '_selected_action': [job.pk for job in failed]},
+        )
+
+        self.assertEqual(response.status_code, 302)
+        # Only the latest failed job of the match without an active job is queued again
+        self.assertEqual(
+            set(PredictionJob.objects.filter(status=PredictionJob.STATUS_PENDING).values_list('pk', flat=True)),
+            {active.pk, failed[2].pk},
+        )
+
+
+@override_settings(DEEPSEEK_BREAKER_FAILURE_THRESHOLD=2, DEEPSEEK_BREAKER_COOLDOWN=60)
+class CircuitBreakerTests(TestCase):
+    """Breaker transitions, including the half-open trial and trials that never report back"""
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(name='test')
+
+    def trip(self):
+        self.breaker.record_failure('down')
+        self.breaker.record_failure('down')
+
+    def cool_down(self):
+        APICircuitBreaker.objects.filter(name='test').update(opened_at=timezone.now() - timedelta(seconds=61))
+
+    def state(self):
+        return APICircuitBreaker.objects.get(name='test').state
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure('down')
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record_failure('down')
+        self.assertEqual(self.state(), APICircuitBreaker.STATE_OPEN)
+        self.assertTrue(self.breaker.is_open())
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_half_open_admits_one_trial(self):
+        self.trip()
+        self.cool_down()
+        self.assertFalse(self.breaker.is_open())
+        self.assertTrue(self.breaker.allow_request())
+        self.assertEqual(self.state(), APICircuitBreaker.STATE_HALF_OPEN)
+        # Everyone else is refused while the trial is in flight
+        self.assertFalse(self.breaker.allow_request())
+        self.assertTrue(self.breaker.is_open())
+
+    def test_trial_outcome(self):
+        self.trip()
+        self.cool_down()
+        self.breaker.allow_request()
+        self.breaker.record_failure('still down')
+        self.assertEqual(self.state(), APICircuitBreaker.STATE_OPEN)
+        self.assertFalse(self.breaker.allow_request())
+
+        self.cool_down()
+        self.breaker.allow_request()
+        self.breaker.record_success()
+        self.assertEqual(self.state(), APICircuitBreaker.STATE_CLOSED)
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_abandoned_trial_is_retried_after_cool_down(self):
+        self.trip()
+        self.cool_down()
+        self.assertTrue(self.breaker.allow_request())
+        # The trial never reports back
+        self.cool_down()
+        self.assertFalse(self.breaker.is_open())
+        self.assertTrue(self.breaker.allow_request())
+        self.assertFalse(self.breaker.allow_request())
+
+
+class RecomputeAccuracyTests(TestCase):
+    """PredictionQuerySet.recompute_accuracy() stores what Prediction.update_accuracy() does"""
+
+    @classmethod
+    def setUpTestData(cls):
+        team_a = Team.objects.create(name='Home')
+        team_b = Team.objects.create(name='Away')
+        # Every mix of missing (NULL or ''), right and wrong picks, so each column of
+        # ACCURACY_PRIORITY is the one scored somewhere, for every kind of result; the
+        # stored accuracy is a placeholder that rows without a result or pick must keep
+        ai_values, rule_values = (None, '', '3'), ('', '3', '0')
+        rows = [
+            (result, ai_picks, rule_picks)
+            for result in (None, '', '3', '1', '0')
+            for ai_picks in product(ai_values, repeat=3)
+            for rule_picks in product(rule_values, repeat=3)
+        ]
+        matches = Match.objects.bulk_create([
+            Match(
+                team_a=team_a, team_b=team_b, date=timezone.now(), prob_a=0.5, prob_b=0.3, draw_prob=0.2,
+                odds_a=2.0, odds_b=3.5, week_number=1, actual_result=result,
+            )
+            for result, _, _ in rows
+        ])
+        Prediction.objects.bulk_create([
+            Prediction(
+                match=match,
+                **dict(zip(ACCURACY_PRIORITY, ai_picks + rule_picks)),
+                is_correct=True,
+                prediction_type_used='placeholder',
+            )
+            for match, (_, ai_picks, rule_picks) in zip(matches, rows)
+        ])
+
+    def results(self):
+        return {
+            pk: (is_correct, used)
+            for pk, is_correct, used in Prediction.objects.values_list('pk', 'is_correct', 'prediction_type_used')
+        }
+
+    def test_matches_update_accuracy(self):
+        Prediction.objects.all().recompute_accuracy()
+        set_based = self.results()
+
+        Prediction.objects.update(is_correct=True, prediction_type_used='placeholder')
+        for pred in Prediction.objects.select_related('match'):
+            pred.update_accuracy()
+        per_row = self.results()
+
+        mismatches = {pk: (per_row[pk], set_based[pk]) for pk in per_row if per_row[pk] != set_based[pk]}
+        self.assertEqual(mismatches, {})
+        used = {used for _, used in per_row.values()}
+        self.assertEqual(used, {*ACCURACY_PRIORITY, 'placeholder'})
+        self.assertEqual({is_correct for is_correct, _ in per_row.values()}, {True, False})
+        # Matches without a result keep whatever was stored
+        self.assertFalse(
+            Prediction.objects.filter(Q(match__actual_result__isnull=True) | Q(match__actual_result=''))
+            .exclude(prediction_type_used='placeholder').exists()
+        )
+
+
+class RefreshPredictionsTests(TestCase):
+    """manage.py refresh_predictions"""
+
+    def test_unstamped_rows_get_current_rule_picks(self):
+        match, = make_matches(1)
+        Match.objects.filter(pk=match.pk).update(actual_result='3')
+        Prediction.objects.filter(match=match).delete()
+        # A legacy row: never fingerprinted, rule picks from older inputs or thresholds
+        pred = Prediction.objects.create(match=match, baseline='0', profitable='0', balanced='0', ai_baseline='1')
+        engine = PredictionEngine(use_ai=False)
+
+        call_command('refresh_predictions', stdout=StringIO())
+
+        pred = Prediction.objects.select_related('match').get(pk=pred.pk)
+        self.assertEqual(
+            (pred.baseline, pred.profitable, pred.balanced),
+            self.expected(engine, pred.match),
+        )
+        self.assertEqual(pred.ai_baseline, '1')
+        self.assertFalse(pred.is_stale(engine))
+        self.assertEqual((pred.prediction_type_used, pred.is_correct), ('ai_baseline', False))
+
+    @staticmethod
+    def expected(engine, match):
+        return tuple(engine.rule_predictions(match)[strategy] for strategy in STRATEGIES)
+
+
+class SurrogateThresholdTests(TestCase):
+    """The surrogate's features and models follow the engine's rule thresholds"""
+
+    def test_features_use_engine_thresholds(self):
+        inputs = ([0.5], [0.38], [0.12], [2.0], [3.0])
+        default = surrogate.features(*inputs)
+        wide = surrogate.features(*inputs, engine=PredictionEngine(use_ai=False, threshold=0.1))
+        # |0.5 - 0.38| is close under the default 0.15 threshold, not under 0.1
+        self.assertEqual((default[0, 8], wide[0, 8]), (1.0, 0.0))
+
+    def test_models_only_serve_matching_thresholds(self):
+        engine = PredictionEngine(use_ai=False, threshold=0.1)
+        X = surrogate.features(*([value] * 4 for value in (0.5, 0.38, 0.12, 2.0, 3.0)), engine=engine)
+        model = surrogate.StrategyModel.fit(
+            X, ['3', '1', '3', '1'], iterations=5, thresholds=surrogate.thresholds(engine)
+        )
+        loaded = surrogate.Surrogate({'baseline': surrogate.StrategyModel.from_dict(model.to_dict())})
+        match, = make_matches(1)
+
+        self.assertEqual(set(loaded.predict(match, engine=engine)), {'baseline'})
+        self.assertEqual(loaded.predict(match, engine=PredictionEngine(use_ai=False)), {})
+
+
+def fake_session(replies):
+    """A session whose post() answers each URL from replies: a JSON body, an HTTP status or an exception"""
+    def post(url, **kwargs):
+        reply = replies[url]
+        if isinstance(reply, Exception):
+            raise reply
+        response = requests.Response()
+        response.url = url
+        if isinstance(reply, int):
+            response.status_code = reply
+        else:
+            response.status_code = 200
+            response._content = json.dumps(reply).encode()
+        return response
+    session = mock.Mock()
+    session.post.side_effect = post
+    return session
+
+
+class EndpointPoolTests(TestCase):
+    """Failover to a second endpoint and model-aware response caching"""
+
+    def pool(self, *endpoints):
+        return EndpointPool(endpoints, hedge_percentile=None, workers=2)
+
+    def test_fast_failure_fails_over(self):
+        for failure in (requests.exceptions.ConnectionError("refused"), 503):
+            with self.subTest(failure=failure):
+                pool = self.pool(Endpoint('primary', 'http://primary'), Endpoint('backup', 'http://backup'))
+                session = fake_session({'http://primary': failure, 'http://backup': {'choices': []}})
+                endpoint, response, hedged = pool.post(session, {}, {}, 5)
+                self.assertEqual((endpoint.name, response.status_code, hedged), ('backup', 200, False))
+                self.assertEqual(pool.failovers, 1)
+
+    def test_no_failover_without_backup_or_for_client_errors(self):
+        single = self.pool(Endpoint('primary', 'http://primary'))
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            single.post(fake_session({'http://primary': requests.exceptions.ConnectionError()}), {}, {}, 5)
+
+        pool = self.pool(Endpoint('primary', 'http://primary'), Endpoint('backup', 'http://backup'))
+        session = fake_session({'http://primary': 400, 'http://backup': {'choices': []}})
+        with self.assertRaises(requests.exceptions.HTTPError):
+            pool.post(session, {}, {}, 5)
+        self.assertEqual(pool.failovers, 0)
+
+    @override_settings(DEEPSEEK_CACHE_ENABLED=True)
+    def test_cache_is_keyed_by_the_answering_model(self):
+        reply = {'choices': [{'message': {'content': '3'}}]}
+        api = DeepSeekClient()
+        api.session = fake_session({'http://local': reply, 'http://remote': reply})
+        with mock.patch.object(api.rate_limiter, 'acquire', return_value=True):
+            api.endpoints = self.pool(Endpoint('local', 'http://local', model='local-model'))
+            self.assertFalse(api._make_request("prompt", return_full_response=True)['cached'])
+            self.assertTrue(api._make_request("prompt", return_full_response=True)['cached'])
+
+            # Another model must not be served the local model's reply
+            api.endpoints = self.pool(Endpoint('remote', 'http://remote'))
+            response = api._make_request("prompt", return_full_response=True)
+        self.assertFalse(response['cached'])
+        self.assertEqual(response['request']['model'], 'deepseek-chat')
+        self.assertEqual(
+            list(APICallLog.objects.order_by('pk').values_list('model', 'status')),
+            [('local-model', APICallLog.STATUS_SUCCESS), ('local-model', APICallLog.STATUS_CACHED),
+             ('deepseek-chat', APICallLog.STATUS_SUCCESS)],
+        )
+
+
+@override_settings(
+    DEEPSEEK_CACHE_MAX_ENTRIES=2, DEEPSEEK_CACHE_EVICT_EVERY=3,
+    DEEPSEEK_CACHE_COUNTER_BATCH=3, DEEPSEEK_CACHE_COUNTER_INTERVAL=3600,
+)
+class ResponseCacheTests(TestCase):
+    """Batched hit/miss counters and periodic eviction"""
+
+    def setUp(self):
+        cache.ResponseCache.flush_counts()
+        APICounter.objects.all().delete()
+        cache._inserts = 0
+        self.cache = cache.ResponseCache()
+
+    def counters(self):
+        return APICounter.get_values(cache.HIT_COUNTER, cache.MISS_COUNTER)
+
+    def test_counts_are_saved_in_batches(self):
+        self.cache.get('missing')
+        self.cache.get('missing')
+        self.assertFalse(APICounter.objects.exists())
+        self.cache.get('missing')
+        self.assertEqual(self.counters(), {cache.HIT_COUNTER: 0, cache.MISS_COUNTER: 3})
+
+        self.cache.set('key', 'model', {'choices': []})
+        self.assertEqual(self.cache.get('key'), {'choices': []})
+        # stats() saves what is still pending first
+        self.assertEqual((self.cache.stats()['hits'], self.cache.stats()['misses']), (1, 3))
+
+    def test_eviction_runs_every_few_inserts(self):
+        entries = []
+        for index in range(5):
+            self.cache.set(f'key-{index}', 'model', {'index': index})
+            entries.append(APIResponseCache.objects.count())
+        # Over the cap of 2 until the third insert evicts, then again until the sixth
+        self.assertEqual(entries, [1, 2, 2, 3, 4])
+        self.assertEqual(
+            set(APIResponseCache.objects.values_list('key', flat=True)), {'key-1', 'key-2', 'key-3', 'key-4'}
+        )
@@ -9,5 +9,6 @@ urlpatterns = [
     path('analysis/<int:match_id>/', views.prediction_detail_with_analysis, name='prediction_analysis'),
     path('batch/', views.batch_predictions, name='batch_predictions'),
     path('accuracy/', views.accuracy_stats, name='accuracy_stats'),
+    path('api/status/', views.api_status, name='api_status'),
 ]
 
@@ -3,14 +3,20 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
 from django.utils import timezone
+from django.conf import settings
 from django.db.models import Q, Count
 from django.db.models.functions import TruncWeek
 from datetime import timedelta, datetime
-from .models import Prediction
+from .models import AI_STRATEGIES, Prediction, APIRateLimit, APICounter, AISurrogate
 from matches.models import Match
 from .engine import PredictionEngine
-from .deepseek_client import DeepSeekClient
+from .deepseek_client import get_connection_stats
+from .cache import ResponseCache
+from .resilience import CircuitBreaker, Deadline
+from .endpoints import get_endpoint_pool
+from . import jobs, leases
 import json
+import time
 
 
 @login_required
@@ -90,75 +96,149 @@ def weekly_predictions(request):
             date__lt=future_end
         ).order_by('date')[:10]  # Limit to 10 matches
     
+    matches = list(matches.select_related('team_a', 'team_b'))
+    
     # Auto-generate predictions for matches without them
     engine_rule = PredictionEngine(use_ai=False)  # Rule-based for baseline
-    engine_ai = PredictionEngine(use_ai=True)  # AI-based for profitable and balanced
+    engine_ai = PredictionEngine(use_ai=True)  # AI-based for profitable and balanced (shared pooled client)
     predictions_list = []
+    # Bound the time spent waiting on AI; matches left over are served rule-based and flagged pending
+    deadline = Deadline(getattr(settings, 'DEEPSEEK_WEEKLY_AI_BUDGET', 10))
     
+    # Existing predictions, and those computed from inputs that have since changed
+    existing = {pred.match_id: pred for pred in Prediction.objects.filter(match__in=matches)}
     for match in matches:
-        pred = Prediction.objects.filter(match=match).first()
-        needs_update = False
-        
-        # If no prediction exists, generate one
-        if not pred:
-            try:
-                # Generate baseline with rule-based
-                baseline_predictions = engine_rule.generate_prediction(match, use_ai=False)
-                
-                # Generate profitable and balanced with AI (with fallback to rule-based)
+        if match.pk in existing:
+            existing[match.pk].match = match
+    stale_ids = {match_id for match_id, pred in existing.items() if pred.is_stale(engine_rule)}
+    
+    if jobs.async_enabled():
+        # Serve what is stored (rule-based where needed) and queue the AI work for the workers
+        predictions_list = _queue_weekly_predictions(matches, existing, stale_ids, engine_rule)
+    else:
+        # Matches that need AI work. Concurrent requests generate each of them once: the lease
+        # holder calls DeepSeek and the other requests pick up its result afterwards
+        needs_ai = [
+            match for match in matches
+            if match.pk not in existing or match.pk in stale_ids
+            or not (existing[match.pk].ai_profitable and existing[match.pk].ai_balanced)
+        ]
+        with leases.single_flight(needs_ai) as leased:
+            contended = {match.pk for match in needs_ai} - leased
+            
+            # Fetch AI predictions for every leased match still missing them in a few packed requests
+            packed_ai = {}
+            pending = [match for match in needs_ai if match.pk in leased]
+            if pending and getattr(settings, 'DEEPSEEK_PACKED_PREDICTIONS', False):
                 try:
-                    ai_predictions = engine_ai.generate_prediction(match, use_ai=True)
-                    # Use AI predictions if available, otherwise use rule-based
-                    profitable = ai_predictions.get('ai_profitable') or ai_predictions.get('profitable') or baseline_predictions.get('profitable')
-                    balanced = ai_predictions.get('ai_balanced') or ai_predictions.get('balanced') or baseline_predictions.get('balanced')
+                    packed_ai, _ = engine_ai.generate_predictions_packed(pending, deadline=deadline)
                 except Exception:
-                    # If AI fails, use rule-based as fallback
-                    profitable = baseline_predictions.get('profitable')
-                    balanced = baseline_predictions.get('balanced')
-                    ai_predictions = {'ai_profitable': None, 'ai_balanced': None}
+                    packed_ai = {}  # Fall back to per-match requests below
+    
+            for match in matches:
+                if match.pk in contended:
+                    continue  # Another request is generating it
+                pred = existing.get(match.pk)
+                needs_update = False
+        
+                # If no prediction exists, or its match inputs changed, generate one
+                if not pred or match.pk in stale_ids:
+                    try:
+                        # Generate baseline with rule-based
+                        baseline_predictions = engine_rule.generate_prediction(match, use_ai=False)
                 
-                pred, created = Prediction.objects.get_or_create(match=match)
-                pred.baseline = baseline_predictions['baseline']
-                pred.profitable = profitable
-                pred.balanced = balanced
+                        # Generate profitable and balanced with AI (with fallback to rule-based)
+                        try:
+                            ai_predictions = packed_ai.get(match.pk) or engine_ai.generate_prediction(match, use_ai=True, deadline=deadline)
+                            # Use AI predictions if available, otherwise use rule-based
+                            profitable = ai_predictions.get('ai_profitable') or ai_predictions.get('profitable') or baseline_predictions.get('profitable')
+                            balanced = ai_predictions.get('ai_balanced') or ai_predictions.get('balanced') or baseline_predictions.get('balanced')
+                        except Exception:
+                            # If AI fails, use rule-based as fallback
+                            profitable = baseline_predictions.get('profitable')
+                            balanced = baseline_predictions.get('balanced')
+                            ai_predictions = {'ai_profitable': None, 'ai_balanced': None}
                 
-                # Save AI predictions if available
-                if ai_predictions.get('ai_profitable'):
-                    pred.ai_profitable = ai_predictions['ai_profitable']
-                if ai_predictions.get('ai_balanced'):
-                    pred.ai_balanced = ai_predictions['ai_balanced']
+                        pred, created = Prediction.objects.get_or_create(match=match)
+                        pred.match = match
+                        pred.baseline = baseline_predictions['baseline']
+                        pred.profitable = profitable
+                        pred.balanced = balanced
                 
-                pred.save()
-            except Exception as e:
-                # Skip if generation fails
-                continue
-        else:
-            # Update profitable and balanced with AI if they don't have AI predictions or are using rule-based
-            if not pred.ai_profitable or not pred.ai_balanced:
-                try:
-                    ai_predictions = engine_ai.generate_prediction(match, use_ai=True)
-                    if ai_predictions.get('ai_profitable'):
-                        pred.profitable = ai_predictions['ai_profitable']
-                        pred.ai_profitable = ai_predictions['ai_profitable']
-                        needs_update = True
-                    if ai_predictions.get('ai_balanced'):
-                        pred.balanced = ai_predictions['ai_balanced']
-                        pred.ai_balanced = ai_predictions['ai_balanced']
-                        needs_update = True
-                    if needs_update:
+                        # Save AI predictions if available
+                        if ai_predictions.get('ai_profitable'):
+                            pred.ai_profitable = ai_predictions['ai_profitable']
+                        if ai_predictions.get('ai_balanced'):
+                            pred.ai_balanced = ai_predictions['ai_balanced']
+                        for strategy, source in (ai_predictions.get('ai_sources') or {}).items():
+                            if strategy in ('profitable', 'balanced'):
+                                pred.ai_sources[strategy] = source
+                
+                        pred.stamp_inputs(
+                            engine_rule, refreshed_ai=[field for field in ('ai_profitable', 'ai_balanced') if ai_predictions.get(field)]
+                        )
                         pred.save()
-                except Exception as e:
-                    # If AI fails, keep existing predictions
-                    pass
+                    except Exception as e:
+                        # Skip if generation fails
+                        continue
+                else:
+                    # Update profitable and balanced with AI if they don't have AI predictions or are using rule-based
+                    if not pred.ai_profitable or not pred.ai_balanced:
+                        try:
+                            ai_predictions = packed_ai.get(match.pk) or engine_ai.generate_prediction(match, use_ai=True, deadline=deadline)
+                            if ai_predictions.get('ai_profitable'):
+                                pred.profitable = ai_predictions['ai_profitable']
+                                pred.ai_profitable = ai_predictions['ai_profitable']
+                                needs_update = True
+                            if ai_predictions.get('ai_balanced'):
+                                pred.balanced = ai_predictions['ai_balanced']
+                                pred.ai_balanced = ai_predictions['ai_balanced']
+                                needs_update = True
+                            for strategy, source in (ai_predictions.get('ai_sources') or {}).items():
+                                if strategy in ('profitable', 'balanced'):
+                                    pred.ai_sources[strategy] = source
+                            if needs_update:
+                                pred.stamp_inputs(engine_rule)
+                                pred.save()
+                        except Exception as e:
+                            # If AI fails, keep existing predictions
+                            pass
         
-        # Add to list if prediction exists
-        if pred:
-            predictions_list.append({
-                'match': match,
-                'baseline': pred.baseline,
-                'profitable': pred.profitable,
-                'balanced': pred.balanced
-            })
+                # Add to list if prediction exists
+                if pred:
+                    predictions_list.append({
+                        'match': match,
+                        'baseline': pred.baseline,
+                        'profitable': pred.profitable,
+                        'balanced': pred.balanced,
+                        'ai_pending': deadline.expired() and not (pred.ai_profitable and pred.ai_balanced),
+                    })
+        
+        # With our own leases released, serve what the other holders stored in the meantime
+        if contended:
+            leases.wait(contended, timeout=min(getattr(settings, 'PREDICTION_LEASE_WAIT', 5), deadline.remaining()))
+            shared = {pred.match_id: pred for pred in Prediction.objects.filter(match_id__in=contended)}
+            rows = {row['match'].pk: row for row in predictions_list}
+            for match in matches:
+                if match.pk not in contended:
+                    continue
+                pred = shared.get(match.pk)
+                if pred:
+                    pred.match = match
+                if pred and not pred.is_stale(engine_rule):
+                    rows[match.pk] = {
+                        'match': match,
+                        'baseline': pred.baseline,
+                        'profitable': pred.profitable,
+                        'balanced': pred.balanced,
+                        'ai_pending': not (pred.ai_profitable and pred.ai_balanced),
+                    }
+                else:
+                    # Still being generated: rule-based picks for now, stored by the lease holder
+                    rule_predictions = engine_rule.rule_predictions(match)
+                    rows[match.pk] = {'match': match, **rule_predictions, 'ai_pending': True}
+            predictions_list = [rows[match.pk] for match in matches if match.pk in rows]
+    ai_pending = sum(1 for p in predictions_list if p['ai_pending'])
     
     # Generate prediction strings
     baseline_string = ''.join([p['baseline'] for p in predictions_list]) if predictions_list else ''
@@ -197,9 +277,35 @@ def weekly_predictions(request):
         'available_weeks': available_weeks,
         'distinct_countries': distinct_countries,
         'distinct_game_titles': distinct_game_titles,
+        'ai_pending': ai_pending,
     }
     
-    return render(request, 'predictions/weekly_predictions.html', context)
+    response = render(request, 'predictions/weekly_predictions.html', context)
+    for name, value in deadline.headers(pending=ai_pending).items():
+        response[name] = value
+    return response
+
+
+def _queue_weekly_predictions(matches, existing, stale_ids, engine):
+    """weekly_predictions rows with PREDICTION_ASYNC_JOBS: rule picks now, AI jobs queued"""
+    rows = []
+    queued = []
+    for match in matches:
+        pred = existing.get(match.pk)
+        if not pred or match.pk in stale_ids:
+            pred, _ = jobs.save_prediction(match, engine.generate_prediction(match, use_ai=False), engine)
+        ai_missing = not (pred.ai_profitable and pred.ai_balanced)
+        if ai_missing:
+            queued.append(match)
+        rows.append({
+            'match': match,
+            'baseline': pred.baseline,
+            'profitable': pred.ai_profitable or pred.profitable,
+            'balanced': pred.ai_balanced or pred.balanced,
+            'ai_pending': ai_missing,
+        })
+    jobs.enqueue(queued, source='weekly')
+    return rows
 
 
 @login_required
@@ -207,46 +313,64 @@ def generate_predictions_view(request, match_id):
     """Generate predictions for a specific match"""
     match = get_object_or_404(Match, pk=match_id)
     use_ai = request.GET.get('use_ai', 'false').lower() == 'true'
-    engine = PredictionEngine(use_ai=use_ai)
-    client = DeepSeekClient() if use_ai else None
+    # With async jobs the AI predictions are queued for the workers instead of awaited here
+    queue_ai = use_ai and jobs.async_enabled()
+    if queue_ai:
+        use_ai = False
+    # Only one request at a time asks DeepSeek about a match; a concurrent one shows that answer
+    with leases.single_flight([match] if use_ai else []) as leased:
+        if use_ai and not leased:
+            pred = _shared_predictions([match]).get(match.pk)
+            created = False
+            if pred:
+                messages.info(request, "Another request was generating these predictions; showing its result.")
+            else:
+                # Not finished in time: write only the rule-based picks so the holder's AI ones survive
+                pred, created = _store_rule_prediction(match, PredictionEngine(use_ai=False))
+                messages.info(request, "Another request is still generating the AI predictions; rule-based picks stored for now.")
+            return render(request, 'predictions/prediction_detail.html', {
+                'match': match,
+                'prediction': pred,
+                'created': created,
+                'api_responses': pred.api_response_data,
+                'title': 'Prediction Generated'
+            })
+        
+        engine = PredictionEngine(use_ai=use_ai)
     
-    predictions = engine.generate_prediction(match, use_ai=use_ai)
+        # Full API responses come from the same calls that produced the AI digits
+        predictions = engine.generate_prediction(match, use_ai=use_ai, include_responses=True)
+        api_responses = predictions['api_responses']
     
-    # Get full API response data if using AI
-    api_responses = {}
-    if use_ai and client:
-        try:
-            api_responses = {
-                'baseline': client.get_full_prediction_response(match, 'baseline'),
-                'profitable': client.get_full_prediction_response(match, 'profitable'),
-                'balanced': client.get_full_prediction_response(match, 'balanced')
-            }
-        except Exception as e:
-            pass  # Continue even if API response fails
-    
-    # Save or update prediction
-    pred, created = Prediction.objects.get_or_create(match=match)
-    pred.baseline = predictions['baseline']
-    pred.profitable = predictions['profitable']
-    pred.balanced = predictions['balanced']
-    
-    if predictions['ai_baseline']:
-        pred.ai_baseline = predictions['ai_baseline']
-    if predictions['ai_profitable']:
-        pred.ai_profitable = predictions['ai_profitable']
-    if predictions['ai_balanced']:
-        pred.ai_balanced = predictions['ai_balanced']
+        # Save or update prediction
+        pred, created = Prediction.objects.get_or_create(match=match)
+        pred.baseline = predictions['baseline']
+        pred.profitable = predictions['profitable']
+        pred.balanced = predictions['balanced']
     
-    if api_responses:
-        pred.api_response_data = api_responses
+        if predictions['ai_baseline']:
+            pred.ai_baseline = predictions['ai_baseline']
+        if predictions['ai_profitable']:
+            pred.ai_profitable = predictions['ai_profitable']
+        if predictions['ai_balanced']:
+            pred.ai_balanced = predictions['ai_balanced']
+        pred.ai_sources.update(predictions['ai_sources'])
     
-    pred.save()
+        if api_responses:
+            pred.api_response_data = api_responses
     
-    # Update accuracy if match has result
-    if match.actual_result:
-        pred.update_accuracy()
+        pred.match = match
+        pred.stamp_inputs(engine, refreshed_ai=[field for field in AI_STRATEGIES if predictions[field]])
+        pred.save()
+    
+        # Update accuracy if match has result
+        if match.actual_result:
+            pred.update_accuracy()
     
     messages.success(request, f"Predictions generated successfully for {match.team_a} vs {match.team_b}")
+    if queue_ai:
+        jobs.enqueue([match], source='generate')
+        messages.info(request, "AI predictions have been queued and will appear once a worker has run them.")
     
     context = {
         'match': match,
@@ -259,6 +383,53 @@ def generate_predictions_view(request, match_id):
     return render(request, 'predictions/prediction_detail.html', context)
 
 
+def _shared_predictions(matches, timeout=None):
+    """
+    Wait (once, for all of them) for the requests holding these matches'
+    leases and return the current AI predictions they stored, keyed by
+    match pk; matches not finished by the deadline are left out
+    """
+    leases.wait(matches, timeout=timeout)
+    by_pk = {match.pk: match for match in matches}
+    engine = PredictionEngine(use_ai=False)
+    shared = {}
+    for pred in Prediction.objects.filter(match_id__in=by_pk):
+        pred.match = by_pk[pred.match_id]
+        if (pred.ai_profitable or pred.ai_balanced) and not pred.is_stale(engine):
+            shared[pred.match_id] = pred
+    return shared
+
+
+def _store_rule_prediction(match, engine):
+    """
+    Store rule-based picks for a match whose lease holder has not finished
+
+    Only the rule and fingerprint columns are written, and a row is only
+    changed while it still holds the fingerprint read here, so AI answers
+    the holder commits meanwhile are never overwritten. Returns
+    (prediction, created).
+    """
+    fields = {
+        **engine.rule_predictions(match),
+        'input_fingerprint': engine.input_fingerprint(match),
+        'engine_version': engine.version,
+    }
+    pred, created = Prediction.objects.get_or_create(match=match, defaults=fields)
+    pred.match = match
+    if created or not pred.is_stale(engine):
+        # Unchanged inputs and version give the rule columns already stored
+        return pred, created
+    # Stale: AI answers computed from the old inputs are dropped, as stamp_inputs() does
+    for field in AI_STRATEGIES:
+        fields[field] = None
+    fields['ai_sources'] = {}
+    Prediction.objects.filter(
+        pk=pred.pk, input_fingerprint=pred.input_fingerprint, engine_version=pred.engine_version
+    ).update(updated_at=timezone.now(), **fields)
+    pred.refresh_from_db()
+    return pred, created
+
+
 @login_required
 def prediction_detail_with_analysis(request, match_id):
     """Display detailed prediction analysis with DeepSeek API response data"""
@@ -274,44 +445,44 @@ def prediction_detail_with_analysis(request, match_id):
     
     # Generate fresh analysis if requested
     if request.GET.get('refresh') == 'true':
-        client = DeepSeekClient()
         engine = PredictionEngine(use_ai=True)
         
-        try:
-            # Get full responses for all prediction types
-            baseline_response = client.get_full_prediction_response(match, 'baseline')
-            profitable_response = client.get_full_prediction_response(match, 'profitable')
-            balanced_response = client.get_full_prediction_response(match, 'balanced')
-            
-            api_responses = {
-                'baseline': baseline_response,
-                'profitable': profitable_response,
-                'balanced': balanced_response
-            }
-            
-            # Store in prediction
-            if not prediction:
-                prediction = Prediction.objects.create(match=match)
+        with leases.single_flight([match]) as leased:
+            if not leased:
+                # Another request is refreshing this match right now: show its answer instead
+                shared = _shared_predictions([match]).get(match.pk)
+                if shared:
+                    prediction, api_responses = shared, shared.api_response_data or {}
+                    messages.info(request, "Another request refreshed these predictions; showing its result.")
+                else:
+                    messages.warning(request, "These predictions are being refreshed by another request; try again shortly.")
+            else:
+                try:
+                    # Generate predictions together with the full responses behind them
+                    predictions = engine.generate_prediction(match, use_ai=True, include_responses=True)
+                    api_responses = predictions['api_responses']
             
-            prediction.api_response_data = api_responses
-            prediction.save()
+                    if not prediction:
+                        prediction = Prediction(match=match)
             
-            # Generate predictions
-            predictions = engine.generate_prediction(match, use_ai=True)
-            prediction.baseline = predictions['baseline']
-            prediction.profitable = predictions['profitable']
-            prediction.balanced = predictions['balanced']
-            if predictions['ai_baseline']:
-                prediction.ai_baseline = predictions['ai_baseline']
-            if predictions['ai_profitable']:
-                prediction.ai_profitable = predictions['ai_profitable']
-            if predictions['ai_balanced']:
-                prediction.ai_balanced = predictions['ai_balanced']
-            prediction.save()
+                    prediction.api_response_data = api_responses
+                    prediction.baseline = predictions['baseline']
+                    prediction.profitable = predictions['profitable']
+                    prediction.balanced = predictions['balanced']
+                    if predictions['ai_baseline']:
+                        prediction.ai_baseline = predictions['ai_baseline']
+                    if predictions['ai_profitable']:
+                        prediction.ai_profitable = predictions['ai_profitable']
+                    if predictions['ai_balanced']:
+                        prediction.ai_balanced = predictions['ai_balanced']
+                    prediction.ai_sources.update(predictions['ai_sources'])
+                    prediction.match = match
+                    prediction.stamp_inputs(engine, refreshed_ai=[field for field in AI_STRATEGIES if predictions[field]])
+                    prediction.save()
             
-            messages.success(request, "Predictions refreshed with detailed analysis!")
-        except Exception as e:
-            messages.error(request, f"Error generating analysis: {str(e)}")
+                    messages.success(request, "Predictions refreshed with detailed analysis!")
+                except Exception as e:
+                    messages.error(request, f"Error generating analysis: {str(e)}")
     
     # Calculate analysis metrics
     if api_responses:
@@ -361,69 +532,93 @@ def batch_predictions(request):
             messages.warning(request, "No matches selected.")
             return redirect('predictions:weekly_predictions')
         
-        matches = Match.objects.filter(pk__in=match_ids)
+        matches = list(Match.objects.filter(pk__in=match_ids).select_related('team_a', 'team_b'))
+        # With async jobs only the rule-based predictions are stored now; the AI ones are queued
+        queue_ai = use_ai and jobs.async_enabled()
+        if queue_ai:
+            use_ai = False
         engine = PredictionEngine(use_ai=use_ai)
-        client = DeepSeekClient() if use_ai else None
         
-        results = {
-            'total': len(matches),
-            'success': 0,
-            'failed': 0,
-            'predictions': []
-        }
+        # Matches another request is already generating with AI are left to it (single flight)
+        with leases.single_flight(matches if use_ai else []) as leased:
+            own = [match for match in matches if not use_ai or match.pk in leased]
+            contended = [match for match in matches if use_ai and match.pk not in leased]
+            
+            # Generate all predictions up front: packed requests, or concurrent per-match calls
+            if use_ai and getattr(settings, 'DEEPSEEK_PACKED_PREDICTIONS', False):
+                started = time.perf_counter()
+                generated, timing = engine.generate_predictions_packed(own, include_responses=True)
+                timing['wall_time'] = round(time.perf_counter() - started, 3)
+            else:
+                generated, timing = engine.generate_predictions_bulk(own, include_responses=True)
         
-        for match in matches:
-            try:
-                # Generate predictions
-                predictions = engine.generate_prediction(match, use_ai=use_ai)
-                
-                # Get full API response if using AI
-                api_responses = {}
-                if use_ai and client:
-                    try:
-                        api_responses = {
-                            'baseline': client.get_full_prediction_response(match, 'baseline'),
-                            'profitable': client.get_full_prediction_response(match, 'profitable'),
-                            'balanced': client.get_full_prediction_response(match, 'balanced')
-                        }
-                    except Exception as e:
-                        pass  # Continue even if API response fails
+            results = {
+                'total': len(matches),
+                'success': 0,
+                'failed': 0,
+                'predictions': [],
+                'timing': timing
+            }
+        
+            for match in own:
+                try:
+                    predictions = generated[match.pk]
+                    api_responses = predictions['api_responses']
                 
-                # Save prediction
-                pred, created = Prediction.objects.get_or_create(match=match)
-                pred.baseline = predictions['baseline']
-                pred.profitable = predictions['profitable']
-                pred.balanced = predictions['balanced']
+                    # Save prediction
+                    pred, created = Prediction.objects.get_or_create(match=match)
+                    pred.baseline = predictions['baseline']
+                    pred.profitable = predictions['profitable']
+                    pred.balanced = predictions['balanced']
                 
-                if predictions['ai_baseline']:
-                    pred.ai_baseline = predictions['ai_baseline']
-                if predictions['ai_profitable']:
-                    pred.ai_profitable = predictions['ai_profitable']
-                if predictions['ai_balanced']:
-                    pred.ai_balanced = predictions['ai_balanced']
+                    if predictions['ai_baseline']:
+                        pred.ai_baseline = predictions['ai_baseline']
+                    if predictions['ai_profitable']:
+                        pred.ai_profitable = predictions['ai_profitable']
+                    if predictions['ai_balanced']:
+                        pred.ai_balanced = predictions['ai_balanced']
+                    pred.ai_sources.update(predictions.get('ai_sources') or {})
                 
-                if api_responses:
-                    pred.api_response_data = api_responses
+                    if api_responses:
+                        pred.api_response_data = api_responses
                 
-                pred.save()
+                    pred.match = match
+                    pred.stamp_inputs(engine, refreshed_ai=[field for field in AI_STRATEGIES if predictions[field]])
+                    pred.save()
                 
-                results['success'] += 1
-                results['predictions'].append({
-                    'match': match,
-                    'prediction': pred,
-                    'created': created
-                })
-            except Exception as e:
-                results['failed'] += 1
-                results['predictions'].append({
-                    'match': match,
-                    'error': str(e)
-                })
+                    results['success'] += 1
+                    results['predictions'].append({
+                        'match': match,
+                        'prediction': pred,
+                        'created': created
+                    })
+                except Exception as e:
+                    results['failed'] += 1
+                    results['predictions'].append({
+                        'match': match,
+                        'error': str(e)
+                    })
+        
+        # With our own leases released, take over what the other requests stored for the rest
+        shared = _shared_predictions(contended) if contended else {}
+        for match in contended:
+            pred, created = shared.get(match.pk), False
+            if not pred:
+                # Not finished in time: write only the rule-based picks so the holder's AI ones survive
+                pred, created = _store_rule_prediction(match, engine)
+            results['success'] += 1
+            results['predictions'].append({'match': match, 'prediction': pred, 'created': created})
+        if contended:
+            order = {match.pk: position for position, match in enumerate(matches)}
+            results['predictions'].sort(key=lambda row: order[row['match'].pk])
         
         messages.success(
             request, 
             f"Batch prediction complete: {results['success']} successful, {results['failed']} failed"
         )
+        if queue_ai:
+            queued = jobs.enqueue(matches, source='batch')
+            messages.info(request, f"Queued AI predictions for {queued} matches; they will appear as workers run them.")
         
         context = {
             'results': results,
@@ -506,3 +701,55 @@ def accuracy_stats(request):
     
     return render(request, 'predictions/accuracy_stats.html', context)
 
+
+
+@login_required
+def api_status(request):
+    """JSON status of the DeepSeek integration: circuit breaker, rate limits, cache, connections, endpoints and job queue"""
+    breaker = CircuitBreaker()
+    rate_limits = [
+        {
+            'name': bucket.name,
+            'tokens': round(bucket.tokens, 2),
+            'updated_at': bucket.updated_at.isoformat(),
+        }
+        for bucket in APIRateLimit.objects.all()
+    ]
+    
+    return JsonResponse({
+        'circuit_breaker': breaker.status(),
+        'rate_limits': {
+            'process_per_second': getattr(settings, 'DEEPSEEK_PROCESS_RATE_LIMIT', None),
+            'database_per_second': getattr(settings, 'DEEPSEEK_DATABASE_RATE_LIMIT', None),
+            'buckets': rate_limits,
+        },
+        'cache': ResponseCache().stats(),
+        'connections': get_connection_stats(),
+        'endpoints': get_endpoint_pool().status(),
+        'skipped': APICounter.get_values('ai_skipped_calls', 'ai_skipped_strategies'),
+        'surrogate': _surrogate_status(),
+        'jobs': jobs.queue_stats(),
+    })
+
+
+def _surrogate_status():
+    """Holdout agreement of each trained surrogate plus live shadow-check agreement"""
+    counters = APICounter.get_values('surrogate_answers', 'surrogate_shadow_checks', 'surrogate_shadow_agreements')
+    checks = counters['surrogate_shadow_checks']
+    return {
+        'confidence_threshold': getattr(settings, 'DEEPSEEK_SURROGATE_CONFIDENCE', None),
+        'answers': counters['surrogate_answers'],
+        'shadow_checks': checks,
+        'shadow_agreement': round(counters['surrogate_shadow_agreements'] / checks, 4) if checks else None,
+        'models': [
+            {
+                'strategy': model.strategy,
+                'samples': model.samples,
+                'holdout_agreement': model.holdout_agreement,
+                'confident_agreement': model.confident_agreement,
+                'coverage': model.coverage,
+                'trained_at': model.trained_at.isoformat(),
+            }
+            for model in AISurrogate.objects.all()
+        ],
+    }